@@ -0,0 +1,121 @@
+# flake8: noqa: E402
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+parent_dir = os.path.join(os.path.dirname(__file__), "..")
+sys.path.append(parent_dir)
+
+from detection import detections
+from detection.annotate import Annotator
+from detection.dwell import DwellEngine
+from detection.pipeline import FramePacket
+from detection.synthetic import NAMES
+
+
+def parse_arguments():
+    """
+    Parse the command line arguments of the annotation benchmark.
+
+    Returns:
+        argparse.Namespace: The parsed command line arguments.
+    """
+
+    parser = argparse.ArgumentParser(description="Annotation microbenchmark")
+    parser.add_argument(
+        "-b", "--boxes", nargs="+", default=[0, 10, 100], type=int, help="Box counts"
+    )
+    parser.add_argument(
+        "-f", "--frames", default=300, type=int, help="Frames per measurement"
+    )
+    parser.add_argument("-cw", "--camera_width", default=1280, type=int)
+    parser.add_argument("-ch", "--camera_height", default=720, type=int)
+    return parser.parse_args()
+
+
+def random_detections(rng, n, W, H):
+    """
+    Creates n random detections inside the frame, half of them persons.
+
+    Args:
+        rng (numpy.random.Generator): The random generator.
+        n (int): The number of detections.
+        W (int): The width of the frame.
+        H (int): The height of the frame.
+
+    Returns:
+        numpy.ndarray: The detections.
+    """
+
+    xy = rng.integers(0, [W - 100, H - 200], size=(n, 2))
+    wh = rng.integers([20, 40], [100, 200], size=(n, 2))
+    return detections.from_array(
+        np.hstack([xy, xy + wh]),
+        np.arange(1, n + 1),
+        rng.integers(0, len(NAMES), size=n) * (np.arange(n) % 2),
+        np.full(n, 0.9),
+    )
+
+
+def measure(n, frames, W, H, render, alert):
+    """
+    Measures the mean annotation time per frame.
+
+    Args:
+        n (int): The number of boxes per frame.
+        frames (int): The number of frames to annotate.
+        W (int): The width of the frame.
+        H (int): The height of the frame.
+        render (bool): Whether the annotator draws.
+        alert (bool): Whether the alert overlay is blended.
+
+    Returns:
+        float: The mean milliseconds per frame.
+    """
+
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 255, size=(H, W, 3), dtype=np.uint8)
+    overlay = rng.integers(0, 255, size=(H, W, 3), dtype=np.uint8)
+    det = random_detections(rng, n, W, H)
+    dwell = DwellEngine(0 if alert else 10**9, cooldown=10**9)
+    annotate = Annotator(
+        NAMES, overlay, 0.8, dwell, lambda frame, ids, index, boxes: None, render=render
+    )
+
+    elapsed = 0.0
+    for i in range(frames):
+        packet = FramePacket(i, frame.copy(), time.perf_counter())
+        packet.detections = det
+        start = time.perf_counter()
+        annotate(packet)
+        elapsed += time.perf_counter() - start
+    return elapsed / frames * 1000
+
+
+def main(args):
+    """
+    Prints the annotation cost per frame for each box count.
+
+    Args:
+        args (argparse.Namespace): The command line arguments.
+
+    Returns:
+        None
+    """
+
+    W, H = args.camera_width, args.camera_height
+    print(f"{'boxes':>6} {'render':>10} {'render+alert':>13} {'no-render':>10}")
+    for n in args.boxes:
+        render = measure(n, args.frames, W, H, render=True, alert=False)
+        alert = measure(n, args.frames, W, H, render=True, alert=True)
+        no_render = measure(n, args.frames, W, H, render=False, alert=False)
+        print(f"{n:>6} {render:>8.3f}ms {alert:>11.3f}ms {no_render:>8.3f}ms")
+
+
+if __name__ == "__main__":
+
+    args = parse_arguments()
+    main(args)
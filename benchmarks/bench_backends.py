@@ -0,0 +1,219 @@
+# flake8: noqa: E402
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+parent_dir = os.path.join(os.path.dirname(__file__), "..")
+sys.path.append(parent_dir)
+
+from detection import detections
+from detection.backend import BACKENDS, load_model
+
+
+def parse_arguments():
+    """
+    Parse the command line arguments of the backend benchmark.
+
+    Returns:
+        argparse.Namespace: The parsed command line arguments.
+    """
+
+    now = datetime.now().strftime("%Y%m%d_%Hh%Mm%Ss")
+    parser = argparse.ArgumentParser(
+        description="FPS and accuracy drift of the inference backends on one clip"
+    )
+    parser.add_argument(
+        "-v", "--video", default="./videos/test.mp4", type=str, help="Video file path"
+    )
+    parser.add_argument(
+        "-w",
+        "--weights",
+        default="./weights/yolov8s.pt",
+        type=str,
+        help="File path of object detection model",
+    )
+    parser.add_argument(
+        "-b",
+        "--backends",
+        nargs="+",
+        default=["torch", "onnx", "onnx_int8"],
+        choices=BACKENDS,
+        help="Backends to compare; the first one is the reference",
+    )
+    parser.add_argument(
+        "-f", "--frames", default=300, type=int, help="Frames read from the video"
+    )
+    parser.add_argument(
+        "--imgsz", default=640, type=int, help="Input size of the model"
+    )
+    parser.add_argument(
+        "--intra_threads",
+        default=0,
+        type=int,
+        help="ONNX Runtime threads inside an operator (0: default)",
+    )
+    parser.add_argument(
+        "--inter_threads",
+        default=0,
+        type=int,
+        help="ONNX Runtime operators run in parallel (0: sequential)",
+    )
+    parser.add_argument(
+        "--track",
+        action="store_true",
+        help="Run model.track() instead of model.predict() to check the trackers",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=f"./outputs/{now}_bench_backends.json",
+        type=str,
+        help="JSON file of the results",
+    )
+    return parser.parse_args()
+
+
+def run(args, backend):
+    """
+    Runs a backend over the first frames of the video.
+
+    Args:
+        args (argparse.Namespace): The command line arguments.
+        backend (str): The backend to run.
+
+    Returns:
+        tuple: The timing results and the boxes of every frame
+            (x1, y1, x2, y2, conf, cls).
+    """
+
+    model = load_model(
+        args.weights,
+        backend,
+        args.imgsz,
+        warmup=3,
+        intra_threads=args.intra_threads,
+        inter_threads=args.inter_threads,
+    )
+    cap = cv2.VideoCapture(args.video)
+    boxes, latencies, ids = [], [], set()
+    while len(latencies) < args.frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        start = time.perf_counter()
+        if args.track:
+            result = model.track(frame, persist=True, verbose=False)[0]
+        else:
+            result = model.predict(frame, verbose=False)[0]
+        latencies.append(time.perf_counter() - start)
+
+        data = result.boxes.data.cpu().numpy()
+        if result.boxes.id is not None:
+            ids.update(result.boxes.id.cpu().numpy().astype(int).tolist())
+        # trackの結果はidの列を含む
+        boxes.append(data[:, [0, 1, 2, 3, -2, -1]])
+    cap.release()
+
+    ms = np.asarray(latencies) * 1000
+    results = {
+        "frames": len(latencies),
+        "fps": round(1000 / float(ms.mean()), 2) if len(ms) else 0.0,
+        "p50_ms": round(float(np.percentile(ms, 50)), 2) if len(ms) else 0.0,
+        "p99_ms": round(float(np.percentile(ms, 99)), 2) if len(ms) else 0.0,
+    }
+    if args.track:
+        results["tracks"] = len(ids)
+    return results, boxes
+
+
+def drift(reference, boxes, thr=0.5):
+    """
+    Compares the boxes of a backend with the boxes of the reference backend.
+
+    Boxes of the same class are matched greedily by IoU.
+
+    Args:
+        reference (list[numpy.ndarray]): The reference boxes of every frame.
+        boxes (list[numpy.ndarray]): The boxes of every frame.
+        thr (float): The IoU over which two boxes match.
+
+    Returns:
+        dict: The precision and recall against the reference, and the mean IoU
+            and confidence difference of the matched boxes.
+    """
+
+    matched, n_ref, n_box, ious, confs = 0, 0, 0, [], []
+    for ref, box in zip(reference, boxes):
+        n_ref += len(ref)
+        n_box += len(box)
+        pairs = detections.match(ref[:, :4], ref[:, 5], box[:, :4], box[:, 5], thr)
+        for i, j, iou in pairs:
+            matched += 1
+            ious.append(iou)
+            confs.append(abs(ref[i, 4] - box[j, 4]))
+
+    return {
+        "precision": round(matched / n_box, 4) if n_box else 1.0,
+        "recall": round(matched / n_ref, 4) if n_ref else 1.0,
+        "mean_iou": round(float(np.mean(ious)), 4) if ious else 0.0,
+        "conf_diff": round(float(np.mean(confs)), 4) if confs else 0.0,
+    }
+
+
+def main(args):
+    """
+    Runs the benchmark, prints the results and saves them as JSON.
+
+    Args:
+        args (argparse.Namespace): The command line arguments.
+
+    Returns:
+        None
+    """
+
+    backends, reference = {}, None
+    for backend in args.backends:
+        results, boxes = run(args, backend)
+        if reference is None:
+            reference = boxes
+        results.update(drift(reference, boxes))
+        backends[backend] = results
+
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": vars(args),
+        "reference": args.backends[0],
+        "backends": backends,
+    }
+
+    print(
+        f"{'backend':>10} {'fps':>7} {'p50':>9} {'p99':>9} "
+        f"{'precision':>9} {'recall':>7} {'iou':>6} {'conf':>6}"
+    )
+    for name, r in backends.items():
+        print(
+            f"{name:>10} {r['fps']:>7.2f} {r['p50_ms']:>7.2f}ms {r['p99_ms']:>7.2f}ms "
+            f"{r['precision']:>9.3f} {r['recall']:>7.3f} {r['mean_iou']:>6.3f} "
+            f"{r['conf_diff']:>6.3f}"
+        )
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"saved: {args.output}")
+
+
+if __name__ == "__main__":
+
+    args = parse_arguments()
+    main(args)
@@ -0,0 +1,214 @@
+# flake8: noqa: E402
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+parent_dir = os.path.join(os.path.dirname(__file__), "..")
+sys.path.append(parent_dir)
+
+from detection.annotate import Annotator
+from detection.dwell import DwellEngine
+from detection.pipeline import Pipeline
+from detection.recorder import SegmentRecorder
+from detection.stages import CaptureSource, TrackStage, VideoSink
+from detection.synthetic import SyntheticDetector, generate_video
+
+
+def parse_arguments():
+    """
+    Parse the command line arguments of the pipeline benchmark.
+
+    Returns:
+        argparse.Namespace: The parsed command line arguments.
+    """
+
+    now = datetime.now().strftime("%Y%m%d_%Hh%Mm%Ss")
+    parser = argparse.ArgumentParser(
+        description="Benchmark of the detection loop with a synthetic detector"
+    )
+    parser.add_argument(
+        "-v",
+        "--video",
+        default="",
+        type=str,
+        help="Recorded video to replay (a synthetic video is generated if empty)",
+    )
+    parser.add_argument(
+        "-f", "--frames", default=600, type=int, help="Frames of the synthetic video"
+    )
+    parser.add_argument("-cw", "--camera_width", default=1280, type=int)
+    parser.add_argument("-ch", "--camera_height", default=720, type=int)
+    parser.add_argument(
+        "-b", "--boxes", default=10, type=int, help="Boxes emitted per frame"
+    )
+    parser.add_argument(
+        "-l",
+        "--latency",
+        default=0.0,
+        type=float,
+        help="Simulated inference latency (ms)",
+    )
+    parser.add_argument(
+        "-t", "--thr", default=100, type=int, help="Person dwell threshold (frames)"
+    )
+    parser.add_argument(
+        "-q", "--queue_size", default=4, type=int, help="Capacity of the stage queues"
+    )
+    parser.add_argument(
+        "--no_render", action="store_true", help="Skip drawing and the output video"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=f"./outputs/{now}_bench_pipeline.json",
+        type=str,
+        help="JSON file of the results",
+    )
+    return parser.parse_args()
+
+
+def percentiles(samples):
+    """
+    Summarizes latency samples.
+
+    Args:
+        samples (list[float]): The latencies in seconds.
+
+    Returns:
+        dict: The p50, p90, p99 and max latency in milliseconds.
+    """
+
+    if not samples:
+        return {"p50": 0.0, "p90": 0.0, "p99": 0.0, "max": 0.0}
+    ms = np.asarray(samples) * 1000
+    p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+    return {
+        "p50": round(float(p50), 3),
+        "p90": round(float(p90), 3),
+        "p99": round(float(p99), 3),
+        "max": round(float(ms.max()), 3),
+    }
+
+
+def run(args, video_path, workdir):
+    """
+    Replays a video through capture → track → dwell → annotate → write.
+
+    Args:
+        args (argparse.Namespace): The command line arguments.
+        video_path (str): The video to replay.
+        workdir (str): The directory of the output video.
+
+    Returns:
+        dict: The benchmark results.
+    """
+
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    W = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    H = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    video = None
+    if not args.no_render:
+        video = SegmentRecorder(f"{workdir}/output.mp4", fps, (W, H))
+
+    detector = SyntheticDetector(args.boxes, args.latency / 1000, (W, H))
+    overlay = np.full((H, W, 3), (0, 0, 255), dtype=np.uint8)
+    alerts = []
+    annotate = Annotator(
+        detector.names,
+        overlay,
+        0.8,
+        DwellEngine(args.thr),
+        lambda frame, ids, index, boxes: alerts.append(ids),
+        render=not args.no_render,
+    )
+
+    pipeline = Pipeline(maxsize=args.queue_size, report_interval=0, record=True)
+    pipeline.add_source("capture", CaptureSource(cap))
+    pipeline.add_stage("track", TrackStage(detector))
+    pipeline.add_stage("annotate", annotate)
+    sink = VideoSink(video, pipeline.stop_event, headless=True)
+
+    start = time.perf_counter()
+    pipeline.run("sink", sink)
+    elapsed = time.perf_counter() - start
+    cap.release()
+    if video is not None:
+        video.release()
+
+    frames = pipeline.sink_stats.frames
+    return {
+        "frames": frames,
+        "elapsed": round(elapsed, 3),
+        "fps": round(frames / elapsed, 2) if elapsed else 0.0,
+        "stages": {
+            stats.name: percentiles(stats.samples) for stats in pipeline.stats()
+        },
+        "end_to_end": percentiles(pipeline.end_to_end),
+        "alerts": len(alerts),
+    }
+
+
+def main(args):
+    """
+    Runs the benchmark, prints the results and saves them as JSON.
+
+    Args:
+        args (argparse.Namespace): The command line arguments.
+
+    Returns:
+        None
+    """
+
+    with tempfile.TemporaryDirectory() as workdir:
+        video_path = args.video
+        if not video_path:
+            video_path = generate_video(
+                f"{workdir}/input.mp4",
+                args.frames,
+                args.camera_width,
+                args.camera_height,
+            )
+        results = run(args, video_path, workdir)
+
+    # Linuxのru_maxrssはKB単位
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "config": vars(args),
+        "peak_rss_mb": round(peak_rss, 1),
+        **results,
+    }
+
+    print(f"frames: {report['frames']}, {report['fps']} fps")
+    print(f"{'stage':>10} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}")
+    for name, p in {**report["stages"], "end_to_end": report["end_to_end"]}.items():
+        print(
+            f"{name:>10} {p['p50']:>7.2f}ms {p['p90']:>7.2f}ms "
+            f"{p['p99']:>7.2f}ms {p['max']:>7.2f}ms"
+        )
+    print(f"peak RSS: {report['peak_rss_mb']} MB")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"saved: {args.output}")
+
+
+if __name__ == "__main__":
+
+    args = parse_arguments()
+    main(args)
@@ -0,0 +1,250 @@
+# flake8: noqa: E402
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+from ultralytics import YOLO
+
+parent_dir = os.path.join(os.path.dirname(__file__), "..")
+sys.path.append(parent_dir)
+
+from detection import detections
+from detection.dwell import parse_zone
+from detection.tiling import TiledDetector, plan_tiles, zone_regions
+
+
+def parse_arguments():
+    """
+    Parse the command line arguments of the tiling benchmark.
+
+    Returns:
+        argparse.Namespace: The parsed command line arguments.
+    """
+
+    now = datetime.now().strftime("%Y%m%d_%Hh%Mm%Ss")
+    parser = argparse.ArgumentParser(
+        description="Person recall and cost of tiled inference against full-frame upscaling"
+    )
+    parser.add_argument(
+        "-v", "--video", default="./videos/test.mp4", type=str, help="Video file path"
+    )
+    parser.add_argument(
+        "-w",
+        "--weights",
+        default="./weights/yolov8s.pt",
+        type=str,
+        help="File path of object detection model",
+    )
+    parser.add_argument(
+        "-f", "--frames", default=100, type=int, help="Frames read from the video"
+    )
+    parser.add_argument(
+        "-z",
+        "--zone",
+        action="append",
+        default=[],
+        type=str,
+        help='Polygon zone "x1,y1 x2,y2 x3,y3 ..." (repeatable, whole frame if empty)',
+    )
+    parser.add_argument(
+        "--imgsz", default=640, type=int, help="Input size of the full frame and tiles"
+    )
+    parser.add_argument(
+        "--upscale",
+        nargs="+",
+        default=[960, 1280],
+        type=int,
+        help="Input sizes of the upscaled full frame",
+    )
+    parser.add_argument(
+        "--tile_size", default=640, type=int, help="Side of a tile in frame pixels"
+    )
+    parser.add_argument(
+        "--tile_overlap", default=0.2, type=float, help="Overlap of the tiles"
+    )
+    parser.add_argument(
+        "--reference_imgsz",
+        default=1920,
+        type=int,
+        help="Input size of the full frame taken as the reference",
+    )
+    parser.add_argument(
+        "--small", default=64, type=int, help="Height in pixels under which a person is small"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=f"./outputs/{now}_bench_tiling.json",
+        type=str,
+        help="JSON file of the results",
+    )
+    return parser.parse_args()
+
+
+def persons(boxes, regions, names):
+    """
+    Keeps the persons whose feet are inside one of the regions.
+
+    Args:
+        boxes (numpy.ndarray): The boxes (x1, y1, x2, y2, conf, cls).
+        regions (numpy.ndarray): The regions as xyxy.
+        names (dict): The class names of the model.
+
+    Returns:
+        numpy.ndarray: The boxes of the persons.
+    """
+
+    boxes = boxes[[names[int(c)] == "person" for c in boxes[:, 5]]]
+    fx = (boxes[:, 0] + boxes[:, 2]) / 2
+    fy = boxes[:, 3]
+    inside = (
+        (fx[:, None] >= regions[None, :, 0])
+        & (fx[:, None] < regions[None, :, 2])
+        & (fy[:, None] >= regions[None, :, 1])
+        & (fy[:, None] <= regions[None, :, 3])
+    ).any(axis=1)
+    return boxes[inside]
+
+
+def run(detect, frames):
+    """
+    Times a detection function over the frames.
+
+    Args:
+        detect (callable): Returns the boxes (x1, y1, x2, y2, conf, cls) of a frame.
+        frames (list[numpy.ndarray]): The frames.
+
+    Returns:
+        tuple: The latencies in seconds and the boxes of every frame.
+    """
+
+    detect(frames[0])
+    latencies, boxes = [], []
+    for frame in frames:
+        start = time.perf_counter()
+        boxes.append(detect(frame))
+        latencies.append(time.perf_counter() - start)
+    return latencies, boxes
+
+
+def score(reference, boxes, small):
+    """
+    Compares the persons of a configuration with the reference persons.
+
+    Args:
+        reference (list[numpy.ndarray]): The reference persons of every frame.
+        boxes (list[numpy.ndarray]): The persons of every frame.
+        small (int): The height in pixels under which a person is small.
+
+    Returns:
+        dict: The persons per frame, and the recall of all and of the small
+            reference persons, and the precision.
+    """
+
+    matched = matched_small = n_ref = n_small = n_box = 0
+    for ref, box in zip(reference, boxes):
+        pairs = detections.match(ref[:, :4], ref[:, 5], box[:, :4], box[:, 5])
+        is_small = ref[:, 3] - ref[:, 1] < small
+        n_ref += len(ref)
+        n_small += int(is_small.sum())
+        n_box += len(box)
+        matched += len(pairs)
+        matched_small += sum(bool(is_small[i]) for i, _, _ in pairs)
+    return {
+        "persons_per_frame": round(n_box / max(len(boxes), 1), 2),
+        "recall": round(matched / n_ref, 4) if n_ref else 1.0,
+        "recall_small": round(matched_small / n_small, 4) if n_small else 1.0,
+        "precision": round(matched / n_box, 4) if n_box else 1.0,
+    }
+
+
+def main(args):
+    """
+    Runs the benchmark, prints the results and saves them as JSON.
+
+    Args:
+        args (argparse.Namespace): The command line arguments.
+
+    Returns:
+        None
+    """
+
+    cap = cv2.VideoCapture(args.video)
+    frames = []
+    while len(frames) < args.frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    H, W = frames[0].shape[:2]
+
+    model = YOLO(args.weights)
+    regions = zone_regions([parse_zone(zone) for zone in args.zone], (W, H))
+    tiles = plan_tiles(regions, args.tile_size, args.tile_overlap)
+    tiled = TiledDetector(model, tiles, args.imgsz)
+
+    def full_frame(imgsz):
+        def detect(frame):
+            result = model.predict(frame, imgsz=imgsz, verbose=False)[0]
+            return result.boxes.data.cpu().numpy()
+
+        return detect
+
+    configs = {f"full_{args.imgsz}": full_frame(args.imgsz)}
+    for imgsz in args.upscale:
+        configs[f"full_{imgsz}"] = full_frame(imgsz)
+    configs[f"tiles_{len(tiles)}x{args.imgsz}"] = tiled.detect
+
+    _, reference = run(full_frame(args.reference_imgsz), frames)
+    reference = [persons(boxes, regions, model.names) for boxes in reference]
+    results = {}
+    for name, detect in configs.items():
+        latencies, boxes = run(detect, frames)
+        ms = np.asarray(latencies) * 1000
+        boxes = [persons(b, regions, model.names) for b in boxes]
+        results[name] = {
+            "fps": round(1000 / float(ms.mean()), 2),
+            "p50_ms": round(float(np.percentile(ms, 50)), 2),
+            **score(reference, boxes, args.small),
+        }
+
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": vars(args),
+        "frame_size": [W, H],
+        "tiles": tiles.tolist(),
+        "reference": f"full_{args.reference_imgsz}",
+        "results": results,
+    }
+
+    print(
+        f"{'config':>16} {'fps':>7} {'p50':>9} {'persons':>8} "
+        f"{'recall':>7} {'small':>7} {'precision':>9}"
+    )
+    for name, r in results.items():
+        print(
+            f"{name:>16} {r['fps']:>7.2f} {r['p50_ms']:>7.2f}ms "
+            f"{r['persons_per_frame']:>8.2f} {r['recall']:>7.3f} "
+            f"{r['recall_small']:>7.3f} {r['precision']:>9.3f}"
+        )
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"saved: {args.output}")
+
+
+if __name__ == "__main__":
+
+    args = parse_arguments()
+    main(args)
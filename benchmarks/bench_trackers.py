@@ -0,0 +1,197 @@
+# flake8: noqa: E402
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+parent_dir = os.path.join(os.path.dirname(__file__), "..")
+sys.path.append(parent_dir)
+
+from detection.tracking import IoUTracker, load_tracker
+
+
+def parse_arguments():
+    """
+    Parse the command line arguments of the tracker benchmark.
+
+    Returns:
+        argparse.Namespace: The parsed command line arguments.
+    """
+
+    now = datetime.now().strftime("%Y%m%d_%Hh%Mm%Ss")
+    parser = argparse.ArgumentParser(
+        description="Per-frame cost of the trackers with synthetic moving objects"
+    )
+    parser.add_argument(
+        "-t",
+        "--trackers",
+        nargs="+",
+        default=["iou.yaml", "bytetrack.yaml", "botsort.yaml"],
+        help="Tracker configs to compare",
+    )
+    parser.add_argument(
+        "--tracks",
+        nargs="+",
+        default=[10, 50, 200],
+        type=int,
+        help="Numbers of objects in the scene",
+    )
+    parser.add_argument(
+        "-f", "--frames", default=300, type=int, help="Frames per run"
+    )
+    parser.add_argument(
+        "--miss", default=0.1, type=float, help="Probability that a detection is missed"
+    )
+    parser.add_argument("--width", default=1280, type=int, help="Frame width")
+    parser.add_argument("--height", default=720, type=int, help="Frame height")
+    parser.add_argument("--seed", default=0, type=int, help="Random seed")
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=f"./outputs/{now}_bench_trackers.json",
+        type=str,
+        help="JSON file of the results",
+    )
+    return parser.parse_args()
+
+
+def scene(n, frames, width, height, miss, rng):
+    """
+    Generates the detections of objects moving at constant velocity.
+
+    Args:
+        n (int): The number of objects.
+        frames (int): The number of frames.
+        width (int): The frame width.
+        height (int): The frame height.
+        miss (float): The probability that a detection is missed.
+        rng (numpy.random.Generator): The random generator.
+
+    Yields:
+        tuple: The detections (x1, y1, x2, y2, conf, cls), shape (N, 6), and the
+            object of every detection, shape (N,).
+    """
+
+    size = rng.uniform(20, 120, (n, 1)) * [0.5, 1.0]
+    pos = rng.uniform([0, 0], [width, height], (n, 2))
+    vel = rng.normal(0, 3, (n, 2))
+    for _ in range(frames):
+        pos += vel
+        # 画面端で跳ね返る
+        out = (pos < 0) | (pos > [width, height])
+        vel[out] *= -1
+        pos = np.clip(pos, 0, [width, height])
+        seen = np.flatnonzero(rng.random(n) >= miss)
+        center = pos[seen] + rng.normal(0, 1.5, (len(seen), 2))
+        half = size[seen] / 2
+        boxes = np.concatenate(
+            [
+                center - half,
+                center + half,
+                rng.uniform(0.3, 0.95, (len(seen), 1)),
+                np.zeros((len(seen), 1)),
+            ],
+            axis=1,
+        ).astype(np.float32)
+        yield boxes, seen
+
+
+def run(args, config, n):
+    """
+    Runs a tracker over a synthetic scene.
+
+    Args:
+        args (argparse.Namespace): The command line arguments.
+        config (str): The tracker config.
+        n (int): The number of objects.
+
+    Returns:
+        dict: The per-frame latency, the reported tracks and the ID switches.
+    """
+
+    rng = np.random.default_rng(args.seed)
+    tracker = load_tracker(config, 30)
+    if isinstance(tracker, IoUTracker):
+        # 物体数がスロット数を超えないようにする
+        tracker.max_tracks = max(tracker.max_tracks, 2 * n)
+        tracker.reset()
+    # BoT-SORTのカメラ動き補正に使う静止画
+    frame = rng.integers(0, 255, (args.height, args.width, 3), dtype=np.uint8)
+
+    latencies, reported, switches = [], 0, 0
+    last_id = np.full(n, -1)
+    for boxes, objects in scene(
+        n, args.frames, args.width, args.height, args.miss, rng
+    ):
+        start = time.perf_counter()
+        tracks = tracker.update(boxes, frame)
+        latencies.append(time.perf_counter() - start)
+
+        reported += len(tracks)
+        obj = objects[tracks[:, -1].astype(int)]
+        ids = tracks[:, 4].astype(int)
+        # 同じ物体のIDが変わった回数
+        switches += int(((last_id[obj] >= 0) & (last_id[obj] != ids)).sum())
+        last_id[obj] = ids
+
+    ms = np.asarray(latencies) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "tracks_per_frame": round(reported / len(latencies), 1),
+        "id_switches": switches,
+    }
+
+
+def main(args):
+    """
+    Runs the benchmark, prints the results and saves them as JSON.
+
+    Args:
+        args (argparse.Namespace): The command line arguments.
+
+    Returns:
+        None
+    """
+
+    results = {
+        config: {str(n): run(args, config, n) for n in args.tracks}
+        for config in args.trackers
+    }
+
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": vars(args),
+        "results": results,
+    }
+
+    print(
+        f"{'tracker':>16} {'objects':>7} {'p50':>9} {'p99':>9} "
+        f"{'tracks':>7} {'switches':>8}"
+    )
+    for config, runs in results.items():
+        for n, r in runs.items():
+            print(
+                f"{config:>16} {n:>7} {r['p50_ms']:>7.3f}ms {r['p99_ms']:>7.3f}ms "
+                f"{r['tracks_per_frame']:>7.1f} {r['id_switches']:>8}"
+            )
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"saved: {args.output}")
+
+
+if __name__ == "__main__":
+
+    args = parse_arguments()
+    main(args)
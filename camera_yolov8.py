@@ -1,9 +1,13 @@
 import argparse
 import os
+import time
 from datetime import datetime
 
 import cv2
-from ultralytics import YOLO
+
+from detection.backend import BACKENDS, load_model
+from detection.capture import LatestFrameReader
+from detection.pipeline import LatencyMeter
 
 
 def print_arguments(func):
@@ -44,6 +48,34 @@ def parse_arguments():
         type=str,
         help="File path of object detection model",
     )
+    parser.add_argument(
+        "--backend",
+        default="torch",
+        choices=BACKENDS,
+        type=str,
+        help="Inference backend; exported models are cached, onnx_int8 needs calibration",
+    )
+    parser.add_argument(
+        "--imgsz", default=640, type=int, help="Input size of the model"
+    )
+    parser.add_argument(
+        "--intra_threads",
+        default=0,
+        type=int,
+        help="ONNX Runtime threads inside an operator (0: default)",
+    )
+    parser.add_argument(
+        "--inter_threads",
+        default=0,
+        type=int,
+        help="ONNX Runtime operators run in parallel (0: sequential)",
+    )
+    parser.add_argument(
+        "--warmup",
+        default=3,
+        type=int,
+        help="Warm-up inferences before the camera opens",
+    )
     parser.add_argument(
         "-t", "--thr", default=100, type=int, help="Person continuous threshold"
     )
@@ -75,6 +107,16 @@ def main(args):
     # 出力先がなければ作成
     os.makedirs(output_dir, exist_ok=True)
 
+    # カメラを開く前にモデルを準備（変換済みモデルのキャッシュとウォームアップ）
+    model = load_model(
+        args.weights,
+        args.backend,
+        args.imgsz,
+        args.warmup,
+        intra_threads=args.intra_threads,
+        inter_threads=args.inter_threads,
+    )
+
     # カメラの読み込み
     cap = cv2.VideoCapture(0)
     # camera_width*camera_height にリサイズ
@@ -91,7 +133,6 @@ def main(args):
 
     codec = cv2.VideoWriter_fourcc("m", "p", "4", "v")
     video = cv2.VideoWriter(output_file_path, codec, CLIP_FPS, (W, H))
-    model = YOLO(args.weights)
 
     danger_file_path = "./images/danger.png"
     overlay_image = cv2.imread(danger_file_path, cv2.COLOR_BGR2RGB)
@@ -103,20 +144,27 @@ def main(args):
     # 閾値（人検知の連続フレーム数がこの値を超えたら警告）
     person_thr = args.thr
 
+    # 読み込みスレッドが最新フレームだけを保持
+    reader = LatestFrameReader(cap)
+    reader.start()
+    latency = LatencyMeter("capture-to-decision")
+
     print("start detection")
 
     # キーが押されるまで
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
+    while True:
+        packet = reader()
+        if packet is None:
             break
+        frame = packet.frame
         # YOLOv8でトラッキング
-        results = model.track(frame, persist=True)
+        results = model.track(frame, persist=True, verbose=False)
         result = results[0]
 
         # 推論結果からbboxの座標取得
         boxes = result.boxes.xyxy.cpu().numpy().astype(int)
-        try:
+        # 物体がないフレームはIDがNone（通常のケースとして何も描かない）
+        if result.boxes.id is not None:
             # 推論結果からbboxのクラスID取得
             ids = result.boxes.id.cpu().numpy().astype(int)
             # 推論結果からbboxのクラス名取得
@@ -157,24 +205,24 @@ def main(args):
                         color=BLUE,
                         thickness=SMALL,
                     )
-        except Exception as e:
-            print(e)
-            print("There are no objects")
-            continue
-        finally:
-            if is_person:
-                counter += 1
-                is_person = False
-            else:
-                counter = 0
-
-            cv2.imshow("frame", frame)
-            video.write(frame)
-            key = cv2.waitKey(1)
-            if key != -1:
-                print("STOP PLAY!!!")
-                break
+        if is_person:
+            counter += 1
+            is_person = False
+        else:
+            counter = 0
+        latency.add(time.perf_counter() - packet.captured_at)
+
+        cv2.imshow("frame", frame)
+        video.write(frame)
+        key = cv2.waitKey(1)
+        if key != -1:
+            print("STOP PLAY!!!")
+            break
 
+    reader.stop()
+    reader.join(1)
+    print(reader.summary())
+    print(latency.summary())
     release(video, cap)
 
 
@@ -0,0 +1,258 @@
+import logging
+import queue
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# ワーカーの終了を伝える番兵
+STOP = object()
+
+
+class AlertJob:
+    """
+    An alert waiting to be sent by the dispatcher.
+
+    Attributes:
+        alert_name (str): The name of the alert, used in the logs.
+        snapshot (concurrent.futures.Future): Resolves to the snapshot file names by variant.
+        status (str): The status of the alert (CAMERA or MP4).
+        clip_file (str or None): The file name of the event clip registered with the picture.
+        enqueued_at (float): The `time.perf_counter()` value when the alert was queued.
+        picture_id (int): The ID of the picture once it has been registered.
+    """
+
+    __slots__ = (
+        "alert_name",
+        "snapshot",
+        "status",
+        "clip_file",
+        "enqueued_at",
+        "picture_id",
+    )
+
+    def __init__(self, alert_name, snapshot, status, clip_file=None):
+        self.alert_name = alert_name
+        self.snapshot = snapshot
+        self.status = status
+        self.clip_file = clip_file
+        self.enqueued_at = time.perf_counter()
+        self.picture_id = None
+
+
+class AlertDispatcher(threading.Thread):
+    """
+    A background worker that posts the alert snapshots to the FastAPI server.
+
+    The detection loop only calls `submit()`, which never blocks: when the queue is
+    full the alert is dropped and counted. The worker keeps one keep-alive HTTP session
+    and retries each request a bounded number of times with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        url,
+        nginx,
+        alert_log,
+        maxsize=32,
+        retries=3,
+        backoff=0.5,
+        timeout=10,
+    ):
+        super().__init__(name="alert", daemon=True)
+        self.url = url
+        self.nginx = nginx
+        self.alert_log = alert_log
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.stop_event = threading.Event()
+
+        # 同じ接続を使い回す
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # メトリクス
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.histogram = None
+
+    def submit(self, alert_name, snapshot, status, clip_file=None):
+        """
+        Queues an alert without waiting for the network.
+
+        Args:
+            alert_name (str): The name of the alert, used in the logs.
+            snapshot (concurrent.futures.Future): Resolves to the snapshot file names by variant.
+            status (str): The status of the alert.
+            clip_file (str or None): The file name of the event clip, written separately.
+
+        Returns:
+            bool: True if the alert was queued, False if it was dropped.
+        """
+
+        try:
+            self.queue.put_nowait(AlertJob(alert_name, snapshot, status, clip_file))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            logging.warning(f"Alert queue is full, dropped {alert_name}")
+            return False
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            if job is STOP:
+                break
+            try:
+                self.dispatch(job)
+                self.sent += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Failed to send alert {job.alert_name}: {e}")
+                logging.error(f"Failed to send alert {job.alert_name}: {e}")
+            latency = time.perf_counter() - job.enqueued_at
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            if self.histogram is not None:
+                self.histogram.observe(latency)
+
+    def dispatch(self, job):
+        """
+        Waits for the snapshots, then registers the picture with its variants and the alert.
+
+        Args:
+            job (AlertJob): The alert to send.
+
+        Returns:
+            None
+
+        Raises:
+            Exception: If a request still fails after all retries.
+        """
+
+        # スナップショットの書き出し完了を待つ
+        files = job.snapshot.result()
+        alert_image_path = f"{self.nginx}/{files['picture']}"
+
+        # picture post
+        payload = {variant: f"{self.nginx}/{file}" for variant, file in files.items()}
+        if job.clip_file is not None:
+            payload["clip"] = f"{self.nginx}/{job.clip_file}"
+        res = self._post("/picture", payload)
+        job.picture_id = res["picture_id"]
+        logging.info(f"Alert image link: {alert_image_path}")
+
+        # alert post
+        res = self._post("/alert", {"picture_id": job.picture_id, "status": job.status})
+        with open(self.alert_log, "a") as f:
+            f.write(f"{res['picture']}\n")
+
+    def _post(self, path, payload):
+        for attempt in range(self.retries + 1):
+            try:
+                res = self.session.post(
+                    f"{self.url}{path}", json=payload, timeout=self.timeout
+                )
+                res.raise_for_status()
+                print("POST request send successfully.")
+                return res.json()
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                wait = self.backoff * 2**attempt
+                logging.warning(
+                    f"Failed to send POST {path} request ({e}), retry in {wait:.1f}s"
+                )
+                # 終了要求中は待たずに再送する
+                self.stop_event.wait(wait)
+
+    def close(self, timeout=30):
+        """
+        Sends the queued alerts and stops the worker.
+
+        Args:
+            timeout (float): The seconds to wait for the queued alerts.
+
+        Returns:
+            None
+        """
+
+        self.stop_event.set()
+        self.queue.put(STOP)
+        self.join(timeout)
+        if self.is_alive():
+            logging.warning(f"Alert dispatcher still has {self.queue.qsize()} alerts")
+        self.session.close()
+
+    def register(self, metrics, labels=None):
+        """
+        Exposes the dispatch latency, the alert counters and the queue depth as metrics.
+
+        Args:
+            metrics (MetricsRegistry): The registry of the metrics endpoint.
+            labels (dict or None): The labels of the dispatcher.
+
+        Returns:
+            None
+        """
+
+        labels = labels or {}
+        self.histogram = metrics.histogram(
+            "detection_alert_dispatch_seconds",
+            "Time from queuing an alert to its last POST",
+            labels,
+        )
+        for result in ("sent", "failed", "dropped"):
+            metrics.counter(
+                "detection_alerts_total",
+                "Alerts by result",
+                lambda result=result: getattr(self, result),
+                {**labels, "result": result},
+            )
+        metrics.gauge(
+            "detection_alert_queue_depth",
+            "Alerts waiting to be sent",
+            self.queue.qsize,
+            labels,
+        )
+
+    def metrics(self):
+        """
+        Returns the current dispatcher metrics.
+
+        Returns:
+            dict: Queue depth, sent, failed and dropped alerts, and mean/max latency in seconds.
+        """
+
+        done = self.sent + self.failed
+        return {
+            "queue_depth": self.queue.qsize(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "latency_mean": self.latency_total / done if done else 0.0,
+            "latency_max": self.latency_max,
+        }
+
+    def summary(self):
+        """
+        Formats the dispatcher metrics.
+
+        Returns:
+            str: A line with the dispatcher metrics.
+        """
+
+        m = self.metrics()
+        return (
+            f"alert: {m['sent']} sent, {m['failed']} failed, {m['dropped']} dropped, "
+            f"queue {m['queue_depth']}, latency mean {m['latency_mean']:.2f}s "
+            f"max {m['latency_max']:.2f}s"
+        )
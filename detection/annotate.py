@@ -0,0 +1,166 @@
+import logging
+import time
+
+import cv2
+import numpy as np
+
+from detection.pipeline import LatencyMeter
+
+# 定数
+PERSON = "person"
+BLUE = (255, 0, 0)
+GREEN = (0, 255, 0)
+RED = (0, 0, 255)
+YELLOW = (0, 255, 255)
+SMALL = 1
+MEDIUM = 2
+LARGE = 4
+
+# xyxy → 矩形の4頂点 (x1,y1) (x2,y1) (x2,y2) (x1,y2)
+CORNERS = np.array([[0, 1], [2, 1], [2, 3], [0, 3]])
+
+
+class Annotator:
+    """
+    Draws the tracked objects of one stream and raises the dwell alerts.
+
+    The dwell of each person is tracked per tracker ID by a DwellEngine. The alert
+    overlay is shown while any person is over the threshold, and an alert is sent
+    whenever a track reaches it again after its cooldown.
+    All boxes are drawn with a single `cv2.polylines` call, the class names and
+    person flags are looked up once per class, and the alert overlay is blended
+    at most once per frame, in place into the frame buffer.
+
+    Attributes:
+        names (dict): The class names of the model indexed by class ID.
+        labels (list[str]): The class names as a table indexed by class ID.
+        overlay (numpy.ndarray): The alert image resized to the frame size.
+        alpha (float): The weight of the frame when the overlay is blended.
+        dwell (DwellEngine): The per-track dwell engine.
+        on_alert (callable): Called with a copy of the annotated frame, the alerting tracker IDs,
+            the frame number and the boxes of the alerting persons.
+        render (bool): False to skip drawing; an alert frame is still drawn for its snapshot.
+        latency (LatencyMeter): The latency from the capture of a frame to its dwell decision.
+        camera (str or None): The camera name of the log records, the stream index when None.
+    """
+
+    def __init__(
+        self, names, overlay, alpha, dwell, on_alert, render=True, camera=None
+    ):
+        self.names = names
+        self.overlay = overlay
+        self.alpha = alpha
+        self.dwell = dwell
+        self.on_alert = on_alert
+        self.render = render
+        self.latency = LatencyMeter("capture-to-decision")
+        self.camera = camera
+
+        # クラスIDごとの人フラグと表示名
+        self.person_mask = np.array(
+            [names[i] == PERSON for i in range(max(names) + 1)], dtype=bool
+        )
+        self.labels = [str(names[i]) for i in range(max(names) + 1)]
+
+    def __call__(self, packet):
+        """
+        Draws the tracked objects, updates the dwell of each person and issues the alerts.
+
+        Args:
+            packet (FramePacket): The tracked frame.
+
+        Returns:
+            FramePacket: The packet with the annotated frame.
+        """
+
+        det = packet.detections
+        persons = self.person_mask[det["cls"]]
+        dwell, is_over, is_alert = self.dwell.update(
+            packet.index, det["xyxy"][persons], det["id"][persons]
+        )
+        self.latency.add(time.perf_counter() - packet.captured_at)
+        if len(dwell):
+            # 毎フレームの記録は--log_sampleの割合だけ書き出される（空フレームは記録しない）
+            logging.info(
+                f"{len(dwell)} persons, dwell {int(dwell.max())}",
+                extra={
+                    "camera": self.camera or str(packet.stream),
+                    "frame": packet.index,
+                    "sample": True,
+                },
+            )
+
+        if self.render or is_alert.any():
+            counts = np.zeros(len(det), dtype=np.int64)
+            counts[persons] = dwell
+            self.draw(packet.frame, det, persons, counts, is_over.any())
+
+        if is_alert.any():
+            alert_ids = det["id"][persons][is_alert]
+            alert_boxes = det["xyxy"][persons][is_alert]
+            self.on_alert(
+                packet.frame.copy(), alert_ids.tolist(), packet.index, alert_boxes
+            )
+        return packet
+
+    def draw(self, frame, det, persons, counts, is_alert):
+        """
+        Draws the zones, boxes and labels, and blends the alert overlay in place.
+
+        Args:
+            frame (numpy.ndarray): The BGR frame drawn on in place.
+            det (numpy.ndarray): The detections of the frame.
+            persons (numpy.ndarray): The person flag of each detection.
+            counts (numpy.ndarray): The dwell of each detection (0 for non-persons).
+            is_alert (bool): Whether to blend the alert overlay.
+
+        Returns:
+            None
+        """
+
+        if self.dwell.zones:
+            cv2.polylines(frame, self.dwell.zones, True, color=YELLOW, thickness=SMALL)
+
+        if len(det):
+            xyxy = det["xyxy"]
+            cv2.polylines(
+                frame, list(xyxy[:, CORNERS]), True, color=GREEN, thickness=MEDIUM
+            )
+            for (x1, y1), id, cls, person, count in zip(
+                xyxy[:, :2].tolist(),
+                det["id"].tolist(),
+                det["cls"].tolist(),
+                persons,
+                counts.tolist(),
+            ):
+                if person:
+                    cv2.putText(
+                        frame,
+                        f"#{id} {PERSON} ({count})",
+                        (x1, y1 - 5),
+                        cv2.FONT_HERSHEY_SIMPLEX,
+                        fontScale=MEDIUM,
+                        color=RED,
+                        thickness=LARGE,
+                    )
+                else:
+                    cv2.putText(
+                        frame,
+                        f"#{id} {self.labels[cls]}",
+                        (x1, y1 - 5),
+                        cv2.FONT_HERSHEY_SIMPLEX,
+                        fontScale=SMALL,
+                        color=BLUE,
+                        thickness=SMALL,
+                    )
+
+        if is_alert:
+            # Alert! フレームごとに1回だけ、フレームバッファへ直接合成
+            cv2.addWeighted(
+                src1=frame,
+                alpha=self.alpha,
+                src2=self.overlay,
+                beta=0.3,
+                gamma=0,
+                dst=frame,
+            )
@@ -0,0 +1,381 @@
+import argparse
+import logging
+import os
+import shutil
+import time
+
+import cv2
+import numpy as np
+from ultralytics import YOLO
+from ultralytics.utils.downloads import attempt_download_asset
+
+from detection.cache import sha256_file
+
+# 変換済みモデルの保存先
+EXPORT_DIR = "./weights/exported"
+# 選択できる推論バックエンド
+BACKENDS = ["torch", "onnx", "openvino", "onnx_int8"]
+# ONNX Runtimeで推論するバックエンド
+ONNX_BACKENDS = ["onnx", "onnx_int8"]
+# 形式ごとの保存名の末尾（ultralyticsはこの末尾で形式を判定する）
+EXPORT_SUFFIX = {
+    "onnx": ".onnx",
+    "openvino": "_openvino_model",
+}
+
+
+def resolve_weights(weights):
+    """
+    Finds the weights file, downloading an official model name like `YOLO()` does.
+
+    Args:
+        weights (str): The path of the weights, or the name of an official model
+            such as "yolov8s.pt".
+
+    Returns:
+        str: The path of the local weights file.
+
+    Raises:
+        FileNotFoundError: If the weights are neither a file nor downloadable.
+    """
+
+    if os.path.exists(weights):
+        return weights
+    try:
+        path = str(attempt_download_asset(weights))
+    except Exception as e:
+        raise FileNotFoundError(f"Failed to download the weights {weights}: {e}") from e
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Weights {weights} not found")
+    return path
+
+
+def export_cached(weights, format, imgsz=640, cache_dir=EXPORT_DIR):
+    """
+    Exports the weights to a CPU-optimized format once and reuses the artifact.
+
+    The artifact is keyed by the SHA-256 of the weights and the image size, so
+    new weights or another size are exported again.
+
+    Args:
+        weights (str): The path of the YOLOv8 weights (.pt).
+        format (str): The export format, "onnx" or "openvino".
+        imgsz (int): The input size of the exported model.
+        cache_dir (str): The directory of the exported models.
+
+    Returns:
+        tuple: The path of the exported model and True if it was exported now.
+
+    Raises:
+        FileNotFoundError: If the weights are neither a file nor downloadable.
+    """
+
+    # 公式モデル名はハッシュを取る前にダウンロードする
+    weights = resolve_weights(weights)
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    digest = sha256_file(weights)[:16]
+    path = f"{cache_dir}/{stem}_{digest}_{imgsz}{EXPORT_SUFFIX[format]}"
+    if os.path.exists(path):
+        return path, False
+
+    os.makedirs(cache_dir, exist_ok=True)
+    exported = YOLO(weights).export(format=format, imgsz=imgsz)
+    # 書き込み途中のモデルを読まないよう、完成後に移動
+    tmp_path = f"{cache_dir}/.{os.path.basename(path)}.tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    shutil.move(str(exported), tmp_path)
+    os.replace(tmp_path, path)
+    return path, True
+
+
+def quantized_path(onnx_path):
+    """
+    Names the INT8 model quantized from an ONNX model.
+
+    Args:
+        onnx_path (str): The path of the FP32 ONNX model.
+
+    Returns:
+        str: The path of the INT8 model.
+    """
+
+    return f"{os.path.splitext(onnx_path)[0]}_int8.onnx"
+
+
+def model_path(weights, backend="torch", imgsz=640, cache_dir=EXPORT_DIR):
+    """
+    Resolves the model file of a backend, exporting the weights when needed.
+
+    Args:
+        weights (str): The path of the YOLOv8 weights (.pt).
+        backend (str): One of BACKENDS.
+        imgsz (int): The input size of the model.
+        cache_dir (str): The directory of the exported models.
+
+    Returns:
+        tuple: The path of the model and True if it was exported now.
+
+    Raises:
+        FileNotFoundError: If the weights cannot be found or downloaded, or the INT8
+            model was not calibrated yet.
+    """
+
+    if backend == "torch":
+        return weights, False
+    if backend == "onnx_int8":
+        onnx_path, _ = export_cached(weights, "onnx", imgsz, cache_dir)
+        path = quantized_path(onnx_path)
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"{path} not found: run `python3 -m detection.backend -w {weights} "
+                f"--imgsz {imgsz} -s <video>` to calibrate it"
+            )
+        return path, False
+    return export_cached(weights, backend, imgsz, cache_dir)
+
+
+def letterbox(frame, imgsz=640):
+    """
+    Converts a frame into the input tensor of an exported model, like Ultralytics does.
+
+    Args:
+        frame (numpy.ndarray): The BGR frame.
+        imgsz (int): The input size of the model.
+
+    Returns:
+        numpy.ndarray: The RGB input in [0, 1], shape (1, 3, imgsz, imgsz).
+    """
+
+    h, w = frame.shape[:2]
+    r = min(imgsz / h, imgsz / w)
+    nh, nw = round(h * r), round(w * r)
+    top, left = (imgsz - nh) // 2, (imgsz - nw) // 2
+    image = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    image[top : top + nh, left : left + nw] = cv2.resize(
+        frame, (nw, nh), interpolation=cv2.INTER_LINEAR
+    )
+    blob = image[:, :, ::-1].transpose(2, 0, 1)[None]
+    return np.ascontiguousarray(blob, dtype=np.float32) / 255
+
+
+def sample_frames(source, samples=100):
+    """
+    Reads frames evenly spread over a video.
+
+    Args:
+        source (str): The path of the video.
+        samples (int): The number of frames.
+
+    Yields:
+        numpy.ndarray: The BGR frames.
+    """
+
+    cap = cv2.VideoCapture(source)
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    try:
+        for index in np.linspace(0, max(frames - 1, 0), samples).astype(int):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(index))
+            ret, frame = cap.read()
+            if ret:
+                yield frame
+    finally:
+        cap.release()
+
+
+def calibrate(weights, source, imgsz=640, samples=100, cache_dir=EXPORT_DIR):
+    """
+    Quantizes the ONNX model to INT8 with activations calibrated on sample frames.
+
+    Args:
+        weights (str): The path of the YOLOv8 weights (.pt).
+        source (str): The video the calibration frames are read from.
+        imgsz (int): The input size of the model.
+        samples (int): The number of calibration frames.
+        cache_dir (str): The directory of the exported models.
+
+    Returns:
+        str: The path of the INT8 model.
+    """
+
+    import onnx
+    from onnxruntime.quantization import (
+        CalibrationDataReader,
+        QuantFormat,
+        QuantType,
+        quantize_static,
+    )
+
+    onnx_path, _ = export_cached(weights, "onnx", imgsz, cache_dir)
+    fp32 = onnx.load(onnx_path)
+    input_name = fp32.graph.input[0].name
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self.frames = sample_frames(source, samples)
+
+        def get_next(self):
+            frame = next(self.frames, None)
+            return None if frame is None else {input_name: letterbox(frame, imgsz)}
+
+    path = quantized_path(onnx_path)
+    tmp_path = f"{cache_dir}/.{os.path.basename(path)}.tmp"
+    quantize_static(
+        onnx_path,
+        tmp_path,
+        FrameReader(),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+    # クラス名などUltralyticsのメタデータを引き継ぐ
+    int8 = onnx.load(tmp_path)
+    del int8.metadata_props[:]
+    int8.metadata_props.extend(fp32.metadata_props)
+    onnx.save(int8, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def configure_onnx_runtime(model, path, intra_threads=0, inter_threads=0):
+    """
+    Replaces the ONNX Runtime session of a loaded model with one using the given threads.
+
+    The session lives in the AutoBackend of the predictor, so `track()` and its
+    trackers keep working unchanged.
+
+    Args:
+        model (ultralytics.YOLO): The model, after its first inference.
+        path (str): The path of the ONNX model.
+        intra_threads (int): The threads inside an operator (0: ONNX Runtime default).
+        inter_threads (int): The operators run in parallel (0: sequential execution).
+
+    Returns:
+        None
+    """
+
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if intra_threads > 0:
+        options.intra_op_num_threads = intra_threads
+    if inter_threads > 0:
+        options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+        options.inter_op_num_threads = inter_threads
+    model.predictor.model.session = ort.InferenceSession(
+        path, options, providers=["CPUExecutionProvider"]
+    )
+
+
+def warm_up(model, imgsz=640, n=3):
+    """
+    Runs inferences on a blank image so the first frames are not slow.
+
+    Args:
+        model (ultralytics.YOLO): The model.
+        imgsz (int): The input size of the model.
+        n (int): The number of warm-up inferences.
+
+    Returns:
+        list[float]: The seconds of each inference.
+    """
+
+    image = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    times = []
+    for _ in range(n):
+        start = time.perf_counter()
+        model.predict(image, imgsz=imgsz, verbose=False)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def load_model(
+    weights,
+    backend="torch",
+    imgsz=640,
+    warmup=3,
+    cache_dir=EXPORT_DIR,
+    intra_threads=0,
+    inter_threads=0,
+):
+    """
+    Loads the detector, exporting it to the backend format when needed, and warms it up.
+
+    The startup is logged as cold when the model had to be exported and warm
+    when a cached artifact was loaded.
+
+    Args:
+        weights (str): The path of the YOLOv8 weights (.pt).
+        backend (str): One of BACKENDS.
+        imgsz (int): The input size of the model.
+        warmup (int): The number of warm-up inferences.
+        cache_dir (str): The directory of the exported models.
+        intra_threads (int): The ONNX Runtime threads inside an operator (0: default).
+        inter_threads (int): The ONNX Runtime operators run in parallel (0: sequential).
+
+    Returns:
+        ultralytics.YOLO: The model, ready for `track()`.
+    """
+
+    start = time.perf_counter()
+    path, exported = model_path(weights, backend, imgsz, cache_dir)
+    model = YOLO(path, task="detect")
+    # 変換済みモデルは入力サイズが固定
+    model.overrides["imgsz"] = imgsz
+    if backend in ONNX_BACKENDS and (intra_threads or inter_threads):
+        # 初回の推論でpredictorを作ってからセッションを差し替える
+        warm_up(model, imgsz, 1)
+        configure_onnx_runtime(model, path, intra_threads, inter_threads)
+    loaded = time.perf_counter() - start
+
+    times = warm_up(model, imgsz, warmup)
+    total = time.perf_counter() - start
+    if backend == "torch":
+        startup = "eager"
+    else:
+        startup = "cold start, exported" if exported else "warm start, cached"
+    message = (
+        f"{backend} model {path} ready in {total:.2f}s ({startup}): "
+        f"load {loaded:.2f}s"
+    )
+    if times:
+        message += (
+            f", first inference {times[0] * 1000:.0f}ms, "
+            f"last {times[-1] * 1000:.0f}ms"
+        )
+    print(message)
+    logging.info(message)
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Calibrate and quantize the ONNX model to INT8"
+    )
+    parser.add_argument(
+        "-w",
+        "--weights",
+        default="./weights/yolov8s.pt",
+        type=str,
+        help="File path of object detection model",
+    )
+    parser.add_argument(
+        "-s", "--source", required=True, type=str, help="Video of calibration frames"
+    )
+    parser.add_argument(
+        "--imgsz", default=640, type=int, help="Input size of the model"
+    )
+    parser.add_argument(
+        "--samples", default=100, type=int, help="Number of calibration frames"
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    path = calibrate(args.weights, args.source, args.imgsz, args.samples)
+    print(f"saved: {path} ({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
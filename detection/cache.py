@@ -0,0 +1,352 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+
+from detection.detlog import DetectionLogReader, DetectionLogWriter
+
+# ハッシュ計算時の読み込み単位
+HASH_BLOCK = 1 << 20
+
+
+def sha256_file(path):
+    """
+    Computes the SHA-256 of a file without loading it at once.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        str: The hex digest.
+    """
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(HASH_BLOCK):
+            h.update(block)
+    return h.hexdigest()
+
+
+def tracker_config(tracker):
+    """
+    Reads the tracker config, resolving the names of the configs shipped with this package or ultralytics.
+
+    Args:
+        tracker (str): The path or name of the tracker YAML.
+
+    Returns:
+        str: The contents of the config, or its name when it cannot be found.
+    """
+
+    if not os.path.exists(tracker):
+        try:
+            from detection.tracking import tracker_path
+
+            tracker = tracker_path(tracker)
+        except Exception:
+            return tracker
+    with open(tracker) as f:
+        return f.read()
+
+
+class DetectionCache:
+    """
+    A content-addressed cache of the per-frame tracks of whole video files.
+
+    An entry is keyed on the SHA-256 of the video, of the weights and of the
+    tracker config, and holds a detection log of every frame. Entries are only
+    committed after a complete pass. The least recently used entries are
+    deleted once the cache exceeds `max_mb`.
+
+    Attributes:
+        root (str): The directory of the cache.
+        max_mb (float): The size limit of the cache in MB (0: unlimited).
+    """
+
+    def __init__(self, root, max_mb=2000):
+        self.root = root
+        self.max_mb = max_mb
+        os.makedirs(root, exist_ok=True)
+        self._hashes_path = f"{root}/hashes.json"
+        self._hashes = {}
+        if os.path.exists(self._hashes_path):
+            with open(self._hashes_path) as f:
+                self._hashes = json.load(f)
+
+    def file_hash(self, path):
+        """
+        Hashes a file, reusing the digest while its size and mtime are unchanged.
+
+        Args:
+            path (str): The path of the file.
+
+        Returns:
+            str: The hex digest.
+        """
+
+        stat = os.stat(path)
+        path = os.path.abspath(path)
+        memo = self._hashes.get(path)
+        if memo and memo["size"] == stat.st_size and memo["mtime"] == stat.st_mtime:
+            return memo["sha256"]
+
+        digest = sha256_file(path)
+        self._hashes[path] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": digest,
+        }
+        self._write_json(self._hashes_path, self._hashes)
+        return digest
+
+    def key(self, video, weights, tracker, **options):
+        """
+        Builds the key of the tracks of a video.
+
+        Args:
+            video (str): The path of the video.
+            weights (str): The path of the YOLOv8 weights.
+            tracker (str): The path or name of the tracker config.
+            **options: The other settings that change the tracks.
+
+        Returns:
+            str: The key of the entry.
+        """
+
+        h = hashlib.sha256()
+        h.update(self.file_hash(video).encode())
+        # 未ダウンロードの公式モデルは名前で識別
+        h.update(
+            (self.file_hash(weights) if os.path.exists(weights) else weights).encode()
+        )
+        h.update(tracker_config(tracker).encode())
+        h.update(json.dumps(options, sort_keys=True).encode())
+        return h.hexdigest()[:32]
+
+    def lookup(self, key):
+        """
+        Opens a committed entry and marks it as recently used.
+
+        Args:
+            key (str): The key of the entry.
+
+        Returns:
+            tuple or None: The reader of the tracks and the metadata, or None on a miss.
+        """
+
+        meta_path = f"{self.root}/{key}/meta.json"
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        meta["last_used"] = time.time()
+        self._write_json(meta_path, meta)
+        return DetectionLogReader(f"{self.root}/{key}"), meta
+
+    def writer(self, key):
+        """
+        Starts a new entry in a temporary directory.
+
+        Args:
+            key (str): The key of the entry.
+
+        Returns:
+            DetectionLogWriter: The writer of the tracks.
+        """
+
+        part = f"{self.root}/.{key}.part"
+        if os.path.exists(part):
+            shutil.rmtree(part)
+        return DetectionLogWriter(part)
+
+    def commit(self, key, writer, **meta):
+        """
+        Publishes a finished entry and evicts the least recently used entries.
+
+        Args:
+            key (str): The key of the entry.
+            writer (DetectionLogWriter): The writer returned by `writer()`.
+            **meta: The metadata stored with the entry (e.g. the class names).
+
+        Returns:
+            None
+        """
+
+        writer.close()
+        meta.update(created=time.time(), last_used=time.time(), frames=writer.frames)
+        self._write_json(f"{writer.path}/meta.json", meta)
+        self._remove(key)
+        os.replace(writer.path, f"{self.root}/{key}")
+        self.evict()
+
+    def discard(self, writer):
+        """
+        Deletes an unfinished entry.
+
+        Args:
+            writer (DetectionLogWriter): The writer returned by `writer()`.
+
+        Returns:
+            None
+        """
+
+        shutil.rmtree(writer.path, ignore_errors=True)
+
+    def entries(self):
+        """
+        Lists the committed entries.
+
+        Returns:
+            list[dict]: The metadata of the entries with their key and size in bytes,
+                least recently used first.
+        """
+
+        entries = []
+        for key in os.listdir(self.root):
+            meta_path = f"{self.root}/{key}/meta.json"
+            if key.startswith(".") or not os.path.exists(meta_path):
+                continue
+            with open(meta_path) as f:
+                meta = json.load(f)
+            size = 0
+            for directory, _, files in os.walk(f"{self.root}/{key}"):
+                size += sum(os.path.getsize(f"{directory}/{name}") for name in files)
+            entries.append(dict(meta, key=key, size=size))
+        return sorted(entries, key=lambda entry: entry["last_used"])
+
+    def evict(self):
+        """
+        Deletes the least recently used entries until the cache fits in `max_mb`.
+
+        Returns:
+            None
+        """
+
+        if self.max_mb <= 0:
+            return
+        entries = self.entries()
+        total = sum(entry["size"] for entry in entries)
+        while entries and total > self.max_mb * 1e6:
+            entry = entries.pop(0)
+            self._remove(entry["key"])
+            total -= entry["size"]
+            logging.info(f"Evicted detection cache entry {entry['key']}")
+
+    def invalidate(self, video=None):
+        """
+        Deletes the entries of a video, or every entry.
+
+        Args:
+            video (str or None): The path of the video (None: every entry).
+
+        Returns:
+            int: The number of deleted entries.
+        """
+
+        video = os.path.abspath(video) if video else None
+        deleted = 0
+        for entry in self.entries():
+            if video is None or entry.get("video") == video:
+                self._remove(entry["key"])
+                deleted += 1
+        return deleted
+
+    def remove(self, key):
+        """
+        Deletes one entry, e.g. when its tracks turned out not to match the video.
+
+        Args:
+            key (str): The key of the entry.
+
+        Returns:
+            None
+        """
+
+        self._remove(key)
+        logging.warning(f"Deleted detection cache entry {key}")
+
+    def _remove(self, key):
+        if os.path.exists(f"{self.root}/{key}"):
+            shutil.rmtree(f"{self.root}/{key}")
+
+    @staticmethod
+    def _write_json(path, data):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp_path, path)
+
+
+class CachedDetector:
+    """
+    Replays the tracks of a cache entry in place of the detector.
+
+    Attributes:
+        names (dict): The class names of the model indexed by class ID.
+        path (str): The directory of the replayed tracks.
+        on_stale (callable or None): Called when the tracks do not match the video,
+            to delete the entry.
+    """
+
+    def __init__(self, reader, names, on_stale=None):
+        # JSONのキーは文字列なのでクラスIDに戻す
+        self.names = {int(cls): name for cls, name in names.items()}
+        self.path = reader.path
+        self.on_stale = on_stale
+        self._frames = reader.iter_frames()
+
+    def __call__(self, packet):
+        """
+        Stores the cached tracked objects of the frame on the packet.
+
+        Args:
+            packet (FramePacket): The captured frame.
+
+        Returns:
+            None
+
+        Raises:
+            RuntimeError: If the cached frames are exhausted or do not match the video.
+        """
+
+        index, _, det = next(self._frames, (None, None, None))
+        if index != packet.index:
+            cached = "no more frames" if index is None else f"frame {index}"
+            message = (
+                f"Stale detection cache {self.path}: {cached} "
+                f"for the video frame {packet.index}"
+            )
+            if self.on_stale is not None:
+                # 次回は動画を推論し直す
+                self.on_stale()
+                message += "; the entry was deleted, run again to track the video"
+            raise RuntimeError(message)
+        packet.detections = det
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the detection cache")
+    parser.add_argument("--dir", default="./cache", type=str, help="Cache directory")
+    parser.add_argument("command", choices=["list", "invalidate"])
+    parser.add_argument(
+        "video", nargs="?", default=None, help="Video to invalidate (default: all)"
+    )
+    args = parser.parse_args()
+
+    cache = DetectionCache(args.dir, max_mb=0)
+    if args.command == "list":
+        for entry in cache.entries():
+            used = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["last_used"]))
+            print(
+                f"{entry['key']}  {entry['size'] / 1e6:8.1f} MB  "
+                f"{entry['frames']:7d} frames  {used}  {entry.get('video')}"
+            )
+    else:
+        print(f"{cache.invalidate(args.video)} entries deleted")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import logging
+import threading
+import time
+
+from detection.pipeline import FramePacket
+
+
+class LatestFrameReader(threading.Thread):
+    """
+    Reads a live camera continuously and keeps only the newest frame.
+
+    The camera driver buffer is drained at the camera FPS, so a slow detector
+    always gets the freshest frame instead of one that waited seconds in the
+    buffer. A frame that is replaced before it was taken counts as dropped.
+
+    Attributes:
+        cap (cv2.VideoCapture): The opened camera.
+        stream (int): The index of the source.
+        index (int): The number of frames read so far.
+        dropped (int): The number of frames replaced before they were taken.
+        finished (bool): True once the camera stopped delivering frames.
+    """
+
+    def __init__(self, cap, stream=0):
+        super().__init__(name=f"reader{stream}", daemon=True)
+        self.cap = cap
+        self.stream = stream
+        self.index = 0
+        self.dropped = 0
+        self.finished = False
+        self._packet = None
+        self._stopped = threading.Event()
+        self._cond = threading.Condition()
+
+    def run(self):
+        try:
+            while not self._stopped.is_set() and self.cap.isOpened():
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+                self.index += 1
+                captured_at = time.perf_counter()
+                packet = FramePacket(self.index, frame, captured_at, self.stream)
+                with self._cond:
+                    if self._packet is not None:
+                        # 取り出される前に新しいフレームで上書き
+                        self.dropped += 1
+                    self._packet = packet
+                    self._cond.notify()
+        except Exception as e:
+            logging.exception(f"Reader of stream {self.stream} failed: {e}")
+        finally:
+            with self._cond:
+                self.finished = True
+                self._cond.notify()
+
+    def __call__(self, timeout=0.5):
+        """
+        Takes the newest frame, waiting for one that was not taken yet.
+
+        Args:
+            timeout (float): The seconds between checks of the stop request.
+
+        Returns:
+            FramePacket or None: The newest frame, or None when the camera stopped.
+        """
+
+        with self._cond:
+            while self._packet is None:
+                if self.finished or self._stopped.is_set():
+                    return None
+                self._cond.wait(timeout)
+            packet, self._packet = self._packet, None
+        return packet
+
+    def stop(self):
+        """
+        Stops reading the camera.
+
+        Returns:
+            None
+        """
+
+        self._stopped.set()
+        with self._cond:
+            self._cond.notify()
+
+    def summary(self):
+        return (
+            f"{self.name}: {self.index} frames read, {self.dropped} dropped "
+            f"({self.dropped / max(self.index, 1):.0%})"
+        )
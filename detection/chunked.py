@@ -0,0 +1,401 @@
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from detection import detections
+from detection.detlog import DetectionLogReader, DetectionLogWriter
+from detection.pipeline import FramePacket
+from detection.stages import YoloDetector
+
+# first: 先頭の重複区間を含む開始フレーム, start〜end: このチャンクが担当する区間
+Chunk = namedtuple("Chunk", ["index", "first", "start", "end"])
+
+# 処理済みチャンクのログと重複区間の見た目
+# first: 最初に読んだフレームの縮小画像, handoff: 次のチャンクの先頭フレームの縮小画像
+ChunkResult = namedtuple(
+    "ChunkResult", ["path", "names", "head", "tail", "first", "handoff"]
+)
+
+# 同一人物とみなす重複区間の平均IoUの下限
+MIN_IOU = 0.3
+# IoUと見た目の重み
+IOU_WEIGHT = 0.7
+# 同じフレームとみなす縮小画像の輝度差の上限（同じフレームはほぼ同じ画素に復号される）
+FINGERPRINT_TOL = 2
+
+
+def plan_chunks(frames, length, overlap):
+    """
+    Splits the frames of a video into chunks that overlap the previous chunk.
+
+    Args:
+        frames (int): The number of frames of the video.
+        length (int): The frames each chunk is responsible for.
+        overlap (int): The frames tracked by both neighbouring chunks.
+
+    Returns:
+        list[Chunk]: The chunks, with 1-based frame numbers and exclusive ends.
+    """
+
+    return [
+        Chunk(k, max(1, start - overlap), start, min(start + length, frames + 1))
+        for k, start in enumerate(range(1, frames + 1, length))
+    ]
+
+
+def open_at(video, position):
+    """
+    Opens a video positioned before a frame, reading forward when the seek is not exact.
+
+    Seeking a compressed video may land on another frame than asked; the position
+    is checked after the seek and, if it differs, the frames are grabbed from the
+    start instead.
+
+    Args:
+        video (str): The path of the video.
+        position (int): The number of frames to skip.
+
+    Returns:
+        cv2.VideoCapture: The capture whose next frame is the frame after `position`.
+    """
+
+    cap = cv2.VideoCapture(video)
+    if position <= 0:
+        return cap
+    cap.set(cv2.CAP_PROP_POS_FRAMES, position)
+    if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == position:
+        return cap
+    logging.warning(f"inexact seek in {video}; reading {position} frames forward")
+    cap.release()
+    cap = cv2.VideoCapture(video)
+    for _ in range(position):
+        if not cap.grab():
+            break
+    return cap
+
+
+def count_frames(video):
+    """
+    Counts the frames of a video by reading it, since CAP_PROP_FRAME_COUNT is often an estimate.
+
+    Args:
+        video (str): The path of the video.
+
+    Returns:
+        int: The number of frames.
+    """
+
+    cap = cv2.VideoCapture(video)
+    frames = 0
+    try:
+        while cap.grab():
+            frames += 1
+    finally:
+        cap.release()
+    return frames
+
+
+def fingerprint(frame):
+    """
+    Shrinks a frame to a small grayscale image to tell whether two decoders read the same frame.
+
+    Args:
+        frame (numpy.ndarray): The BGR frame.
+
+    Returns:
+        numpy.ndarray: The grayscale image, shape (36, 64).
+    """
+
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, (64, 36), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+def same_frame(a, b):
+    """
+    Compares two fingerprints.
+
+    Args:
+        a (numpy.ndarray or None): A fingerprint.
+        b (numpy.ndarray or None): Another fingerprint.
+
+    Returns:
+        bool: True if both fingerprints exist and show the same frame.
+    """
+
+    if a is None or b is None:
+        return False
+    return int(np.abs(a - b).max()) <= FINGERPRINT_TOL
+
+
+def appearance(frame, xyxy):
+    """
+    Describes the look of an object with a hue-saturation histogram.
+
+    Args:
+        frame (numpy.ndarray): The BGR frame.
+        xyxy (numpy.ndarray): The bbox of the object.
+
+    Returns:
+        numpy.ndarray: The L2-normalized histogram, shape (64,).
+    """
+
+    x1, y1, x2, y2 = np.clip(xyxy, 0, [frame.shape[1], frame.shape[0]] * 2)
+    if x2 <= x1 or y2 <= y1:
+        return np.zeros(64, dtype=np.float32)
+    hsv = cv2.cvtColor(frame[y1:y2, x1:x2], cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, [8, 8], [0, 180, 0, 256]).ravel()
+    return hist / max(np.linalg.norm(hist), 1e-6)
+
+
+def _mean_appearance(window):
+    # トラックごとの平均ヒストグラム
+    return {
+        track_id: mean / max(np.linalg.norm(mean), 1e-6)
+        for track_id, mean in (
+            (track_id, np.mean(hists, axis=0)) for track_id, hists in window.items()
+        )
+    }
+
+
+def track_chunk(
+    video, weights, tracker, chunk, overlap, out_dir, threads=1, imgsz=640
+):
+    """
+    Tracks the frames of a chunk in a worker process.
+
+    Args:
+        video (str): The path of the video.
+        weights (str): The path of the YOLOv8 weights.
+        tracker (str): The tracker config.
+        chunk (Chunk): The frames to track.
+        overlap (int): The frames shared with the neighbouring chunks.
+        out_dir (str): The directory of the chunk logs.
+        threads (int): The torch threads of the worker.
+        imgsz (int): The input size of the model.
+
+    Returns:
+        ChunkResult: The log of the chunk and the look of the tracks in both overlaps.
+    """
+
+    import torch
+    from ultralytics import YOLO
+
+    torch.set_num_threads(threads)
+    cap = open_at(video, chunk.first - 1)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    model = YOLO(weights, task="detect")
+    model.overrides["imgsz"] = imgsz
+    detector = YoloDetector(model, tracker, fps)
+    writer = DetectionLogWriter(f"{out_dir}/chunk{chunk.index:05d}")
+    head, tail = {}, {}
+    first, handoff = None, None
+    try:
+        for index in range(chunk.first, chunk.end):
+            ret, frame = cap.read()
+            if not ret:
+                break
+            # 次のチャンクとの位置合わせの確認用
+            if index == chunk.first:
+                first = fingerprint(frame)
+            if index == chunk.end - overlap:
+                handoff = fingerprint(frame)
+            packet = FramePacket(index, frame, time.perf_counter())
+            detector(packet)
+            # 時刻は動画上の位置
+            writer.append(index, (index - 1) / fps, packet.detections)
+
+            if index < chunk.start:
+                window = head
+            elif index >= chunk.end - overlap:
+                window = tail
+            else:
+                continue
+            for det in packet.detections:
+                hist = appearance(frame, det["xyxy"])
+                window.setdefault(int(det["id"]), []).append(hist)
+    finally:
+        writer.close()
+        cap.release()
+
+    return ChunkResult(
+        writer.path,
+        detector.names,
+        _mean_appearance(head),
+        _mean_appearance(tail),
+        first,
+        handoff,
+    )
+
+
+def _overlap_rows(path, chunk, fps):
+    # 重複区間 [first, start) の検出
+    columns = DetectionLogReader(path).slice(
+        (chunk.first - 1.5) / fps, (chunk.start - 1.5) / fps
+    )
+    keep = (columns["frame"] >= chunk.first) & (columns["frame"] < chunk.start)
+    return {name: column[keep] for name, column in columns.items()}
+
+
+def stitch(prev, curr, chunk, fps):
+    """
+    Matches the tracks of a chunk with the tracks of the previous chunk in their overlap.
+
+    The pairs are scored by their mean IoU over the overlap frames and the cosine
+    similarity of their appearance, and matched greedily from the best score.
+
+    Args:
+        prev (ChunkResult): The previous chunk.
+        curr (ChunkResult): The chunk to match.
+        chunk (Chunk): The frames of the chunk to match.
+        fps (float): The FPS of the video.
+
+    Returns:
+        dict: The matched track IDs of the previous chunk by track ID of the chunk.
+    """
+
+    a = _overlap_rows(prev.path, chunk, fps)
+    b = _overlap_rows(curr.path, chunk, fps)
+    ious = {}
+    for index in np.intersect1d(a["frame"], b["frame"]):
+        ia = np.flatnonzero(a["frame"] == index)
+        ib = np.flatnonzero(b["frame"] == index)
+        overlap = detections.iou(a["xyxy"][ia], b["xyxy"][ib])
+        same_cls = a["cls"][ia][:, None] == b["cls"][ib][None, :]
+        for i, j in zip(*np.nonzero(same_cls)):
+            pair = (int(a["id"][ia[i]]), int(b["id"][ib[j]]))
+            ious[pair] = ious.get(pair, 0.0) + overlap[i, j]
+    # 各トラックが重複区間に映っていたフレーム数
+    frames_a = dict(zip(*np.unique(a["id"], return_counts=True)))
+    frames_b = dict(zip(*np.unique(b["id"], return_counts=True)))
+
+    scores = []
+    for (pa, pb), total in ious.items():
+        mean_iou = total / max(frames_a[pa], frames_b[pb])
+        if mean_iou < MIN_IOU:
+            continue
+        similarity = 0.0
+        if pa in prev.tail and pb in curr.head:
+            similarity = float(prev.tail[pa] @ curr.head[pb])
+        scores.append((IOU_WEIGHT * mean_iou + (1 - IOU_WEIGHT) * similarity, pa, pb))
+
+    matches, used = {}, set()
+    for _, pa, pb in sorted(scores, reverse=True):
+        if pb not in matches and pa not in used:
+            matches[pb] = pa
+            used.add(pa)
+    return matches
+
+
+def track_parallel(
+    video,
+    weights,
+    tracker,
+    writer,
+    workers,
+    chunk_seconds=60,
+    overlap_seconds=2,
+    imgsz=640,
+):
+    """
+    Tracks a video in overlapping chunks on a process pool and stitches the track IDs.
+
+    The chunks are merged in order as they finish, so the stitched log has the
+    frames of a sequential run with IDs that continue across the chunk boundaries.
+    The chunks are planned from CAP_PROP_FRAME_COUNT, which may be an estimate,
+    so the last chunk reads to the end of the video, and the frames are counted
+    by a sequential read meanwhile. The result is rejected when a chunk does not
+    start on the frame the previous chunk read there, when frames are missing,
+    or when the total differs from the sequential count.
+
+    Args:
+        video (str): The path of the video.
+        weights (str): The path of the YOLOv8 weights or of an exported model.
+        tracker (str): The tracker config.
+        writer (DetectionLogWriter): The log the stitched tracks are appended to.
+        workers (int): The number of worker processes.
+        chunk_seconds (float): The length of a chunk.
+        overlap_seconds (float): The overlap tracked by both neighbouring chunks.
+        imgsz (int): The input size of the model.
+
+    Returns:
+        dict or None: The class names of the model indexed by class ID, or None
+            when no frame was read or the chunks do not match a sequential read.
+    """
+
+    cap = cv2.VideoCapture(video)
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    cap.release()
+    overlap = max(1, round(overlap_seconds * fps))
+    chunks = plan_chunks(frames, max(overlap + 1, round(chunk_seconds * fps)), overlap)
+    if chunks:
+        # フレーム数は推定値のことがあるので、最後のチャンクは末尾まで読む
+        chunks[-1] = chunks[-1]._replace(end=sys.maxsize)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    logging.info(f"track {frames} frames in {len(chunks)} chunks on {workers} workers")
+
+    names = None
+    with tempfile.TemporaryDirectory() as tmp_dir, ProcessPoolExecutor(
+        workers, mp_context=multiprocessing.get_context("spawn")
+    ) as pool, ThreadPoolExecutor(1) as counter:
+        # 逐次に読んだフレーム数（チャンクの処理と並行して数える）
+        counted = counter.submit(count_frames, video)
+        futures = [
+            pool.submit(
+                track_chunk, video, weights, tracker, c, overlap, tmp_dir, threads, imgsz
+            )
+            for c in chunks
+        ]
+        prev, prev_ids, next_id, next_index = None, {}, 1, 1
+        for chunk, future in zip(chunks, futures):
+            result = future.result()
+            if result.first is None:
+                # 推定より短い動画の末尾のチャンク
+                continue
+            if prev is not None and not same_frame(prev.handoff, result.first):
+                return _reject(futures, f"chunk {chunk.index + 1} is misaligned")
+            names = result.names
+            # 前のチャンクと一致したトラックはそのIDを引き継ぐ
+            ids = {}
+            if prev is not None:
+                for local, prev_local in stitch(prev, result, chunk, fps).items():
+                    if prev_local in prev_ids:
+                        ids[local] = prev_ids[prev_local]
+
+            for index, timestamp, det in DetectionLogReader(result.path).iter_frames():
+                if index < chunk.start:
+                    continue
+                if index != next_index:
+                    return _reject(futures, f"frame {next_index} is missing")
+                next_index += 1
+                for local in det["id"].tolist():
+                    if local not in ids:
+                        ids[local] = next_id
+                        next_id += 1
+                det["id"] = [ids[local] for local in det["id"].tolist()]
+                writer.append(index, timestamp, det)
+            prev, prev_ids = result, ids
+            logging.info(f"chunk {chunk.index + 1}/{len(chunks)} merged")
+
+        if next_index - 1 != counted.result():
+            return _reject(
+                futures,
+                f"{next_index - 1} frames tracked, {counted.result()} in the video",
+            )
+    return names
+
+
+def _reject(futures, reason):
+    # 残りのチャンクは処理しない
+    for future in futures:
+        future.cancel()
+    logging.warning(f"chunked tracking rejected: {reason}")
+    return None
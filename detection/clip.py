@@ -0,0 +1,240 @@
+import logging
+import os
+import queue
+import threading
+from collections import deque
+
+import cv2
+import numpy as np
+
+# ワーカーの終了を伝える番兵
+STOP = object()
+
+
+class FrameRingBuffer:
+    """
+    A fixed-size ring of the latest JPEG-compressed frames.
+
+    All slots live in one preallocated arena, so the memory is bounded by
+    `capacity * slot_bytes` however long the detection runs. A frame whose JPEG
+    does not fit in a slot is not stored.
+
+    Attributes:
+        capacity (int): The number of frames kept.
+        slot_bytes (int): The maximum size of one JPEG frame.
+        dropped (int): The number of frames that did not fit in a slot.
+    """
+
+    def __init__(self, capacity, slot_bytes):
+        self.capacity = capacity
+        self.slot_bytes = slot_bytes
+        self.data = np.empty((capacity, slot_bytes), dtype=np.uint8)
+        self.lengths = np.zeros(capacity, dtype=np.int64)
+        self.head = 0
+        self.count = 0
+        self.dropped = 0
+
+    def push(self, jpeg):
+        """
+        Stores a frame, overwriting the oldest one when the ring is full.
+
+        Args:
+            jpeg (numpy.ndarray): The JPEG bytes of the frame.
+
+        Returns:
+            bool: True if the frame was stored, False if it was too large.
+        """
+
+        n = len(jpeg)
+        if n > self.slot_bytes:
+            self.dropped += 1
+            return False
+        self.data[self.head, :n] = jpeg.ravel()
+        self.lengths[self.head] = n
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        return True
+
+    def snapshot(self):
+        """
+        Copies the stored frames out of the ring.
+
+        Returns:
+            list[bytes]: The JPEG frames from the oldest to the newest.
+        """
+
+        order = (self.head - self.count + np.arange(self.count)) % self.capacity
+        return [self.data[i, : self.lengths[i]].tobytes() for i in order]
+
+
+class EventClip:
+    """
+    A clip being collected around an alert.
+
+    Attributes:
+        clip_file (str): The file name of the clip.
+        index (int): The frame number of the alert.
+        frames (list[bytes]): The JPEG frames collected so far.
+        remaining (int): The number of frames still to collect after the alert.
+    """
+
+    __slots__ = ("clip_file", "index", "frames", "remaining")
+
+    def __init__(self, clip_file, index, remaining):
+        self.clip_file = clip_file
+        self.index = index
+        self.frames = []
+        self.remaining = remaining
+
+
+class ClipRecorder:
+    """
+    A pipeline stage that keeps the last `pre` seconds of frames and writes a clip around each alert.
+
+    Every frame is JPEG-compressed into a FrameRingBuffer. When an alert is triggered,
+    the buffered frames before it and the next `post` seconds of frames are handed to
+    a background encoder, which writes the MP4 into a temporary file and renames it,
+    so nginx never serves a half-written clip.
+
+    Attributes:
+        out_dir (str): The directory of the clips.
+        fps (float): The FPS of the clips.
+        frame_size (tuple): The width and height of the frames.
+        quality (int): The JPEG quality of the buffered frames.
+        written (int): The number of clips written.
+    """
+
+    def __init__(self, out_dir, fps, frame_size, pre=5.0, post=5.0, quality=80):
+        self.out_dir = out_dir
+        self.fps = fps or 30.0
+        self.frame_size = frame_size
+        self.quality = quality
+        self.post_frames = max(int(post * self.fps), 1)
+
+        W, H = frame_size
+        # JPEGはほぼ raw の1/8以下に収まる
+        self.ring = FrameRingBuffer(max(int(pre * self.fps), 1), W * H * 3 // 8)
+        self.requests = deque()
+        self.active = []
+        self.written = 0
+
+        self.queue = queue.Queue()
+        self.encoder = threading.Thread(target=self._encode, name="clip", daemon=True)
+        self.encoder.start()
+
+    def trigger(self, clip_file, index):
+        """
+        Requests a clip around an alert; safe to call from another stage.
+
+        Args:
+            clip_file (str): The file name of the clip.
+            index (int): The frame number of the alert.
+
+        Returns:
+            None
+        """
+
+        self.requests.append((clip_file, index))
+
+    def __call__(self, packet):
+        """
+        Buffers the frame and adds it to the clips being collected.
+
+        Args:
+            packet (FramePacket): The annotated frame.
+
+        Returns:
+            FramePacket: The same packet.
+        """
+
+        jpeg = self._jpeg(packet.frame)
+
+        # アラートのフレームに達したら、それ以前のバッファをクリップの先頭にする
+        while self.requests and self.requests[0][1] <= packet.index:
+            clip_file, index = self.requests.popleft()
+            clip = EventClip(clip_file, index, self.post_frames)
+            clip.frames = self.ring.snapshot()
+            self.active.append(clip)
+
+        self.ring.push(jpeg)
+        for clip in list(self.active):
+            clip.frames.append(jpeg.tobytes())
+            clip.remaining -= 1
+            if clip.remaining <= 0:
+                self.active.remove(clip)
+                self.queue.put(clip)
+        return packet
+
+    def _jpeg(self, frame):
+        ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if len(jpeg) > self.ring.slot_bytes:
+            # スロットに収まらなければ画質を落として再エンコード
+            ok, jpeg = cv2.imencode(
+                ".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality // 2]
+            )
+        return jpeg
+
+    def _encode(self):
+        while True:
+            clip = self.queue.get()
+            if clip is STOP:
+                break
+            try:
+                self.write(clip)
+                self.written += 1
+            except Exception as e:
+                logging.error(f"Failed to write clip {clip.clip_file}: {e}")
+
+    def write(self, clip):
+        """
+        Decodes the frames of a clip and writes them as MP4.
+
+        Args:
+            clip (EventClip): The collected clip.
+
+        Returns:
+            None
+        """
+
+        path = f"{self.out_dir}/{clip.clip_file}"
+        tmp_path = f"{self.out_dir}/.{clip.clip_file}.tmp.mp4"
+        codec = cv2.VideoWriter_fourcc("m", "p", "4", "v")
+        video = cv2.VideoWriter(tmp_path, codec, self.fps, self.frame_size)
+        try:
+            for jpeg in clip.frames:
+                frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+                video.write(frame)
+        finally:
+            video.release()
+        os.replace(tmp_path, path)
+        logging.info(f"Alert clip: {path} ({len(clip.frames)} frames)")
+
+    def close(self):
+        """
+        Writes the clips still being collected and stops the encoder.
+
+        Returns:
+            None
+        """
+
+        # アラートのフレームまで届かなかった要求はバッファだけで書き出す
+        while self.requests:
+            clip_file, index = self.requests.popleft()
+            clip = EventClip(clip_file, index, 0)
+            clip.frames = self.ring.snapshot()
+            self.active.append(clip)
+        for clip in self.active:
+            self.queue.put(clip)
+        self.active = []
+        self.queue.put(STOP)
+        self.encoder.join()
+
+    def summary(self):
+        """
+        Formats the clip statistics.
+
+        Returns:
+            str: A line with the written clips and the frames that did not fit in the ring.
+        """
+
+        return f"clip: {self.written} written, {self.ring.dropped} frames dropped"
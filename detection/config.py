@@ -0,0 +1,103 @@
+import argparse
+import os
+import tomllib
+
+import yaml
+
+# カメラごとに変えられるコマンドライン引数
+CAMERA_OPTIONS = {
+    "camera_width",
+    "camera_height",
+    "thr",
+    "zone",
+    "cooldown",
+    "dwell_ttl",
+    "output",
+    "no_record",
+    "segment_seconds",
+    "record_codec",
+    "record_quality",
+    "record_scale",
+    "record_stride",
+    "record_budget",
+    "detection_log",
+    "url",
+    "nginx",
+    "alert_retries",
+}
+
+
+def read_config(path):
+    """
+    Reads a YAML or TOML config file.
+
+    Args:
+        path (str): The path of the config; `.toml` files are read as TOML.
+
+    Returns:
+        dict: The contents of the config.
+    """
+
+    if os.path.splitext(path)[1] == ".toml":
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    with open(path) as f:
+        return yaml.safe_load(f) or {}
+
+
+def load_cameras(path, args):
+    """
+    Builds the arguments of every camera of a multi-camera config.
+
+    The top-level keys of the config override the command line arguments of the
+    same name for all cameras; the `cameras` list gives the source of each camera,
+    its `name` and `priority`, and the options in CAMERA_OPTIONS it overrides.
+    A missing `output` defaults to `<name>.mp4`.
+
+    Args:
+        path (str): The path of the YAML or TOML config.
+        args (argparse.Namespace): The command line arguments.
+
+    Returns:
+        tuple: The merged global arguments and the list of per-camera arguments,
+            each with `name`, `source` and `priority` added.
+
+    Raises:
+        ValueError: If the config has no camera or an unknown option.
+    """
+
+    config = dict(read_config(path))
+    cameras = config.pop("cameras", None)
+    if not cameras:
+        raise ValueError(f"No cameras in {path}")
+    unknown = set(config) - set(vars(args))
+    if unknown:
+        raise ValueError(f"Unknown options in {path}: {sorted(unknown)}")
+    merged = argparse.Namespace(**{**vars(args), **config})
+
+    streams = []
+    for i, camera in enumerate(cameras):
+        camera = dict(camera)
+        if "source" not in camera:
+            raise ValueError(f"Camera {i} of {path} has no source")
+        name = str(camera.pop("name", f"camera{i}"))
+        source = str(camera.pop("source"))
+        priority = float(camera.pop("priority", 1.0))
+        unknown = set(camera) - CAMERA_OPTIONS
+        if unknown:
+            raise ValueError(f"Not per-camera options in {name}: {sorted(unknown)}")
+        camera.setdefault("output", f"{name}.mp4")
+        if isinstance(camera.get("zone"), str):
+            camera["zone"] = [camera["zone"]]
+        streams.append(
+            argparse.Namespace(
+                **{
+                    **vars(merged),
+                    **camera,
+                    "name": name,
+                    "source": source,
+                    "priority": priority,
+                }
+            )
+        )
+    return merged, streams
@@ -0,0 +1,171 @@
+import numpy as np
+
+# 1検出 = 1レコードの構造化配列
+DETECTION_DTYPE = np.dtype(
+    [
+        ("xyxy", np.int32, (4,)),
+        ("id", np.int32),
+        ("cls", np.int32),
+        ("conf", np.float32),
+    ]
+)
+
+
+def empty(n=0):
+    """
+    Creates a detection array.
+
+    Args:
+        n (int): The number of detections.
+
+    Returns:
+        numpy.ndarray: A zero-filled structured array of DETECTION_DTYPE.
+    """
+
+    return np.zeros(n, dtype=DETECTION_DTYPE)
+
+
+def from_result(result):
+    """
+    Converts the tracked boxes of an Ultralytics result with a single device-to-host copy.
+
+    Boxes without a tracker ID are not tracked yet and are left out, as before.
+
+    Args:
+        result (ultralytics.engine.results.Results): The tracking result of a frame.
+
+    Returns:
+        numpy.ndarray: The tracked objects as a structured array of DETECTION_DTYPE.
+    """
+
+    boxes = result.boxes
+    if boxes is None or boxes.id is None:
+        return empty()
+    # data: x1, y1, x2, y2, id, conf, cls
+    data = boxes.data.cpu().numpy()
+    return from_array(data[:, :4], data[:, 4], data[:, 6], data[:, 5])
+
+
+def from_array(xyxy, ids, cls, conf):
+    """
+    Builds a detection array from column arrays.
+
+    Args:
+        xyxy (numpy.ndarray): The bbox coordinates, shape (N, 4).
+        ids (numpy.ndarray): The tracker IDs, shape (N,).
+        cls (numpy.ndarray): The class IDs, shape (N,).
+        conf (numpy.ndarray): The confidences, shape (N,).
+
+    Returns:
+        numpy.ndarray: A structured array of DETECTION_DTYPE.
+    """
+
+    det = empty(len(ids))
+    det["xyxy"] = xyxy
+    det["id"] = ids
+    det["cls"] = cls
+    det["conf"] = conf
+    return det
+
+
+def iou(a, b):
+    """
+    Computes the pairwise IoU of two sets of boxes.
+
+    Args:
+        a (numpy.ndarray): The xyxy boxes, shape (N, 4).
+        b (numpy.ndarray): The xyxy boxes, shape (M, 4).
+
+    Returns:
+        numpy.ndarray: The IoU matrix, shape (N, M).
+    """
+
+    a = a.astype(np.float32)
+    b = b.astype(np.float32)
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    union = area_a[:, None] + area_b[None, :] - inter
+    return inter / np.maximum(union, 1e-6)
+
+
+def ios(a, b):
+    """
+    Computes the pairwise intersection over the smaller box of two sets of boxes.
+
+    Unlike the IoU it is high when one box is mostly inside the other, e.g. the
+    part of a person cut at a tile edge and the whole person.
+
+    Args:
+        a (numpy.ndarray): The xyxy boxes, shape (N, 4).
+        b (numpy.ndarray): The xyxy boxes, shape (M, 4).
+
+    Returns:
+        numpy.ndarray: The intersection over the smaller area, shape (N, M).
+    """
+
+    a = a.astype(np.float32)
+    b = b.astype(np.float32)
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    smaller = np.minimum(area_a[:, None], area_b[None, :])
+    return inter / np.maximum(smaller, 1e-6)
+
+
+def nms(xyxy, scores, cls, thr=0.5):
+    """
+    Suppresses the overlapping boxes of the same class, keeping the most confident.
+
+    Args:
+        xyxy (numpy.ndarray): The boxes, shape (N, 4).
+        scores (numpy.ndarray): The confidences, shape (N,).
+        cls (numpy.ndarray): The class IDs, shape (N,).
+        thr (float): The IoU over which the less confident box is suppressed.
+
+    Returns:
+        numpy.ndarray: The indices of the kept boxes, most confident first.
+    """
+
+    order = np.argsort(-scores)
+    overlap = iou(xyxy[order], xyxy[order])
+    # 異なるクラス同士は抑制しない
+    overlap[cls[order][:, None] != cls[order][None, :]] = 0
+    keep = np.ones(len(order), dtype=bool)
+    for i in range(len(order)):
+        if keep[i]:
+            keep[i + 1 :] &= overlap[i, i + 1 :] <= thr
+    return order[keep]
+
+
+def match(a_xyxy, a_cls, b_xyxy, b_cls, thr=0.5):
+    """
+    Matches two sets of boxes of the same class greedily by IoU.
+
+    Args:
+        a_xyxy (numpy.ndarray): The first boxes, shape (N, 4).
+        a_cls (numpy.ndarray): Their class IDs, shape (N,).
+        b_xyxy (numpy.ndarray): The second boxes, shape (M, 4).
+        b_cls (numpy.ndarray): Their class IDs, shape (M,).
+        thr (float): The IoU over which two boxes match.
+
+    Returns:
+        list[tuple]: The matched pairs (i, j, IoU).
+    """
+
+    if not len(a_xyxy) or not len(b_xyxy):
+        return []
+    overlap = iou(a_xyxy, b_xyxy)
+    overlap[a_cls[:, None] != b_cls[None, :]] = 0
+    pairs = []
+    while True:
+        i, j = np.unravel_index(np.argmax(overlap), overlap.shape)
+        if overlap[i, j] < thr:
+            return pairs
+        pairs.append((int(i), int(j), float(overlap[i, j])))
+        overlap[i, :] = 0
+        overlap[:, j] = 0
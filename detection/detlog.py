@@ -0,0 +1,294 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+from detection import detections
+
+# 検出1件ごとの列
+ROW_COLUMNS = {
+    "frame": np.int64,
+    "timestamp": np.float64,
+    "id": np.int32,
+    "cls": np.int32,
+    "conf": np.float32,
+    "xyxy": np.int32,
+}
+# フレーム1枚ごとの列（offset: そのフレームの先頭行）
+FRAME_COLUMNS = {
+    "frame": np.int64,
+    "timestamp": np.float64,
+    "offset": np.int64,
+}
+
+
+class DetectionLogWriter:
+    """
+    A pipeline stage that appends the tracked objects of every frame to a columnar log.
+
+    Rows are buffered in preallocated column arrays and written in chunks: one
+    directory per chunk with one `.npy` file per column, which the reader can
+    memory-map. Every frame is also listed in a per-chunk frame table, so frames
+    without detections are kept. `index.json` lists the frame and time range of
+    every chunk and is replaced atomically after each chunk.
+
+    Attributes:
+        path (str): The directory of the log.
+        chunk_rows (int): The detections per chunk.
+        chunk_frames (int): The frames per chunk.
+    """
+
+    def __init__(self, path, chunk_rows=65536, chunk_frames=16384):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.chunk_frames = chunk_frames
+        os.makedirs(path, exist_ok=True)
+
+        self.index = []
+        index_path = f"{path}/index.json"
+        if os.path.exists(index_path):
+            # 既存のログに追記
+            with open(index_path) as f:
+                self.index = json.load(f)["chunks"]
+
+        self._rows = self._allocate(ROW_COLUMNS, chunk_rows)
+        self._frames = self._allocate(FRAME_COLUMNS, chunk_frames)
+        self._n_rows = 0
+        self._n_frames = 0
+        self.frames = 0
+        self.rows = 0
+
+    @staticmethod
+    def _allocate(columns, size):
+        return {
+            name: np.empty((size, 4) if name == "xyxy" else size, dtype=dtype)
+            for name, dtype in columns.items()
+        }
+
+    def __call__(self, packet):
+        """
+        Appends the tracked objects of a frame.
+
+        Args:
+            packet (FramePacket): The tracked frame.
+
+        Returns:
+            FramePacket: The same packet.
+        """
+
+        self.append(packet.index, packet.timestamp, packet.detections)
+        return packet
+
+    def append(self, frame_index, timestamp, det):
+        """
+        Appends the tracked objects of a frame.
+
+        Args:
+            frame_index (int): The frame number.
+            timestamp (float): The UNIX time of the frame.
+            det (numpy.ndarray): The detections of the frame.
+
+        Returns:
+            None
+        """
+
+        n = len(det)
+        if self._n_frames == self.chunk_frames or self._n_rows + n > len(
+            self._rows["frame"]
+        ):
+            self.flush()
+        if n > len(self._rows["frame"]):
+            self._rows = self._allocate(ROW_COLUMNS, n)
+
+        f = self._n_frames
+        self._frames["frame"][f] = frame_index
+        self._frames["timestamp"][f] = timestamp
+        self._frames["offset"][f] = self._n_rows
+        self._n_frames += 1
+
+        r = slice(self._n_rows, self._n_rows + n)
+        self._rows["frame"][r] = frame_index
+        self._rows["timestamp"][r] = timestamp
+        for name in ("id", "cls", "conf", "xyxy"):
+            self._rows[name][r] = det[name]
+        self._n_rows += n
+        self.frames += 1
+        self.rows += n
+
+    def flush(self):
+        """
+        Writes the buffered frames as a new chunk.
+
+        Returns:
+            None
+        """
+
+        if not self._n_frames:
+            return
+        name = f"chunk_{len(self.index):06d}"
+        tmp_dir = f"{self.path}/.{name}.tmp"
+        os.makedirs(tmp_dir, exist_ok=True)
+        for column, data in self._rows.items():
+            np.save(f"{tmp_dir}/{column}.npy", data[: self._n_rows])
+        for column, data in self._frames.items():
+            np.save(f"{tmp_dir}/frames_{column}.npy", data[: self._n_frames])
+        if os.path.exists(f"{self.path}/{name}"):
+            shutil.rmtree(f"{self.path}/{name}")
+        os.replace(tmp_dir, f"{self.path}/{name}")
+
+        frames = self._frames
+        self.index.append(
+            {
+                "name": name,
+                "frames": self._n_frames,
+                "rows": self._n_rows,
+                "frame_start": int(frames["frame"][0]),
+                "frame_end": int(frames["frame"][self._n_frames - 1]),
+                "time_start": float(frames["timestamp"][0]),
+                "time_end": float(frames["timestamp"][self._n_frames - 1]),
+            }
+        )
+        tmp_index = f"{self.path}/.index.json.tmp"
+        with open(tmp_index, "w") as f:
+            json.dump({"chunks": self.index}, f, indent=1)
+        os.replace(tmp_index, f"{self.path}/index.json")
+
+        self._n_rows = 0
+        self._n_frames = 0
+        if len(self._rows["frame"]) != self.chunk_rows:
+            self._rows = self._allocate(ROW_COLUMNS, self.chunk_rows)
+
+    def close(self):
+        """
+        Writes the remaining buffered frames.
+
+        Returns:
+            None
+        """
+
+        self.flush()
+
+    def summary(self):
+        return (
+            f"detection log: {self.frames} frames, {self.rows} detections, "
+            f"{len(self.index)} chunks in {self.path}"
+        )
+
+
+class DetectionLogReader:
+    """
+    Reads a detection log chunk by chunk through memory-mapped columns.
+
+    Only the chunks overlapping the requested time range are opened, so a slice
+    of a long log never loads the whole log.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(f"{path}/index.json") as f:
+            self.index = json.load(f)["chunks"]
+
+    def __len__(self):
+        return sum(chunk["frames"] for chunk in self.index)
+
+    def chunks(self, start_time=None, end_time=None):
+        """
+        Lists the chunks overlapping a time range.
+
+        Args:
+            start_time (float or None): The start UNIX time (inclusive).
+            end_time (float or None): The end UNIX time (exclusive).
+
+        Returns:
+            list[dict]: The metadata of the chunks.
+        """
+
+        return [
+            chunk
+            for chunk in self.index
+            if (start_time is None or chunk["time_end"] >= start_time)
+            and (end_time is None or chunk["time_start"] < end_time)
+        ]
+
+    def load(self, chunk, prefix=""):
+        """
+        Memory-maps the columns of a chunk.
+
+        Args:
+            chunk (dict): The metadata of the chunk.
+            prefix (str): "frames_" for the frame table, "" for the detections.
+
+        Returns:
+            dict: The memory-mapped columns by name.
+        """
+
+        columns = FRAME_COLUMNS if prefix else ROW_COLUMNS
+        directory = f"{self.path}/{chunk['name']}"
+        return {
+            name: np.load(f"{directory}/{prefix}{name}.npy", mmap_mode="r")
+            for name in columns
+        }
+
+    def iter_frames(self, start_time=None, end_time=None):
+        """
+        Streams the frames of a time range, including the frames without detections.
+
+        Args:
+            start_time (float or None): The start UNIX time (inclusive).
+            end_time (float or None): The end UNIX time (exclusive).
+
+        Yields:
+            tuple: The frame number, the UNIX time and the detections of the frame.
+        """
+
+        for chunk in self.chunks(start_time, end_time):
+            frames = self.load(chunk, "frames_")
+            rows = self.load(chunk)
+            timestamps = frames["timestamp"]
+            first, last = self._bounds(timestamps, start_time, end_time)
+            offsets = np.append(frames["offset"], chunk["rows"])
+            for i in range(first, last):
+                r = slice(offsets[i], offsets[i + 1])
+                det = detections.from_array(
+                    rows["xyxy"][r], rows["id"][r], rows["cls"][r], rows["conf"][r]
+                )
+                yield int(frames["frame"][i]), float(timestamps[i]), det
+
+    def slice(self, start_time=None, end_time=None):
+        """
+        Loads the detections of a time range as columns.
+
+        Args:
+            start_time (float or None): The start UNIX time (inclusive).
+            end_time (float or None): The end UNIX time (exclusive).
+
+        Returns:
+            dict: The columns (frame, timestamp, id, cls, conf, xyxy) of the detections.
+        """
+
+        parts = {name: [] for name in ROW_COLUMNS}
+        for chunk in self.chunks(start_time, end_time):
+            rows = self.load(chunk)
+            first, last = self._bounds(rows["timestamp"], start_time, end_time)
+            for name in ROW_COLUMNS:
+                parts[name].append(np.asarray(rows[name][first:last]))
+        return {
+            name: (
+                np.concatenate(arrays)
+                if arrays
+                else np.empty((0, 4) if name == "xyxy" else 0, dtype=ROW_COLUMNS[name])
+            )
+            for name, arrays in parts.items()
+        }
+
+    @staticmethod
+    def _bounds(timestamps, start_time, end_time):
+        # 時刻は単調増加なので二分探索
+        first = 0 if start_time is None else np.searchsorted(timestamps, start_time)
+        last = (
+            len(timestamps)
+            if end_time is None
+            else np.searchsorted(timestamps, end_time)
+        )
+        return int(first), int(last)
@@ -0,0 +1,217 @@
+import cv2
+import numpy as np
+
+# 未アラートを表すフレーム番号
+NEVER = np.iinfo(np.int64).min // 2
+
+
+def parse_zone(text):
+    """
+    Parses a polygon zone given on the command line.
+
+    Args:
+        text (str): The vertices as "x1,y1 x2,y2 x3,y3 ...".
+
+    Returns:
+        numpy.ndarray: The vertices, shape (N, 2).
+
+    Raises:
+        ValueError: If the zone has fewer than 3 vertices.
+    """
+
+    points = [point.split(",") for point in text.split()]
+    if len(points) < 3 or any(len(point) != 2 for point in points):
+        raise ValueError(f"A zone needs at least 3 'x,y' vertices: {text}")
+    return np.array(points, dtype=np.int32)
+
+
+class DwellEngine:
+    """
+    Measures how long each tracked person stays, keyed by tracker ID.
+
+    The state of each track lives in one slot of preallocated arrays: its first-seen
+    and last-seen frame, the update it was last seen at, the frames spent inside each
+    zone and the frame of its last alert. Tracks not seen for `ttl` updates are
+    evicted and their slots reused, so memory stays flat however long the detection
+    runs. All updates are vectorized over the boxes of a frame.
+
+    The dwell and `cooldown` are counted in frame numbers, i.e. in frames of the
+    video: a track seen again after a gap of skipped or dropped frames gains the
+    whole gap, capped at `ttl` frames. The eviction counts processed frames (calls
+    to `update()`) instead, so a camera with a small share of the inference budget,
+    whose frame numbers are far apart, does not lose its tracks between two frames.
+
+    A box is inside a zone when its bottom-center point (the feet) is. Without zones
+    the whole frame is one zone. The dwell of a track is its largest number of frames
+    inside one zone.
+
+    Attributes:
+        thr (int): The dwell, in frames, that raises an alert.
+        cooldown (int): The frames before the same track can raise another alert.
+        ttl (int): The processed frames after which an unseen track is evicted, and
+            the most frames a gap adds to the dwell.
+        zones (list[numpy.ndarray]): The polygon zones.
+        updates (int): The number of processed frames so far.
+    """
+
+    def __init__(
+        self, thr, zones=None, frame_size=None, cooldown=1800, ttl=30, capacity=64
+    ):
+        self.thr = thr
+        self.cooldown = cooldown
+        self.ttl = ttl
+        self.zones = zones or []
+        self.updates = 0
+
+        self.zone_mask = None
+        if self.zones:
+            if len(self.zones) > 32:
+                raise ValueError("At most 32 zones are supported")
+            # 画素ごとに所属ゾーンをビットで持つ
+            W, H = frame_size
+            self.zone_mask = np.zeros((H, W), dtype=np.uint32)
+            mask = np.zeros((H, W), dtype=np.uint8)
+            for z, zone in enumerate(self.zones):
+                mask[:] = 0
+                cv2.fillPoly(mask, [zone], 1)
+                self.zone_mask |= mask.astype(np.uint32) << z
+        self.num_zones = max(len(self.zones), 1)
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.ids = np.full(capacity, -1, dtype=np.int64)
+        self.first_seen = np.zeros(capacity, dtype=np.int64)
+        self.last_seen = np.zeros(capacity, dtype=np.int64)
+        self.last_update = np.zeros(capacity, dtype=np.int64)
+        self.inside = np.zeros((capacity, self.num_zones), dtype=np.int32)
+        self.last_alert = np.full(capacity, NEVER, dtype=np.int64)
+
+    def _arrays(self):
+        return (
+            self.ids,
+            self.first_seen,
+            self.last_seen,
+            self.last_update,
+            self.inside,
+            self.last_alert,
+        )
+
+    def _grow(self, capacity):
+        size = len(self.ids)
+        arrays = self._arrays()
+        self._allocate(capacity)
+        for new, old in zip(self._arrays(), arrays):
+            new[:size] = old
+
+    @property
+    def active(self):
+        """
+        int: The number of tracks currently held.
+        """
+
+        return int(np.count_nonzero(self.ids >= 0))
+
+    def evict(self):
+        """
+        Frees the slots of the tracks not seen for more than `ttl` processed frames.
+
+        Returns:
+            None
+        """
+
+        stale = (self.ids >= 0) & (self.last_update < self.updates - self.ttl)
+        self.ids[stale] = -1
+
+    def reset(self):
+        """
+        Forgets every track, e.g. when the tracker restarts its IDs.
+
+        Returns:
+            None
+        """
+
+        self.ids[:] = -1
+
+    def zones_of(self, xyxy):
+        """
+        Tells in which zones each box stands.
+
+        Args:
+            xyxy (numpy.ndarray): The bbox coordinates, shape (N, 4).
+
+        Returns:
+            numpy.ndarray: A boolean array, shape (N, number of zones).
+        """
+
+        if self.zone_mask is None:
+            return np.ones((len(xyxy), 1), dtype=bool)
+        H, W = self.zone_mask.shape
+        x = np.clip((xyxy[:, 0] + xyxy[:, 2]) // 2, 0, W - 1)
+        y = np.clip(xyxy[:, 3], 0, H - 1)
+        bits = self.zone_mask[y, x]
+        shifts = np.arange(self.num_zones, dtype=np.uint32)
+        return ((bits[:, None] >> shifts) & 1).astype(bool)
+
+    def _slots(self, track_ids, frame_index):
+        slots = np.empty(len(track_ids), dtype=np.int64)
+        found = np.zeros(len(track_ids), dtype=bool)
+
+        # 保持中のIDを整列して二分探索
+        held = np.flatnonzero(self.ids >= 0)
+        if len(held):
+            order = held[np.argsort(self.ids[held])]
+            sorted_ids = self.ids[order]
+            pos = np.minimum(np.searchsorted(sorted_ids, track_ids), len(order) - 1)
+            found = sorted_ids[pos] == track_ids
+            slots[found] = order[pos[found]]
+
+        new = ~found
+        n_new = int(np.count_nonzero(new))
+        if n_new:
+            free = np.flatnonzero(self.ids < 0)
+            if len(free) < n_new:
+                self._grow(max(len(self.ids) * 2, len(self.ids) + n_new))
+                free = np.flatnonzero(self.ids < 0)
+            new_slots = free[:n_new]
+            slots[new] = new_slots
+            self.ids[new_slots] = track_ids[new]
+            self.first_seen[new_slots] = frame_index
+            self.inside[new_slots] = 0
+            self.last_alert[new_slots] = NEVER
+        return slots, found
+
+    def update(self, frame_index, xyxy, track_ids):
+        """
+        Updates the dwell of the persons of a frame.
+
+        Args:
+            frame_index (int): The current frame number; the frames skipped since a
+                held track was last seen count toward its dwell, up to `ttl`.
+            xyxy (numpy.ndarray): The bbox coordinates of the persons, shape (N, 4).
+            track_ids (numpy.ndarray): The tracker IDs of the persons, shape (N,).
+
+        Returns:
+            tuple: Three arrays of shape (N,): the dwell in frames, whether the dwell
+            reached the threshold, and whether the track raises a new alert now.
+        """
+
+        # 消去は処理したフレーム数で数える（フレーム番号が飛んでも追跡を保つ）
+        self.updates += 1
+        self.evict()
+        if not len(track_ids):
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty.astype(bool), empty.astype(bool)
+
+        slots, held = self._slots(track_ids.astype(np.int64), frame_index)
+        # 飛ばしたフレームも映像の経過として滞在に加える（最大ttlフレーム）
+        step = np.ones(len(slots), dtype=np.int32)
+        step[held] = np.clip(frame_index - self.last_seen[slots[held]], 1, self.ttl)
+        self.last_seen[slots] = frame_index
+        self.last_update[slots] = self.updates
+        self.inside[slots] += self.zones_of(xyxy) * step[:, None]
+
+        dwell = self.inside[slots].max(axis=1)
+        is_over = dwell >= self.thr
+        is_alert = is_over & (frame_index - self.last_alert[slots] >= self.cooldown)
+        self.last_alert[slots[is_alert]] = frame_index
+        return dwell, is_over, is_alert
@@ -0,0 +1,171 @@
+import atexit
+import json
+import logging
+import queue
+import threading
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+# ログ行の書式（--log_jsonを付けない場合）
+TEXT_FORMAT = "{asctime} [{levelname:.4}] {message}"
+
+# JSONに書き出すextraの属性
+JSON_FIELDS = ("camera", "frame", "suppressed")
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Limits the records of every call site, so a message repeated every frame cannot flood the log.
+
+    Each call site (file and line) has a token bucket of `burst` records refilled
+    at `rate` records per second; the records over the limit are counted and the
+    count is appended to the next record let through. Warnings and errors are
+    never limited, so failures are always written. Records logged with
+    `extra={"sample": True}` are per-frame records: only one in every
+    `1 / sample` of them is kept, before the rate limit.
+
+    Attributes:
+        rate (float): The records per second of a call site (0: unlimited).
+        burst (int): The records a call site may log at once.
+        sample (float): The fraction of the per-frame records kept (0: none).
+        suppressed (int): The records dropped by the rate limit so far.
+    """
+
+    def __init__(self, rate=5.0, burst=20, sample=0.0):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.sample = sample
+        self.suppressed = 0
+        # 呼び出し箇所ごとの [トークン, 最終時刻, 抑制数, 件数]
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno)
+        sampled = getattr(record, "sample", False)
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                site = self._sites[key] = [float(self.burst), record.created, 0, 0]
+            if sampled:
+                if self.sample <= 0:
+                    return False
+                site[3] += 1
+                # 件数ベースで間引く（乱数を使わず決定的に）
+                if (site[3] - 1) % max(1, round(1 / self.sample)):
+                    return False
+            if self.rate > 0:
+                site[0] = min(
+                    float(self.burst), site[0] + (record.created - site[1]) * self.rate
+                )
+                site[1] = record.created
+                if site[0] < 1.0:
+                    site[2] += 1
+                    self.suppressed += 1
+                    return False
+                site[0] -= 1.0
+            suppressed, site[2] = site[2], 0
+        if suppressed:
+            record.suppressed = suppressed
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON line with its camera and frame when given in `extra`.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        for field in JSON_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    A queue handler that drops the records when the writer falls behind instead of blocking the caller.
+
+    Attributes:
+        dropped (int): The records dropped on a full queue.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 例外のトレースバックは書き込みスレッドで整形する
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(
+    path, level=logging.INFO, json_lines=False, rate=5.0, burst=20, sample=0.0
+):
+    """
+    Sends the records of the root logger through a queue to a background writer thread.
+
+    The calling threads only filter the record and put it on a bounded queue;
+    the file is formatted and written by a QueueListener thread, which is
+    flushed and stopped at exit.
+
+    Args:
+        path (str): The log file.
+        level (int): The level of the root logger.
+        json_lines (bool): True to write JSON lines instead of text.
+        rate (float): The records per second of a call site (0: unlimited).
+        burst (int): The records a call site may log at once.
+        sample (float): The fraction of the per-frame records kept (0: none).
+
+    Returns:
+        QueueListener: The started background writer.
+    """
+
+    handler = logging.FileHandler(path)
+    if json_lines:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT, style="{"))
+
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=10000))
+    queue_handler.addFilter(RateLimitFilter(rate, burst, sample))
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+        old.close()
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = QueueListener(queue_handler.queue, handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,398 @@
+import bisect
+import cProfile
+import logging
+import pstats
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# レイテンシのヒストグラムの上限（秒）
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def format_labels(labels):
+    """
+    Formats the labels of a series in the Prometheus text format.
+
+    Args:
+        labels (dict): The label values by name.
+
+    Returns:
+        str: The labels in braces, or an empty string without labels.
+    """
+
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{escape(value)}"' for key, value in labels.items())
+    return f"{{{pairs}}}"
+
+
+def escape(value):
+    # ラベル値のバックスラッシュ、引用符、改行をエスケープ
+    return (
+        str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    )
+
+
+class Histogram:
+    """
+    A running histogram with fixed buckets, cheap enough to observe every frame.
+
+    Each histogram is observed by one thread; the scrape only reads it.
+
+    Attributes:
+        labels (dict): The label values of the series.
+        buckets (tuple[float]): The upper bounds of the buckets.
+        counts (list[int]): The observations of every bucket, the last one above all bounds.
+        sum (float): The sum of the observations.
+        count (int): The number of observations.
+    """
+
+    def __init__(self, labels=None, buckets=LATENCY_BUCKETS):
+        self.labels = labels or {}
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """
+        Records one observation.
+
+        Args:
+            value (float): The observed value, in seconds for latencies.
+
+        Returns:
+            None
+        """
+
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name):
+        """
+        Formats the cumulative buckets, sum and count.
+
+        Args:
+            name (str): The name of the metric.
+
+        Returns:
+            list[str]: The sample lines.
+        """
+
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            labels = format_labels({**self.labels, "le": le})
+            lines.append(f"{name}_bucket{labels} {cumulative}")
+        labels = format_labels(self.labels)
+        lines.append(f"{name}_sum{labels} {self.sum:.6f}")
+        lines.append(f"{name}_count{labels} {self.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    The metrics exposed on `/metrics`.
+
+    Histograms are observed on the hot path; counters and gauges are callbacks
+    that read the existing counters of the stages only when the endpoint is
+    scraped, so they cost nothing per frame.
+    """
+
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _series(self, name, kind, help):
+        with self._lock:
+            if name not in self._families:
+                self._families[name] = (kind, help, [])
+            return self._families[name][2]
+
+    def histogram(self, name, help, labels=None, buckets=LATENCY_BUCKETS):
+        """
+        Registers a histogram series.
+
+        Args:
+            name (str): The name of the metric.
+            help (str): The description of the metric.
+            labels (dict or None): The label values of the series.
+            buckets (tuple[float]): The upper bounds of the buckets.
+
+        Returns:
+            Histogram: The histogram to observe.
+        """
+
+        histogram = Histogram(labels, buckets)
+        self._series(name, "histogram", help).append(histogram)
+        return histogram
+
+    def counter(self, name, help, func, labels=None):
+        """
+        Registers a counter read from a callback at scrape time.
+
+        Args:
+            name (str): The name of the metric, ending with `_total`.
+            help (str): The description of the metric.
+            func (callable): Returns the current value.
+            labels (dict or None): The label values of the series.
+
+        Returns:
+            None
+        """
+
+        self._series(name, "counter", help).append((labels or {}, func))
+
+    def gauge(self, name, help, func, labels=None):
+        """
+        Registers a gauge read from a callback at scrape time.
+
+        Args:
+            name (str): The name of the metric.
+            help (str): The description of the metric.
+            func (callable): Returns the current value.
+            labels (dict or None): The label values of the series.
+
+        Returns:
+            None
+        """
+
+        self._series(name, "gauge", help).append((labels or {}, func))
+
+    def render(self):
+        """
+        Formats every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics.
+        """
+
+        with self._lock:
+            families = [
+                (name, kind, help, list(series))
+                for name, (kind, help, series) in self._families.items()
+            ]
+        lines = []
+        for name, kind, help, series in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for item in series:
+                if isinstance(item, Histogram):
+                    lines.extend(item.samples(name))
+                    continue
+                labels, func = item
+                try:
+                    value = float(func())
+                except Exception as e:
+                    logging.debug(f"metric {name} failed: {e}")
+                    continue
+                lines.append(f"{name}{format_labels(labels)} {value!r}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Serves the registry of the server on `GET /metrics`.
+    """
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f"metrics {self.address_string()} {format % args}")
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """
+    A local HTTP server exposing the metrics in the Prometheus text format.
+
+    Attributes:
+        registry (MetricsRegistry): The exposed metrics.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port, registry, host="127.0.0.1"):
+        super().__init__((host, port), MetricsHandler)
+        self.registry = registry
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="metrics", daemon=True
+        )
+
+    def start(self):
+        """
+        Starts serving in a background thread.
+
+        Returns:
+            None
+        """
+
+        self._thread.start()
+        host, port = self.server_address[:2]
+        print(f"Metrics: http://{host}:{port}/metrics")
+        logging.info(f"Metrics: http://{host}:{port}/metrics")
+
+    def close(self):
+        """
+        Stops the server.
+
+        Returns:
+            None
+        """
+
+        self.shutdown()
+        self.server_close()
+
+
+class FrameProfiler:
+    """
+    Profiles every pipeline thread with cProfile while the sink handles a window of frames.
+
+    cProfile only sees the thread it is enabled on, so each stage thread gets its
+    own profile, enabled around the items it processes inside the window. The
+    profiles are merged into one pstats file, readable by `pstats`, snakeviz or
+    `flameprof`. When the window closes no stage enables its profile any more,
+    and the dump waits for the stages still inside a profiled call, so no
+    profile is read while it is collecting.
+
+    Python 3.12+ allows only one active cProfile at a time (sys.monitoring), so
+    there one `stage` must be chosen; on earlier versions all stages are
+    profiled unless a stage is given.
+
+    Attributes:
+        start (int): The sink frame the window starts at.
+        end (int): The sink frame the window ends at.
+        path (str): The output pstats file.
+        stage (str or None): The only stage profiled (None: every stage).
+        active (bool): True inside the window.
+        done (bool): True once the profile was written.
+    """
+
+    def __init__(self, start, frames, path, stage=None):
+        if stage is None and sys.version_info >= (3, 12):
+            raise ValueError(
+                "Python 3.12+ runs one cProfile at a time; choose the profiled stage"
+            )
+        self.start = start
+        self.end = start + frames
+        self.path = path
+        self.stage = stage
+        self.active = False
+        self.done = False
+        self._profiles = {}
+        # プロファイル中の呼び出しがあるスレッド
+        self._running = set()
+        self._idle = threading.Condition()
+
+    def tick(self, frames):
+        """
+        Opens or closes the window from the number of frames the sink handled.
+
+        Args:
+            frames (int): The frames handled by the sink so far.
+
+        Returns:
+            None
+        """
+
+        if self.done:
+            return
+        if not self.active and frames >= self.start:
+            self.active = True
+            logging.info(f"profiling frames {self.start} to {self.end}")
+        elif self.active and frames >= self.end:
+            self.active = False
+            self.dump()
+
+    def run(self, func, *args, stage=None):
+        """
+        Calls a stage function, profiling it inside the window.
+
+        Args:
+            func (callable): The stage function.
+            *args: Its arguments.
+            stage (str or None): The name of the stage (None: the name of the thread).
+
+        Returns:
+            The result of the function.
+        """
+
+        name = stage or threading.current_thread().name
+        if not self.active or (self.stage is not None and name != self.stage):
+            return func(*args)
+        with self._idle:
+            # 窓が閉じた後は有効にしない
+            if self.done or not self.active:
+                profile = None
+            else:
+                profile = self._profiles.setdefault(name, cProfile.Profile())
+                self._running.add(name)
+        if profile is None:
+            return func(*args)
+        profile.enable()
+        try:
+            return func(*args)
+        finally:
+            profile.disable()
+            with self._idle:
+                self._running.discard(name)
+                self._idle.notify_all()
+
+    def dump(self, timeout=5.0):
+        """
+        Writes the merged profiles of all threads.
+
+        Waits up to `timeout` seconds for the stages still inside a profiled call;
+        the profiles of those that do not return in time are left out.
+
+        Args:
+            timeout (float): The seconds to wait for the running calls.
+
+        Returns:
+            None
+        """
+
+        with self._idle:
+            if self.done:
+                return
+            self.done = True
+            self.active = False
+            self._idle.wait_for(lambda: not self._running, timeout)
+            profiles = [
+                profile
+                for name, profile in self._profiles.items()
+                if name not in self._running
+            ]
+        if not profiles:
+            return
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(self.path)
+        print(f"Profile: {self.path}")
+        logging.info(f"Profile of {len(profiles)} threads: {self.path}")
@@ -0,0 +1,116 @@
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """
+    Skips the detector while nothing moves in the scene.
+
+    Each frame is downscaled, converted to gray and compared with the frame the last
+    result belongs to. When fewer than `sensitivity` of the pixels changed, the last
+    result is reused instead of running YOLOv8. So an empty corridor stays on the
+    "no person" path, and a person standing still keeps the dwell counter going until
+    the next forced refresh re-checks the scene.
+
+    Attributes:
+        sensitivity (float): The fraction of changed pixels that counts as motion.
+        refresh (int): The number of frames after which the detector runs regardless of motion.
+        width (int): The width of the downscaled frame.
+        pixel_thr (int): The gray level difference that marks a pixel as changed.
+        gated (int): The number of frames that reused the last result.
+        passed (int): The number of frames passed to the detector because of motion.
+        forced (int): The number of frames passed to the detector by the forced refresh.
+    """
+
+    def __init__(self, sensitivity=0.002, refresh=30, width=160, pixel_thr=25):
+        self.sensitivity = sensitivity
+        self.refresh = refresh
+        self.width = width
+        self.pixel_thr = pixel_thr
+
+        self.gated = 0
+        self.passed = 0
+        self.forced = 0
+
+        self._reference = None
+        self._current = None
+        self._since_refresh = 0
+        self._detections = None
+
+    def is_static(self, frame):
+        """
+        Tells whether the frame can reuse the last result.
+
+        Args:
+            frame (numpy.ndarray): The BGR frame.
+
+        Returns:
+            bool: True if nothing moved since the last result, False if the detector has to run.
+        """
+
+        h, w = frame.shape[:2]
+        size = (self.width, max(h * self.width // w, 1))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        self._current = gray
+
+        if self._reference is None or self._reference.shape != gray.shape:
+            self.passed += 1
+            return False
+        if self._since_refresh >= self.refresh:
+            self.forced += 1
+            return False
+
+        # 参照フレームから変化した画素の割合
+        diff = cv2.absdiff(gray, self._reference)
+        changed = np.count_nonzero(diff > self.pixel_thr) / diff.size
+        if changed >= self.sensitivity:
+            self.passed += 1
+            return False
+
+        self.gated += 1
+        self._since_refresh += 1
+        return True
+
+    def remember(self, packet):
+        """
+        Stores the result of a frame that went through the detector as the new reference.
+
+        Args:
+            packet (FramePacket): The tracked frame.
+
+        Returns:
+            None
+        """
+
+        self._reference = self._current
+        self._since_refresh = 0
+        self._detections = packet.detections
+
+    def reuse(self, packet):
+        """
+        Fills a static frame with the last result.
+
+        Args:
+            packet (FramePacket): The frame that skipped the detector.
+
+        Returns:
+            None
+        """
+
+        packet.detections = self._detections
+
+    def summary(self):
+        """
+        Formats the gate counters.
+
+        Returns:
+            str: A line with the gated, passed and forced frames.
+        """
+
+        total = self.gated + self.passed + self.forced
+        ratio = self.gated / total if total else 0.0
+        return (
+            f"motion: {self.gated} gated ({ratio:.0%}), {self.passed} passed, "
+            f"{self.forced} forced"
+        )
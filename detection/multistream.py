@@ -0,0 +1,146 @@
+import logging
+import queue
+import threading
+import time
+
+from detection.pipeline import STOP, FramePacket
+from detection.tracking import load_tracker, update_tracker
+
+
+class StreamCapture(threading.Thread):
+    """
+    Reads the frames of one source into a small queue.
+
+    For a live source the oldest queued frame is dropped when the queue is full, so the
+    gatherer always gets a recent frame. For a video file the reader waits instead,
+    so no frame is skipped.
+    """
+
+    def __init__(self, stream, cap, live, stop_event, maxsize=2):
+        super().__init__(name=f"capture{stream}", daemon=True)
+        self.stream = stream
+        self.cap = cap
+        self.live = live
+        self.stop_event = stop_event
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.index = 0
+        self.dropped = 0
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set() and self.cap.isOpened():
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+                self.index += 1
+                self._put(
+                    FramePacket(self.index, frame, time.perf_counter(), self.stream)
+                )
+        except Exception as e:
+            logging.exception(f"Stream {self.stream} failed: {e}")
+        finally:
+            self._put(STOP, force=True)
+
+    def _put(self, item, force=False):
+        if self.live or force:
+            # 最新フレーム優先：満杯なら古いフレームを捨てる
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    return
+                except queue.Full:
+                    try:
+                        self.queue.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+
+class BatchGatherer:
+    """
+    The source stage of the multi-stream pipeline: gathers one frame from every running stream.
+
+    A stream that has no frame within `timeout` seconds is left out of the batch,
+    so a stalled camera does not hold back the others.
+    """
+
+    def __init__(self, captures, timeout=0.5):
+        self.captures = captures
+        self.active = list(captures)
+        self.timeout = timeout
+
+    def __call__(self):
+        """
+        Collects the next batch of frames.
+
+        Returns:
+            list[FramePacket] or None: One packet per stream that produced a frame, or None when all streams ended.
+        """
+
+        while self.active:
+            batch = []
+            for capture in list(self.active):
+                try:
+                    item = capture.queue.get(timeout=self.timeout)
+                except queue.Empty:
+                    continue
+                if item is STOP:
+                    self.active.remove(capture)
+                    logging.info(f"Stream {capture.stream} finished")
+                    continue
+                batch.append(item)
+            if batch:
+                return batch
+        return None
+
+
+class MultiStreamTracker:
+    """
+    Runs one batched YOLOv8 forward pass for a batch of streams and tracks each stream separately.
+
+    The Ultralytics tracker callbacks keep one tracker per batch position, which breaks
+    when the batch composition changes. Here every stream owns its tracker, created from
+    the tracker config by `load_tracker()`.
+    """
+
+    def __init__(self, model, frame_rates, tracker="botsort.yaml"):
+        self.model = model
+        self.trackers = [load_tracker(tracker, fps) for fps in frame_rates]
+
+    def __call__(self, batch):
+        """
+        Detects and tracks the objects of every frame in the batch.
+
+        Args:
+            batch (list[FramePacket]): One frame per stream.
+
+        Returns:
+            list[FramePacket]: The packets with the tracked boxes.
+        """
+
+        # 全ストリームをまとめて1回で推論
+        results = self.model.predict([packet.frame for packet in batch], verbose=False)
+        for packet, result in zip(batch, results):
+            packet.set_result(self.update(packet.stream, result, packet.frame))
+        return batch
+
+    def update(self, stream, result, frame):
+        """
+        Associates the detections of one frame with the tracks of its stream.
+
+        Args:
+            stream (int): The index of the stream.
+            result (ultralytics.engine.results.Results): The detections of the frame.
+            frame (numpy.ndarray): The frame, used by BoT-SORT for camera motion compensation.
+
+        Returns:
+            ultralytics.engine.results.Results: The result restricted to the tracked boxes, with IDs.
+        """
+
+        return update_tracker(self.trackers[stream], result, frame)
@@ -0,0 +1,427 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from detection import detections
+
+# 各ステージの終了を下流へ伝える番兵
+STOP = object()
+
+
+class FramePacket:
+    """
+    A single frame travelling through the pipeline together with its inference results.
+
+    Attributes:
+        index (int): The frame number counted from the start of the capture.
+        frame (numpy.ndarray): The BGR frame read from the capture.
+        captured_at (float): The `time.perf_counter()` value when the frame was read.
+        stream (int): The index of the source the frame was read from.
+        timestamp (float): The UNIX time when the packet was created.
+        detections (numpy.ndarray): The tracked objects as a structured array of DETECTION_DTYPE.
+    """
+
+    __slots__ = ("index", "frame", "captured_at", "stream", "timestamp", "detections")
+
+    def __init__(self, index, frame, captured_at, stream=0):
+        self.index = index
+        self.frame = frame
+        self.captured_at = captured_at
+        self.stream = stream
+        self.timestamp = time.time()
+        self.detections = None
+
+    def set_result(self, result):
+        """
+        Copies the tracked boxes of an Ultralytics result onto the packet.
+
+        Args:
+            result (ultralytics.engine.results.Results): The tracking result of the frame.
+
+        Returns:
+            None
+        """
+
+        # 物体がないフレームは空の配列（通常のケースとして扱う）
+        self.detections = detections.from_result(result)
+
+
+class StageStats:
+    """
+    Throughput statistics of a single pipeline stage.
+
+    Attributes:
+        name (str): The name of the stage.
+        frames (int): The number of frames processed by the stage.
+        busy (float): The seconds spent inside the stage function.
+        waited (float): The seconds spent blocked on a full output queue.
+        samples (list[float] or None): The latency of every frame, if recorded.
+        histogram (Histogram or None): The latency histogram exposed as a metric.
+    """
+
+    def __init__(self, name, record=False):
+        self.name = name
+        self.frames = 0
+        self.busy = 0.0
+        self.waited = 0.0
+        self.samples = [] if record else None
+        self.histogram = None
+        self.started = time.perf_counter()
+
+    def add(self, busy):
+        """
+        Records one processed frame.
+
+        Args:
+            busy (float): The seconds spent processing the frame.
+
+        Returns:
+            None
+        """
+
+        self.frames += 1
+        self.busy += busy
+        if self.samples is not None:
+            self.samples.append(busy)
+        if self.histogram is not None:
+            self.histogram.observe(busy)
+
+    def summary(self):
+        """
+        Formats the statistics of the stage.
+
+        Returns:
+            str: A line with the frame count, wall-clock FPS, capacity FPS and utilization.
+        """
+
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        fps = self.frames / elapsed
+        capacity = self.frames / self.busy if self.busy else 0.0
+        return (
+            f"{self.name}: {self.frames} frames, {fps:.1f} fps "
+            f"(capacity {capacity:.1f} fps, busy {self.busy / elapsed:.0%}, "
+            f"blocked {self.waited:.1f}s)"
+        )
+
+
+class LatencyMeter:
+    """
+    Keeps the latest latency samples of one measurement point.
+
+    Attributes:
+        name (str): The name of the measurement.
+        count (int): The number of samples so far.
+        samples (collections.deque): The latest samples in seconds.
+    """
+
+    def __init__(self, name, window=1000):
+        self.name = name
+        self.count = 0
+        self.samples = deque(maxlen=window)
+
+    def add(self, seconds):
+        """
+        Records one latency sample.
+
+        Args:
+            seconds (float): The latency.
+
+        Returns:
+            None
+        """
+
+        self.count += 1
+        self.samples.append(seconds)
+
+    def summary(self):
+        """
+        Formats the percentiles of the latest samples.
+
+        Returns:
+            str: A line with the p50, p90, p99 and max latency in milliseconds.
+        """
+
+        if not self.samples:
+            return f"{self.name}: no samples"
+        ms = np.asarray(self.samples) * 1000
+        p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+        return (
+            f"{self.name}: p50 {p50:.1f}ms, p90 {p90:.1f}ms, p99 {p99:.1f}ms, "
+            f"max {ms.max():.1f}ms (last {len(ms)} of {self.count} frames)"
+        )
+
+
+class Stage(threading.Thread):
+    """
+    A worker thread that applies a function to each item of its input queue.
+
+    A stage started without an input queue is a source: it calls the function
+    repeatedly until it returns None or the pipeline is stopped.
+    When a stage function returns None for an input item, the item is dropped.
+    """
+
+    def __init__(self, name, func, inbox, outbox, stop_event, on_error, record=False):
+        super().__init__(name=name, daemon=True)
+        self.func = func
+        self.inbox = inbox
+        self.outbox = outbox
+        self.stop_event = stop_event
+        self.on_error = on_error
+        self.stats = StageStats(name, record)
+        self.profiler = None
+
+    def run(self):
+        try:
+            if self.inbox is None:
+                self._run_source()
+            else:
+                self._run_worker()
+        except Exception as e:
+            self.on_error(self.name, e)
+            self._drain()
+        finally:
+            # 下流のステージがバッファを流しきれるよう、必ず番兵を送る
+            self.outbox.put(STOP)
+
+    def _run_source(self):
+        while not self.stop_event.is_set():
+            start = time.perf_counter()
+            if self.profiler is None:
+                item = self.func()
+            else:
+                item = self.profiler.run(self.func, stage=self.name)
+            if item is None:
+                break
+            self.stats.add(time.perf_counter() - start)
+            self._put(item)
+
+    def _run_worker(self):
+        while True:
+            item = self.inbox.get()
+            if item is STOP:
+                break
+            start = time.perf_counter()
+            if self.profiler is None:
+                item = self.func(item)
+            else:
+                item = self.profiler.run(self.func, item, stage=self.name)
+            self.stats.add(time.perf_counter() - start)
+            if item is not None:
+                self._put(item)
+
+    def _drain(self):
+        # 上流がブロックしたままにならないよう、番兵まで読み捨てる
+        if self.inbox is None:
+            return
+        while self.inbox.get() is not STOP:
+            pass
+
+    def _put(self, item):
+        # キューが満杯なら上流をブロックする（バックプレッシャ）
+        start = time.perf_counter()
+        self.outbox.put(item)
+        self.stats.waited += time.perf_counter() - start
+
+
+class Pipeline:
+    """
+    A linear chain of stages connected by bounded queues.
+
+    The first stage is a source, every following stage runs on its own thread,
+    and the sink runs on the calling thread so that HighGUI calls stay on the main thread.
+    On shutdown the source stops reading and every frame already queued is
+    still handed to the sink before `run()` returns.
+    With `record=True` the latency of every frame is kept for each stage, and
+    the capture-to-sink latency of every frame is kept in `end_to_end`.
+    With a metrics registry the stage latencies, frame counts and queue depths are
+    exposed as metrics, and a profiler profiles the stages for a window of frames;
+    without them the stages only pay a None check per frame.
+    """
+
+    def __init__(
+        self, maxsize=4, report_interval=10.0, record=False, metrics=None, profiler=None
+    ):
+        self.maxsize = maxsize
+        self.report_interval = report_interval
+        self.record = record
+        self.metrics = metrics
+        self.profiler = profiler
+        self.end_to_end_histogram = None
+        self.stop_event = threading.Event()
+        self.stages = []
+        self.sink_stats = None
+        self.end_to_end = [] if record else None
+        self.reports = []
+        self.error = None
+        self._queue = None
+
+    def add_source(self, name, func):
+        """
+        Adds the source stage that produces the items.
+
+        Args:
+            name (str): The name of the stage.
+            func (callable): A function without arguments that returns the next item or None at the end.
+
+        Returns:
+            None
+        """
+
+        self._add(name, func, inbox=None)
+
+    def add_stage(self, name, func):
+        """
+        Adds a processing stage after the last one.
+
+        Args:
+            name (str): The name of the stage.
+            func (callable): A function that takes an item and returns the processed item or None to drop it.
+
+        Returns:
+            None
+        """
+
+        self._add(name, func, inbox=self._queue)
+
+    def _add(self, name, func, inbox):
+        outbox = queue.Queue(maxsize=self.maxsize)
+        stage = Stage(
+            name, func, inbox, outbox, self.stop_event, self._on_error, self.record
+        )
+        stage.profiler = self.profiler
+        if self.metrics is not None:
+            self._register(stage.stats)
+            self.metrics.gauge(
+                "detection_queue_depth",
+                "Items waiting in the output queue of a stage",
+                outbox.qsize,
+                {"stage": name},
+            )
+        self.stages.append(stage)
+        self._queue = outbox
+
+    def _register(self, stats):
+        labels = {"stage": stats.name}
+        stats.histogram = self.metrics.histogram(
+            "detection_stage_seconds", "Time spent in a stage per item", labels
+        )
+        self.metrics.counter(
+            "detection_stage_blocked_seconds_total",
+            "Time a stage waited on its full output queue",
+            lambda: stats.waited,
+            labels,
+        )
+
+    def _on_error(self, name, e):
+        logging.exception(f"Stage {name} failed: {e}")
+        self.error = e
+        self.stop()
+
+    def stop(self):
+        """
+        Asks the source to stop reading; queued frames are still flushed to the sink.
+
+        Returns:
+            None
+        """
+
+        self.stop_event.set()
+
+    def run(self, name, sink):
+        """
+        Starts the stages and feeds their output into the sink on the calling thread.
+
+        Args:
+            name (str): The name of the sink stage.
+            sink (callable): A function that takes an item and returns False to stop the pipeline.
+
+        Returns:
+            None
+        """
+
+        self.sink_stats = StageStats(name, self.record)
+        if self.metrics is not None:
+            self._register(self.sink_stats)
+            self.end_to_end_histogram = self.metrics.histogram(
+                "detection_end_to_end_seconds", "Time from capture to the end of the sink"
+            )
+        for stage in self.stages:
+            stage.start()
+
+        last_report = time.perf_counter()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is STOP:
+                    break
+                start = time.perf_counter()
+                if self.profiler is None:
+                    stopped = sink(item) is False
+                else:
+                    stopped = self.profiler.run(sink, item, stage=name) is False
+                    self.profiler.tick(self.sink_stats.frames + 1)
+                if stopped:
+                    self.stop()
+                end = time.perf_counter()
+                self.sink_stats.add(end - start)
+                if self.end_to_end is not None or self.end_to_end_histogram is not None:
+                    for packet in item if isinstance(item, list) else [item]:
+                        if self.end_to_end is not None:
+                            self.end_to_end.append(end - packet.captured_at)
+                        if self.end_to_end_histogram is not None:
+                            self.end_to_end_histogram.observe(end - packet.captured_at)
+
+                if self.report_interval and start - last_report >= self.report_interval:
+                    last_report = start
+                    logging.info("\n".join(self.summary()))
+        except BaseException:
+            self.stop()
+            while self._queue.get() is not STOP:
+                pass
+            raise
+        finally:
+            for stage in self.stages:
+                stage.join()
+            if self.profiler is not None:
+                # 窓の途中で終わっても集めた分を書き出す
+                self.profiler.dump()
+
+    def stats(self):
+        """
+        Returns the statistics of all stages.
+
+        Returns:
+            list[StageStats]: One entry per stage, in pipeline order, the sink last.
+        """
+
+        stats = [stage.stats for stage in self.stages]
+        if self.sink_stats is not None:
+            stats.append(self.sink_stats)
+        return stats
+
+    def add_report(self, report):
+        """
+        Adds a line to the periodic report and the summary.
+
+        Args:
+            report (callable): A function without arguments that returns the line.
+
+        Returns:
+            None
+        """
+
+        self.reports.append(report)
+
+    def summary(self):
+        """
+        Formats the statistics of all stages.
+
+        Returns:
+            list[str]: One line per stage, in pipeline order, then the added reports.
+        """
+
+        return [s.summary() for s in self.stats()] + [r() for r in self.reports]
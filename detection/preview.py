@@ -0,0 +1,147 @@
+import logging
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+
+BOUNDARY = b"frame"
+
+
+class PreviewHandler(BaseHTTPRequestHandler):
+    """
+    Streams the JPEG frames of one stream as MJPEG (`multipart/x-mixed-replace`).
+
+    `GET /` serves stream 0, `GET /<index>` serves the stream with that index.
+    """
+
+    def do_GET(self):
+        try:
+            stream = int(self.path.strip("/") or 0)
+        except ValueError:
+            self.send_error(404)
+            return
+
+        server = self.server
+        self.send_response(200)
+        self.send_header(
+            "Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY.decode()}"
+        )
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        with server.condition:
+            server.clients[stream] += 1
+        seq = -1
+        try:
+            while not server.closed:
+                with server.condition:
+                    server.condition.wait_for(
+                        lambda: server.closed
+                        or server.frames.get(stream, (seq,))[0] != seq,
+                        timeout=1.0,
+                    )
+                    item = server.frames.get(stream)
+                if item is None or item[0] == seq:
+                    continue
+                seq, jpeg = item
+                self.wfile.write(
+                    b"--%s\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n"
+                    % (BOUNDARY, len(jpeg))
+                )
+                self.wfile.write(jpeg)
+                self.wfile.write(b"\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with server.condition:
+                server.clients[stream] -= 1
+
+    def log_message(self, format, *args):
+        logging.debug(f"preview {self.address_string()} {format % args}")
+
+
+class PreviewServer(ThreadingHTTPServer):
+    """
+    A local HTTP server that previews the annotated frames as MJPEG.
+
+    Frames are JPEG-encoded only while a client watches the stream,
+    and at most `fps` times per second, so an unwatched preview costs nothing.
+
+    Attributes:
+        interval (float): The minimum seconds between two encoded frames of a stream.
+        quality (int): The JPEG quality of the preview.
+        clients (collections.Counter): The number of connected clients per stream.
+        frames (dict): The sequence number and JPEG bytes of the latest frame per stream.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port, fps=5, quality=70, host="127.0.0.1"):
+        super().__init__((host, port), PreviewHandler)
+        self.interval = 1 / fps
+        self.quality = quality
+        self.condition = threading.Condition()
+        self.clients = Counter()
+        self.frames = {}
+        self.closed = False
+        self._last_encode = {}
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="preview", daemon=True
+        )
+
+    def start(self):
+        """
+        Starts serving in a background thread.
+
+        Returns:
+            None
+        """
+
+        self._thread.start()
+        host, port = self.server_address[:2]
+        print(f"Preview: http://{host}:{port}/")
+        logging.info(f"Preview: http://{host}:{port}/")
+
+    def publish(self, frame, stream=0):
+        """
+        Offers a frame to the clients of a stream.
+
+        Args:
+            frame (numpy.ndarray): The annotated BGR frame.
+            stream (int): The index of the stream.
+
+        Returns:
+            None
+        """
+
+        # 見ているクライアントがいなければエンコードしない
+        if not self.clients[stream]:
+            return
+        now = time.perf_counter()
+        if now - self._last_encode.get(stream, 0.0) < self.interval:
+            return
+        self._last_encode[stream] = now
+
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return
+        with self.condition:
+            seq = self.frames.get(stream, (0,))[0] + 1
+            self.frames[stream] = (seq, buf.tobytes())
+            self.condition.notify_all()
+
+    def close(self):
+        """
+        Disconnects the clients and stops the server.
+
+        Returns:
+            None
+        """
+
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.shutdown()
+        self.server_close()
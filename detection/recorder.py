@@ -0,0 +1,230 @@
+import glob
+import logging
+import os
+import queue
+import re
+import threading
+
+import cv2
+
+# ワーカーの終了を伝える番兵
+STOP = object()
+
+# 既定の出力名の先頭に付く実行時刻（"%Y%m%d_%Hh%Mm%Ss_"）
+RUN_STAMP = re.compile(r"^\d{8}_\d{2}h\d{2}m\d{2}s_")
+RUN_STAMP_GLOB = "[0-9]" * 8 + "_[0-9][0-9]h[0-9][0-9]m[0-9][0-9]s_"
+# セグメント番号（5桁）
+NUMBER_GLOB = "[0-9]" * 5
+
+
+def segment_pattern(path):
+    """
+    Builds the glob of the segments of an output path, over all runs.
+
+    The run timestamp at the start of the default output names is replaced by a
+    wildcard, so the segments of earlier runs count toward the disk budget too.
+
+    Args:
+        path (str): The output path.
+
+    Returns:
+        str: The glob of the segments `<stem>_<number><ext>` of every run.
+    """
+
+    directory, name = os.path.split(path)
+    stem, ext = os.path.splitext(name)
+    match = RUN_STAMP.match(stem)
+    prefix = ""
+    if match:
+        prefix, stem = RUN_STAMP_GLOB, stem[match.end() :]
+    return os.path.join(
+        glob.escape(directory),
+        f"{prefix}{glob.escape(stem)}_{NUMBER_GLOB}{glob.escape(ext)}",
+    )
+
+
+def last_segment(path):
+    """
+    Finds the highest segment number already used by an output path.
+
+    Args:
+        path (str): The output path.
+
+    Returns:
+        int: The last segment number (0: none).
+    """
+
+    stem, ext = os.path.splitext(path)
+    segments = glob.glob(f"{glob.escape(stem)}_{NUMBER_GLOB}{glob.escape(ext)}")
+    numbers = [int(os.path.splitext(segment)[0][-5:]) for segment in segments]
+    return max(numbers, default=0)
+
+
+class SegmentRecorder:
+    """
+    Records the output video on a background thread, split into fixed-length segments.
+
+    `write()` only queues the frame (it waits when the queue is full, like the other
+    pipeline stages). The worker resizes and encodes the frames, and every segment is
+    written into a hidden temporary file that is renamed when the segment is closed,
+    so a finished segment is always playable on its own and a crash only loses the
+    current one. Once the finished segments exceed the disk budget, the oldest are deleted,
+    including those of earlier runs (see `segment_pattern()`). A rerun with the same
+    output name continues the numbering instead of overwriting the old segments.
+    If the writer cannot be opened (an unsupported codec or an unwritable
+    directory), the error is logged once and the remaining frames are dropped.
+
+    Attributes:
+        path (str): The output path; segments are named `<stem>_<number><ext>`.
+        fps (float): The FPS of the recording after decimation.
+        frame_size (tuple): The width and height of the recorded frames.
+        segment_frames (int): The frames per segment (0: one file for the whole run).
+        stride (int): Only every `stride`-th frame is recorded.
+        budget (int): The disk budget of the segments in bytes (0: unlimited).
+        dropped (int): The number of frames that failed to encode.
+        failed (bool): True once the writer could not be opened.
+    """
+
+    def __init__(
+        self,
+        path,
+        fps,
+        frame_size,
+        segment_seconds=0,
+        codec="mp4v",
+        quality=0,
+        scale=1.0,
+        stride=1,
+        budget_mb=0,
+        maxsize=64,
+    ):
+        self.path = path
+        self.stride = max(stride, 1)
+        self.fps = (fps or 30.0) / self.stride
+        W, H = frame_size
+        self.frame_size = (int(W * scale), int(H * scale))
+        self.segment_frames = int(segment_seconds * self.fps)
+        self.codec = cv2.VideoWriter_fourcc(*codec)
+        self.quality = quality
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.dropped = 0
+        self.failed = False
+
+        self._stem, self._ext = os.path.splitext(path)
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._count = 0
+        self._segment = last_segment(path) if self.segment_frames else 0
+        self._segment_count = 0
+        self._video = None
+        self._tmp_path = None
+        self._final_path = None
+        self._thread = threading.Thread(target=self._run, name="record", daemon=True)
+        self._thread.start()
+
+    def write(self, frame):
+        """
+        Queues a frame for recording.
+
+        Args:
+            frame (numpy.ndarray): The BGR frame; the caller must not modify it afterwards.
+
+        Returns:
+            None
+        """
+
+        self._count += 1
+        # FPS間引き
+        if (self._count - 1) % self.stride:
+            return
+        self._queue.put(frame)
+
+    def release(self):
+        """
+        Encodes the queued frames, closes the current segment and stops the worker.
+
+        Returns:
+            None
+        """
+
+        self._queue.put(STOP)
+        self._thread.join()
+
+    def _run(self):
+        try:
+            while True:
+                frame = self._queue.get()
+                if frame is STOP:
+                    break
+                try:
+                    self._write(frame)
+                except Exception as e:
+                    self.dropped += 1
+                    logging.error(f"Failed to record a frame: {e}")
+        finally:
+            self._close()
+
+    def _write(self, frame):
+        if self.failed:
+            self.dropped += 1
+            return
+        if self._video is None or (
+            self.segment_frames and self._segment_count >= self.segment_frames
+        ):
+            self._close()
+            self._open()
+            if self._video is None:
+                self.dropped += 1
+                return
+        if frame.shape[1::-1] != self.frame_size:
+            frame = cv2.resize(frame, self.frame_size, interpolation=cv2.INTER_AREA)
+        self._video.write(frame)
+        self._segment_count += 1
+
+    def _open(self):
+        if self.segment_frames:
+            self._segment += 1
+            self._final_path = f"{self._stem}_{self._segment:05d}{self._ext}"
+        else:
+            self._final_path = self.path
+        directory, name = os.path.split(self._final_path)
+        self._tmp_path = os.path.join(directory, f".{name}.part{self._ext}")
+        self._video = cv2.VideoWriter(
+            self._tmp_path, self.codec, self.fps, self.frame_size
+        )
+        if not self._video.isOpened():
+            # 毎フレーム開き直さず、記録を止めて1回だけ報告
+            self._video = None
+            self.failed = True
+            logging.error(
+                f"Failed to open {self._tmp_path} for recording "
+                "(unsupported codec or unwritable directory); recording stopped"
+            )
+            return
+        if self.quality:
+            self._video.set(cv2.VIDEOWRITER_PROP_QUALITY, self.quality)
+        self._segment_count = 0
+
+    def _close(self):
+        if self._video is None:
+            return
+        self._video.release()
+        self._video = None
+        if not os.path.exists(self._tmp_path):
+            logging.error(f"Nothing was recorded into {self._final_path}")
+            return
+        os.replace(self._tmp_path, self._final_path)
+        logging.info(f"Recorded: {self._final_path}")
+        if self.budget:
+            self._enforce_budget()
+
+    def _enforce_budget(self):
+        # 以前の実行の分も含め、古いセグメントから削除
+        segments = sorted(glob.glob(segment_pattern(self.path)), key=os.path.getmtime)
+        sizes = [os.path.getsize(segment) for segment in segments]
+        total = sum(sizes)
+        for segment, size in zip(segments, sizes):
+            if total <= self.budget:
+                break
+            os.remove(segment)
+            total -= size
+            logging.info(f"Deleted old segment: {segment}")
@@ -0,0 +1,188 @@
+import logging
+import queue
+import time
+
+from detection.pipeline import STOP
+
+
+def allocate(budget, weights, limits, floor=0.2):
+    """
+    Splits an inference budget between the streams.
+
+    Every stream first gets an equal share of `floor * budget`, so a busy stream
+    never starves the others; the rest is shared by weight. No stream gets more
+    than its limit, and what it cannot use goes to the others.
+
+    Args:
+        budget (float): The frames per second inferred for all streams together.
+        weights (list[float]): The weight of every stream.
+        limits (list[float]): The highest useful rate of every stream (its FPS).
+        floor (float): The fraction of the budget shared equally.
+
+    Returns:
+        list[float]: The frames per second of every stream.
+    """
+
+    n = len(weights)
+    rates = [min(limit, floor * budget / n) for limit in limits]
+    left = budget - sum(rates)
+    active = [i for i in range(n) if rates[i] < limits[i]]
+    # 上限に達したストリームの余りを残りに配り直す
+    while left > 1e-6 and active:
+        total = sum(weights[i] for i in active)
+        if total <= 0:
+            break
+        extra = {i: left * weights[i] / total for i in active}
+        left = 0.0
+        for i in list(active):
+            give = min(extra[i], limits[i] - rates[i])
+            rates[i] += give
+            left += extra[i] - give
+            if rates[i] >= limits[i] - 1e-9:
+                active.remove(i)
+    return rates
+
+
+class BudgetScheduler:
+    """
+    The source stage of the multi-stream pipeline: takes frames from the streams within an inference budget.
+
+    The budget is split by `allocate()` every `interval` seconds with the weight
+    `priority * (1 + activity_gain * activity)`, where the activity is the recent
+    fraction of inferred frames with tracked objects. Each stream spends tokens
+    refilled at its rate, and a live stream that has no token keeps dropping its
+    old frames in its capture thread, so it is always served with a fresh one.
+
+    Attributes:
+        captures (list[StreamCapture]): The capture threads of the streams.
+        budget (float): The frames per second inferred for all streams together.
+        names (list[str]): The name of every stream.
+        priorities (list[float]): The priority of every stream.
+        limits (list[float]): The FPS of every stream.
+        rates (list[float]): The allocated frames per second of every stream.
+        fps (list[float]): The achieved frames per second of every stream.
+        activity (list[float]): The recent activity of every stream, from 0 to 1.
+    """
+
+    def __init__(
+        self,
+        captures,
+        budget,
+        names,
+        priorities,
+        limits,
+        floor=0.2,
+        activity_gain=3.0,
+        smoothing=0.05,
+        interval=1.0,
+    ):
+        n = len(captures)
+        self.captures = captures
+        self.active = list(captures)
+        self.budget = budget
+        self.names = names
+        self.priorities = priorities
+        self.limits = [limit or 30 for limit in limits]
+        self.floor = floor
+        self.activity_gain = activity_gain
+        self.smoothing = smoothing
+        self.interval = interval
+        self.activity = [0.0] * n
+        self.tokens = [1.0] * n
+        self.served = [0] * n
+        self.fps = [0.0] * n
+        self.rates = [0.0] * n
+        self._counted = [0] * n
+        self._allocated_at = None
+        self._refilled_at = None
+
+    def _allocate(self, now):
+        if self._allocated_at is not None:
+            elapsed = max(now - self._allocated_at, 1e-6)
+            self.fps = [
+                (served - counted) / elapsed
+                for served, counted in zip(self.served, self._counted)
+            ]
+        self._counted = list(self.served)
+        self._allocated_at = now
+        weights = [
+            priority * (1 + self.activity_gain * activity)
+            for priority, activity in zip(self.priorities, self.activity)
+        ]
+        self.rates = allocate(self.budget, weights, self.limits, self.floor)
+
+    def __call__(self):
+        """
+        Collects the next batch of frames, one per stream that has a token and a frame.
+
+        Returns:
+            list[FramePacket] or None: The frames to infer, or None when all streams ended.
+        """
+
+        while self.active:
+            now = time.monotonic()
+            if self._allocated_at is None or now - self._allocated_at >= self.interval:
+                self._allocate(now)
+            if self._refilled_at is not None:
+                elapsed = now - self._refilled_at
+                # トークンは貯めすぎない（最大1フレーム分）
+                self.tokens = [
+                    min(1.0, tokens + rate * elapsed)
+                    for tokens, rate in zip(self.tokens, self.rates)
+                ]
+            self._refilled_at = now
+
+            batch = []
+            for capture in list(self.active):
+                stream = capture.stream
+                if self.tokens[stream] < 1.0:
+                    continue
+                try:
+                    item = capture.queue.get_nowait()
+                except queue.Empty:
+                    continue
+                if item is STOP:
+                    self.active.remove(capture)
+                    logging.info(f"Stream {self.names[stream]} finished")
+                    continue
+                self.tokens[stream] -= 1.0
+                self.served[stream] += 1
+                batch.append(item)
+            if batch:
+                return batch
+            time.sleep(0.005)
+        return None
+
+    def observe(self, packet):
+        """
+        Updates the activity of a stream with the tracked objects of an inferred frame.
+
+        Args:
+            packet (FramePacket): The tracked frame.
+
+        Returns:
+            None
+        """
+
+        active = float(packet.detections is not None and len(packet.detections) > 0)
+        stream = packet.stream
+        self.activity[stream] += self.smoothing * (active - self.activity[stream])
+
+    def summary(self, stream):
+        """
+        Formats the achieved and allocated FPS of a stream.
+
+        Args:
+            stream (int): The index of the stream.
+
+        Returns:
+            str: The line of the stream.
+        """
+
+        return (
+            f"{self.names[stream]}: {self.fps[stream]:.1f} fps "
+            f"(allocated {self.rates[stream]:.1f} of {self.budget:g}, "
+            f"priority {self.priorities[stream]:g}, "
+            f"activity {self.activity[stream]:.2f}), "
+            f"{self.captures[stream].dropped} frames dropped"
+        )
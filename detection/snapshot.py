@@ -0,0 +1,133 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+# 形式ごとの画質パラメータ
+QUALITY_FLAGS = {
+    "jpg": cv2.IMWRITE_JPEG_QUALITY,
+    "webp": cv2.IMWRITE_WEBP_QUALITY,
+    "png": None,
+}
+
+
+def write_atomic(path, data):
+    """
+    Writes a file through a temporary file and a rename, so readers never see a partial file.
+
+    Args:
+        path (str): The path of the file.
+        data (bytes or numpy.ndarray): The content of the file.
+
+    Returns:
+        None
+    """
+
+    directory, name = os.path.split(path)
+    tmp_path = os.path.join(directory, f".{name}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class SnapshotEncoder:
+    """
+    Encodes the alert snapshots on a thread pool.
+
+    Besides the full annotated frame, it can write a crop around the triggering
+    person and a small thumbnail of that crop (of the whole frame without a
+    person box). Every file is written atomically.
+
+    Attributes:
+        out_dir (str): The directory of the snapshots (served by nginx).
+        format (str): The image format (jpg, webp or png).
+        quality (int): The quality of jpg and webp images.
+        crop (bool): Whether to write a crop around the triggering person.
+        thumbnail (int): The width of the thumbnail (0: no thumbnail).
+    """
+
+    def __init__(
+        self, out_dir, format="jpg", quality=90, crop=False, thumbnail=0, workers=2
+    ):
+        if format not in QUALITY_FLAGS:
+            raise ValueError(f"Unsupported snapshot format: {format}")
+        self.out_dir = out_dir
+        self.format = format
+        self.quality = quality
+        self.crop = crop
+        self.thumbnail = thumbnail
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="snapshot"
+        )
+
+    def submit(self, frame, name, box=None):
+        """
+        Starts encoding the snapshots of an alert.
+
+        Args:
+            frame (numpy.ndarray): The annotated frame; the caller must not modify it afterwards.
+            name (str): The file name of the snapshot without extension.
+            box (numpy.ndarray or None): The xyxy of the triggering person.
+
+        Returns:
+            concurrent.futures.Future: Resolves to a dict of the written file names by variant
+            (picture, and crop and thumbnail when enabled).
+        """
+
+        return self.executor.submit(self.encode, frame, name, box)
+
+    def encode(self, frame, name, box=None):
+        """
+        Encodes and writes the snapshots of an alert.
+
+        Args:
+            frame (numpy.ndarray): The annotated frame.
+            name (str): The file name of the snapshot without extension.
+            box (numpy.ndarray or None): The xyxy of the triggering person.
+
+        Returns:
+            dict: The written file names by variant.
+        """
+
+        files = {"picture": self._write(f"{name}.{self.format}", frame)}
+
+        person = None
+        if box is not None:
+            H, W = frame.shape[:2]
+            x1, y1, x2, y2 = [int(v) for v in box]
+            # 人物の周囲に1割の余白
+            pad_x, pad_y = (x2 - x1) // 10, (y2 - y1) // 10
+            x1, y1 = max(x1 - pad_x, 0), max(y1 - pad_y, 0)
+            x2, y2 = min(x2 + pad_x, W), min(y2 + pad_y, H)
+            if x2 > x1 and y2 > y1:
+                person = frame[y1:y2, x1:x2]
+        if self.crop and person is not None:
+            files["crop"] = self._write(f"{name}_crop.{self.format}", person)
+
+        if self.thumbnail:
+            # 人物の枠があればその切り出しを縮小
+            image = frame if person is None else person
+            H, W = image.shape[:2]
+            size = (self.thumbnail, max(H * self.thumbnail // W, 1))
+            small = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+            files["thumbnail"] = self._write(f"{name}_thumb.{self.format}", small)
+        return files
+
+    def _write(self, file_name, image):
+        flag = QUALITY_FLAGS[self.format]
+        params = [flag, self.quality] if flag is not None else []
+        ok, buf = cv2.imencode(f".{self.format}", image, params)
+        if not ok:
+            raise RuntimeError(f"Failed to encode {file_name}")
+        write_atomic(f"{self.out_dir}/{file_name}", buf.tobytes())
+        return file_name
+
+    def close(self):
+        """
+        Waits for the pending snapshots and stops the pool.
+
+        Returns:
+            None
+        """
+
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,199 @@
+import logging
+import time
+
+import cv2
+
+from detection.pipeline import FramePacket
+from detection.stride import BoxPredictor
+from detection.tracking import TrackerPredictor, load_tracker, update_tracker
+
+
+class CaptureSource:
+    """
+    The source stage: reads the frames of a cv2.VideoCapture.
+
+    Attributes:
+        cap (cv2.VideoCapture): The opened video file or camera.
+        stream (int): The index of the source.
+        index (int): The number of frames read so far.
+        finished (bool): True once the end of the video was reached.
+    """
+
+    def __init__(self, cap, stream=0):
+        self.cap = cap
+        self.stream = stream
+        self.index = 0
+        self.finished = False
+
+    def __call__(self):
+        """
+        Reads the next frame from the video or camera.
+
+        Returns:
+            FramePacket or None: The captured frame, or None when the stream is finished.
+        """
+
+        if not self.cap.isOpened():
+            return None
+        ret, frame = self.cap.read()
+        if not ret:
+            self.finished = True
+            return None
+        self.index += 1
+        return FramePacket(self.index, frame, time.perf_counter(), self.stream)
+
+
+class YoloDetector:
+    """
+    Detects the objects of a frame with YOLOv8 and tracks them with the tracker of the stream.
+
+    Attributes:
+        model (ultralytics.YOLO): The YOLOv8 model.
+        tracker (Tracker): The tracker of the stream.
+    """
+
+    def __init__(self, model, tracker="botsort.yaml", frame_rate=30):
+        self.model = model
+        self.tracker = load_tracker(tracker, frame_rate)
+
+    @property
+    def names(self):
+        """
+        dict: The class names of the model indexed by class ID.
+        """
+
+        return self.model.names
+
+    def __call__(self, packet):
+        """
+        Stores the tracked objects of the frame on the packet.
+
+        Args:
+            packet (FramePacket): The captured frame.
+
+        Returns:
+            None
+        """
+
+        # 検出とトラッキングを分けて実行
+        result = self.model.predict(packet.frame, verbose=False)[0]
+        packet.set_result(update_tracker(self.tracker, result, packet.frame))
+
+
+class TrackStage:
+    """
+    The track stage: runs the detector, or reuses/predicts the boxes when the frame is skipped.
+
+    Attributes:
+        detect (callable): Stores the tracked objects of a frame on its packet.
+        gate (MotionGate or None): Skips the detector while nothing moves.
+        stride (AdaptiveStride or None): Skips the detector to keep up with a target FPS.
+    """
+
+    def __init__(self, detect, gate=None, stride=None):
+        self.detect = detect
+        self.gate = gate
+        self.stride = stride
+        self.predictor = None
+        if stride is not None:
+            # 予測できるトラッカーは間引いたフレームでも運動モデルを進める
+            tracker = getattr(detect, "tracker", None)
+            if getattr(tracker, "predicts", False):
+                self.predictor = TrackerPredictor(tracker)
+            else:
+                self.predictor = BoxPredictor()
+
+    def __call__(self, packet):
+        """
+        Runs YOLOv8 tracking on the frame, or reuses/predicts the boxes when the frame is skipped.
+
+        Args:
+            packet (FramePacket): The captured frame.
+
+        Returns:
+            FramePacket: The packet with the tracked objects.
+        """
+
+        if self.gate is not None and self.gate.is_static(packet.frame):
+            # 動きがなければ前回の結果を使い回す
+            self.gate.reuse(packet)
+            return packet
+
+        if self.stride is not None and not self.stride.should_detect(packet.index):
+            # 推論を間引いたフレームは前回の検出から位置を予測
+            self.predictor.predict(packet)
+        else:
+            start = time.perf_counter()
+            self.detect(packet)
+            if self.stride is not None:
+                self.stride.update(packet.index, time.perf_counter() - start)
+                self.predictor.update(packet)
+
+        if self.gate is not None:
+            self.gate.remember(packet)
+        return packet
+
+    def summary(self):
+        """
+        Formats the statistics of the stride and the motion gate.
+
+        Returns:
+            list[str]: One line per enabled option.
+        """
+
+        lines = []
+        if self.stride is not None:
+            lines.append(self.stride.summary())
+        if self.gate is not None:
+            lines.append(self.gate.summary())
+        return lines
+
+
+class VideoSink:
+    """
+    The sink stage: writes the annotated frames and shows them in a window or the preview.
+
+    After a stop request the frames still queued are only written, so the
+    output video gets every processed frame.
+
+    Attributes:
+        video (cv2.VideoWriter or None): The output video.
+        stop_event (threading.Event): The stop event of the pipeline.
+        preview (PreviewServer or None): The MJPEG preview.
+        headless (bool): True to never open a window.
+        window (str): The name of the window.
+    """
+
+    def __init__(self, video, stop_event, preview=None, headless=False, window="frame"):
+        self.video = video
+        self.stop_event = stop_event
+        self.preview = preview
+        self.headless = headless
+        self.window = window
+
+    def __call__(self, packet):
+        """
+        Displays the annotated frame and writes it into the output video.
+
+        Args:
+            packet (FramePacket): The annotated frame.
+
+        Returns:
+            bool: False when the user pressed a key to stop, True otherwise.
+        """
+
+        if self.video is not None:
+            self.video.write(packet.frame)
+        if self.preview is not None:
+            self.preview.publish(packet.frame, packet.stream)
+        if self.headless or self.stop_event.is_set():
+            # 停止要求後はキューに残ったフレームを書き出すだけ
+            return True
+
+        cv2.imshow(self.window, packet.frame)
+        key = cv2.waitKey(1)
+        if key != -1:
+            print("STOP PLAY!!!")
+            logging.warning("STOP PLAY!!!")
+            return False
+        return True
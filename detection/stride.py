@@ -0,0 +1,139 @@
+import math
+
+import numpy as np
+
+from detection import detections
+
+
+class AdaptiveStride:
+    """
+    Decides on which frames the detector runs so that the pipeline keeps up with a target FPS.
+
+    The detector runs every `stride`-th frame. The stride is recomputed from the
+    smoothed inference latency: one inference may take as long as `stride` frames
+    at the target FPS.
+
+    Attributes:
+        target_fps (float): The frame rate the pipeline has to keep up with.
+        max_stride (int): The largest allowed stride.
+        stride (int): The current stride.
+        latency (float): The smoothed inference latency in seconds.
+    """
+
+    def __init__(self, target_fps, max_stride=8, smoothing=0.2):
+        self.target_fps = target_fps
+        self.max_stride = max_stride
+        self.smoothing = smoothing
+        self.stride = 1
+        self.latency = None
+        self.last_index = None
+        self.detected = 0
+        self.predicted = 0
+
+    def should_detect(self, index):
+        """
+        Tells whether the detector has to run on a frame.
+
+        Args:
+            index (int): The frame number.
+
+        Returns:
+            bool: True if the detector has to run, False if the boxes can be predicted.
+        """
+
+        if self.last_index is None or index - self.last_index >= self.stride:
+            self.detected += 1
+            return True
+        self.predicted += 1
+        return False
+
+    def update(self, index, latency):
+        """
+        Records an inference and updates the stride.
+
+        Args:
+            index (int): The frame number the detector ran on.
+            latency (float): The seconds the inference took.
+
+        Returns:
+            None
+        """
+
+        self.last_index = index
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self.smoothing * (latency - self.latency)
+        stride = math.ceil(self.latency * self.target_fps)
+        self.stride = min(max(stride, 1), self.max_stride)
+
+    def summary(self):
+        """
+        Formats the stride statistics.
+
+        Returns:
+            str: A line with the detected and predicted frames and the current stride.
+        """
+
+        latency = self.latency or 0.0
+        return (
+            f"stride: {self.detected} detected, {self.predicted} predicted, "
+            f"stride {self.stride}, latency {latency * 1000:.1f}ms"
+        )
+
+
+class BoxPredictor:
+    """
+    Predicts the tracked boxes of the frames the detector skipped.
+
+    Each track moves with the constant velocity measured between its last two
+    detections, so the boxes and IDs still advance on every frame.
+    """
+
+    def __init__(self):
+        self.index = 0
+        self.detections = detections.empty()
+        self.boxes = np.empty((0, 4), dtype=np.float32)
+        self.velocity = np.empty((0, 4), dtype=np.float32)
+
+    def update(self, packet):
+        """
+        Stores the tracked boxes of a detected frame and measures the velocity of each track.
+
+        Args:
+            packet (FramePacket): The frame the detector ran on.
+
+        Returns:
+            None
+        """
+
+        det = packet.detections
+        boxes = det["xyxy"].astype(np.float32)
+        velocity = np.zeros_like(boxes)
+        # 前回も検出されたIDはフレームあたりの移動量を速度とする
+        _, cur, prev = np.intersect1d(
+            det["id"], self.detections["id"], return_indices=True
+        )
+        elapsed = max(packet.index - self.index, 1)
+        velocity[cur] = (boxes[cur] - self.boxes[prev]) / elapsed
+
+        self.index = packet.index
+        self.detections = det
+        self.boxes = boxes
+        self.velocity = velocity
+
+    def predict(self, packet):
+        """
+        Fills a skipped frame with the predicted boxes.
+
+        Args:
+            packet (FramePacket): The frame the detector skipped.
+
+        Returns:
+            None
+        """
+
+        det = self.detections.copy()
+        elapsed = packet.index - self.index
+        det["xyxy"] = np.rint(self.boxes + self.velocity * elapsed)
+        packet.detections = det
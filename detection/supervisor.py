@@ -0,0 +1,514 @@
+import logging
+import multiprocessing
+import queue
+import signal
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import cv2
+import numpy as np
+
+from detection.pipeline import FramePacket
+
+# リングのスロットの状態（所有者）
+FREE, WRITING, READY, INFER, HELD = range(5)
+# 空きスロットや準備済みスロットを待つ間隔（秒）
+POLL_INTERVAL = 0.002
+
+
+class FrameRing:
+    """
+    Fixed frame slots of one camera in shared memory.
+
+    A slot is owned by one process at a time: the capture process writes it
+    (WRITING) and marks it READY with its frame number and capture time, the
+    inference process reads it (INFER), the supervisor draws on it (HELD) and
+    marks it FREE again. Every transition is made by the owner of the slot with
+    a plain write to shared memory, so a process killed at any point leaves no
+    lock or queue behind, only slots that `reclaim()` frees. The frames are never
+    pickled.
+
+    Attributes:
+        shape (tuple): The shape of a frame (H, W, 3).
+        slots (int): The number of slots.
+        state (multiprocessing.Array): The state of every slot.
+        index (multiprocessing.Array): The frame number of every READY slot.
+        captured_at (multiprocessing.Array): The capture time of every READY slot.
+        finished (multiprocessing.Value): Set by the capture process at the end of a video.
+        frames (numpy.ndarray): The slots, shape (slots, H, W, 3).
+    """
+
+    def __init__(self, shape, slots, ctx):
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.state = ctx.Array("b", slots, lock=False)
+        self.index = ctx.Array("q", slots, lock=False)
+        self.captured_at = ctx.Array("d", slots, lock=False)
+        self.finished = ctx.Value("b", 0, lock=False)
+        self.shm = SharedMemory(create=True, size=slots * int(np.prod(self.shape)))
+        self.name = self.shm.name
+        self.frames = np.ndarray((slots, *self.shape), np.uint8, buffer=self.shm.buf)
+
+    def __getstate__(self):
+        return {
+            key: value
+            for key, value in self.__dict__.items()
+            if key not in ("shm", "frames")
+        }
+
+    def __setstate__(self, state):
+        # 子プロセスでは既存の共有メモリを開くだけ
+        self.__dict__.update(state)
+        self.shm = SharedMemory(name=self.name)
+        # 破棄は親プロセスが行うので子のresource_trackerには登録しない
+        resource_tracker.unregister(self.shm._name, "shared_memory")
+        self.frames = np.ndarray(
+            (self.slots, *self.shape), np.uint8, buffer=self.shm.buf
+        )
+
+    def acquire(self):
+        """
+        Takes a free slot for writing; called by the capture process only.
+
+        Returns:
+            int or None: The slot, or None when every slot is in use.
+        """
+
+        for slot in range(self.slots):
+            if self.state[slot] == FREE:
+                self.state[slot] = WRITING
+                return slot
+        return None
+
+    def publish(self, slot, index, captured_at):
+        """
+        Hands a written slot to the inference process.
+
+        Args:
+            slot (int): The slot.
+            index (int): The frame number.
+            captured_at (float): The `time.perf_counter()` value when the frame was read.
+
+        Returns:
+            None
+        """
+
+        self.index[slot] = index
+        self.captured_at[slot] = captured_at
+        # 状態は最後に書き換える（読み手は状態を見てから番号を読む）
+        self.state[slot] = READY
+
+    def ready(self):
+        """
+        Lists the slots waiting for inference.
+
+        Returns:
+            list[int]: The READY slots, oldest frame first.
+        """
+
+        slots = [slot for slot in range(self.slots) if self.state[slot] == READY]
+        return sorted(slots, key=lambda slot: self.index[slot])
+
+    def release(self, slot):
+        """
+        Gives a slot back to the capture process.
+
+        Args:
+            slot (int): The slot.
+
+        Returns:
+            None
+        """
+
+        self.state[slot] = FREE
+
+    def reclaim(self, state):
+        """
+        Frees the slots left in a state by a crashed process.
+
+        Args:
+            state (int): The state the crashed process owned.
+
+        Returns:
+            int: The number of freed slots.
+        """
+
+        slots = [slot for slot in range(self.slots) if self.state[slot] == state]
+        for slot in slots:
+            self.release(slot)
+        return len(slots)
+
+    def close(self, unlink=False):
+        self.frames = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def capture_worker(stream, source, live, ring, stop_event, dropped):
+    """
+    Decodes the frames of a source into the free slots of its ring.
+
+    A live source keeps grabbing when no slot is free, so the camera buffer never
+    fills with old frames; a video file waits for a slot instead.
+
+    Args:
+        stream (int): The index of the source.
+        source (int or str): The cv2.VideoCapture argument.
+        live (bool): True for a camera or a stream.
+        ring (FrameRing): The slots of the source.
+        stop_event (multiprocessing.Event): Set by the supervisor to stop.
+        dropped (multiprocessing.Array): The dropped frames of every stream.
+
+    Raises:
+        RuntimeError: If a live source stops delivering frames, so the worker is restarted.
+    """
+
+    # Ctrl+Cは親プロセスがまとめて処理する
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    H, W = ring.shape[:2]
+    cap = cv2.VideoCapture(source)
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, W)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, H)
+    index = 0
+    try:
+        while not stop_event.is_set():
+            slot = ring.acquire()
+            if slot is None:
+                if live:
+                    # 空きスロットがなければ読み捨てる
+                    cap.grab()
+                    dropped[stream] += 1
+                else:
+                    time.sleep(POLL_INTERVAL)
+                continue
+
+            target = ring.frames[slot]
+            # サイズが合えばスロットに直接デコードされる
+            ret, frame = cap.read(target)
+            if not ret:
+                ring.release(slot)
+                if live:
+                    raise RuntimeError(f"Stream {stream} stopped delivering frames")
+                ring.finished.value = 1
+                return
+            if frame.ctypes.data != target.ctypes.data:
+                cv2.resize(frame, (W, H), dst=target)
+            index += 1
+            ring.publish(slot, index, time.perf_counter())
+    finally:
+        cap.release()
+        ring.close()
+
+
+def inference_worker(
+    model_args, tracker, rings, live, frame_rates, results, stop_event, dropped
+):
+    """
+    Tracks the newest frames of every stream in batches, reading the slots in place.
+
+    Only the compact detection arrays are sent back to the supervisor. For a live
+    stream older ready frames are skipped in favour of the newest one.
+
+    Args:
+        model_args (dict): The keyword arguments of `load_model()`.
+        tracker (str): The tracker config.
+        rings (list[FrameRing]): The slots of every stream.
+        live (list[bool]): True for the live streams.
+        frame_rates (list[float]): The FPS of every stream.
+        results (multiprocessing.Queue): Receives (stream, slot, index, captured_at, detections).
+        stop_event (multiprocessing.Event): Set by the supervisor to stop.
+        dropped (multiprocessing.Array): The skipped frames of every stream.
+    """
+
+    from detection.backend import load_model
+    from detection.multistream import MultiStreamTracker
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    model = load_model(**model_args)
+    tracker = MultiStreamTracker(model, frame_rates, tracker)
+    ended = [False] * len(rings)
+    try:
+        while not stop_event.is_set():
+            batch, slots = [], []
+            for stream, ring in enumerate(rings):
+                if ended[stream]:
+                    continue
+                # 終了フラグは準備済みスロットより先に読む
+                finished = ring.finished.value
+                ready = ring.ready()
+                if live[stream]:
+                    # 最新フレーム優先：古いフレームは推論せずに返す
+                    for slot in ready[:-1]:
+                        ring.release(slot)
+                        dropped[stream] += 1
+                    ready = ready[-1:]
+                if not ready:
+                    if finished:
+                        ended[stream] = True
+                        results.put((stream, None, 0, 0.0, None))
+                    continue
+                slot = ready[0]
+                ring.state[slot] = INFER
+                batch.append(
+                    FramePacket(
+                        ring.index[slot],
+                        ring.frames[slot],
+                        ring.captured_at[slot],
+                        stream,
+                    )
+                )
+                slots.append(slot)
+            if not batch:
+                time.sleep(POLL_INTERVAL)
+                continue
+
+            tracker(batch)
+            for packet, slot in zip(batch, slots):
+                rings[packet.stream].state[slot] = HELD
+                results.put(
+                    (
+                        packet.stream,
+                        slot,
+                        packet.index,
+                        packet.captured_at,
+                        packet.detections,
+                    )
+                )
+            batch = None
+    finally:
+        for ring in rings:
+            ring.close()
+
+
+class Supervisor:
+    """
+    Runs one capture process per source and one inference process, and restarts them when they crash.
+
+    The slots a crashed process owned are freed, so the other streams keep running.
+    The capture processes share nothing with the others but their rings, and the
+    results queue, the only queue, is replaced whenever the inference process is
+    restarted, so a process killed while holding a queue lock cannot block the
+    rest. A video file whose capture crashed is reported as finished instead of
+    being read again from the start.
+
+    Attributes:
+        rings (list[FrameRing]): The slots of every stream.
+        restarts (list[int]): The restarts of every capture process.
+        inference_restarts (int): The restarts of the inference process.
+    """
+
+    def __init__(
+        self,
+        sources,
+        shape,
+        model_args,
+        tracker="botsort.yaml",
+        frame_rates=None,
+        slots=4,
+        restart_delay=1.0,
+    ):
+        self.ctx = multiprocessing.get_context("spawn")
+        self.sources = sources
+        self.model_args = model_args
+        self.tracker = tracker
+        self.frame_rates = frame_rates or [30] * len(sources)
+        self.restart_delay = restart_delay
+        self.rings = [FrameRing(shape, slots, self.ctx) for _ in sources]
+        self.results = None
+        self.stop_event = self.ctx.Event()
+        self.capture_dropped = self.ctx.Array("q", len(sources), lock=False)
+        self.infer_dropped = self.ctx.Array("q", len(sources), lock=False)
+        self.captures = [None] * len(sources)
+        self.inference = None
+        self.restarts = [0] * len(sources)
+        self.inference_restarts = 0
+        self._started_at = {}
+        # 終了を通知済みのストリーム
+        self._finished = set()
+
+    def _start_capture(self, stream):
+        source, live = self.sources[stream]
+        process = self.ctx.Process(
+            target=capture_worker,
+            args=(
+                stream,
+                source,
+                live,
+                self.rings[stream],
+                self.stop_event,
+                self.capture_dropped,
+            ),
+            name=f"capture{stream}",
+            daemon=True,
+        )
+        process.start()
+        self.captures[stream] = process
+        self._started_at[process.name] = time.monotonic()
+
+    def _start_inference(self):
+        # 落ちたプロセスがロックを握ったままかもしれないキューは使い回さない
+        if self.results is not None:
+            self.results.close()
+        self.results = self.ctx.Queue()
+        self.inference = self.ctx.Process(
+            target=inference_worker,
+            args=(
+                self.model_args,
+                self.tracker,
+                self.rings,
+                [live for _, live in self.sources],
+                self.frame_rates,
+                self.results,
+                self.stop_event,
+                self.infer_dropped,
+            ),
+            name="inference",
+            daemon=True,
+        )
+        self.inference.start()
+        self._started_at["inference"] = time.monotonic()
+
+    def start(self):
+        """
+        Starts the inference process and every capture process.
+
+        Returns:
+            None
+        """
+
+        self._start_inference()
+        for stream in range(len(self.sources)):
+            self._start_capture(stream)
+
+    def _may_restart(self, name):
+        # 起動直後に落ち続けるプロセスを連続で再起動しない
+        return time.monotonic() - self._started_at[name] >= self.restart_delay
+
+    def poll(self):
+        """
+        Restarts the crashed processes.
+
+        Must be called while the caller holds no slot: the results still queued
+        by a crashed inference process are lost, so its HELD slots are freed too.
+
+        Returns:
+            bool: True if the inference process was restarted, so the tracker IDs
+                start over.
+        """
+
+        if self.stop_event.is_set():
+            return False
+        for stream, process in enumerate(self.captures):
+            if process is None or process.is_alive():
+                continue
+            if process.exitcode == 0:
+                self.captures[stream] = None
+                continue
+            freed = self.rings[stream].reclaim(WRITING)
+            if not self.sources[stream][1]:
+                # 動画ファイルは最初から読み直さずに終了扱い
+                logging.error(f"Capture of stream {stream} crashed; stream finished")
+                # 推論プロセスが残りのフレームを処理してから終了を通知する
+                self.rings[stream].finished.value = 1
+                self.captures[stream] = None
+            elif self._may_restart(process.name):
+                logging.warning(
+                    f"Capture of stream {stream} exited with {process.exitcode}; "
+                    f"restarting ({freed} slots freed)"
+                )
+                self.restarts[stream] += 1
+                self._start_capture(stream)
+
+        if self.inference.is_alive() or not self._may_restart("inference"):
+            return False
+        freed = sum(
+            ring.reclaim(INFER) + ring.reclaim(HELD) for ring in self.rings
+        )
+        logging.warning(
+            f"Inference exited with {self.inference.exitcode}; "
+            f"restarting ({freed} slots freed)"
+        )
+        self.inference_restarts += 1
+        self._start_inference()
+        return True
+
+    def get(self, timeout=0.5):
+        """
+        Waits for the detections of the next frame.
+
+        Returns:
+            tuple or None: (stream, slot, index, captured_at, detections), with a None
+                slot when the stream finished, or None on timeout.
+        """
+
+        try:
+            item = self.results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if item[1] is None:
+            # 再起動した推論プロセスは終了済みのストリームをもう一度通知する
+            if item[0] in self._finished:
+                return None
+            self._finished.add(item[0])
+        return item
+
+    def frame(self, stream, slot):
+        """
+        Returns the frame of a slot held by the supervisor, without copying it.
+        """
+
+        return self.rings[stream].frames[slot]
+
+    def release(self, stream, slot):
+        """
+        Gives a slot back to its capture process.
+        """
+
+        self.rings[stream].release(slot)
+
+    def stop(self):
+        """
+        Asks every process to stop.
+
+        Returns:
+            None
+        """
+
+        self.stop_event.set()
+
+    def close(self, timeout=5):
+        """
+        Stops the processes and removes the shared memory.
+
+        Returns:
+            None
+        """
+
+        self.stop()
+        for process in self.captures + [self.inference]:
+            if process is None:
+                continue
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        for ring in self.rings:
+            ring.close(unlink=True)
+
+    def summary(self):
+        """
+        Formats the dropped frames and restarts of every stream.
+
+        Returns:
+            list[str]: One line per stream and one for the inference process.
+        """
+
+        lines = [
+            f"stream{stream}: {self.capture_dropped[stream]} frames dropped by capture, "
+            f"{self.infer_dropped[stream]} skipped by inference, "
+            f"{self.restarts[stream]} restarts"
+            for stream in range(len(self.sources))
+        ]
+        lines.append(f"inference: {self.inference_restarts} restarts")
+        return lines
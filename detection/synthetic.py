@@ -0,0 +1,95 @@
+import time
+
+import cv2
+import numpy as np
+
+from detection import detections
+
+# COCOの先頭クラスのみ（person + その他）
+NAMES = {0: "person", 1: "bicycle", 2: "car", 3: "motorcycle"}
+
+
+def generate_video(path, frames, W=1280, H=720, fps=30.0, objects=5, seed=0):
+    """
+    Writes a synthetic test video of colored rectangles moving over a noisy background.
+
+    Args:
+        path (str): The path of the output video file.
+        frames (int): The number of frames.
+        W (int): The width of the frames.
+        H (int): The height of the frames.
+        fps (float): The FPS of the video.
+        objects (int): The number of moving rectangles.
+        seed (int): The seed of the random generator.
+
+    Returns:
+        str: The path of the written video.
+    """
+
+    rng = np.random.default_rng(seed)
+    background = rng.integers(60, 90, size=(H, W, 3), dtype=np.uint8)
+    start = rng.integers(0, [W - 100, H - 200], size=(objects, 2))
+    velocity = rng.integers(-4, 5, size=(objects, 2))
+    colors = rng.integers(0, 255, size=(objects, 3)).tolist()
+
+    codec = cv2.VideoWriter_fourcc("m", "p", "4", "v")
+    video = cv2.VideoWriter(path, codec, fps, (W, H))
+    for i in range(frames):
+        frame = background.copy()
+        xy = (start + velocity * i) % (2 * np.array([W - 100, H - 200]))
+        xy = np.minimum(xy, 2 * np.array([W - 100, H - 200]) - xy)
+        for (x, y), color in zip(xy.tolist(), colors):
+            cv2.rectangle(frame, (x, y), (x + 60, y + 160), color, -1)
+        video.write(frame)
+    video.release()
+    return path
+
+
+class SyntheticDetector:
+    """
+    A deterministic stand-in for YOLOv8 tracking that needs no weights.
+
+    It emits `boxes` tracked objects per frame moving on fixed trajectories, every
+    other one a person, and optionally sleeps to simulate the inference latency.
+    It has the same interface as YoloDetector, so it can replace it in a TrackStage.
+
+    Attributes:
+        boxes (int): The number of objects per frame.
+        latency (float): The seconds each call sleeps.
+        frame_size (tuple): The width and height of the frames.
+    """
+
+    names = NAMES
+
+    def __init__(self, boxes=5, latency=0.0, frame_size=(1280, 720), seed=0):
+        self.boxes = boxes
+        self.latency = latency
+        self.frame_size = frame_size
+
+        rng = np.random.default_rng(seed)
+        W, H = frame_size
+        self._start = rng.integers(0, [W - 100, H - 200], size=(boxes, 2))
+        self._velocity = rng.integers(-4, 5, size=(boxes, 2))
+        self._size = rng.integers([30, 80], [100, 200], size=(boxes, 2))
+        self._ids = np.arange(1, boxes + 1)
+        self._cls = np.where(self._ids % 2 == 1, 0, 2)
+        self._conf = np.full(boxes, 0.9)
+
+    def __call__(self, packet):
+        """
+        Stores the synthetic tracked objects of the frame on the packet.
+
+        Args:
+            packet (FramePacket): The captured frame.
+
+        Returns:
+            None
+        """
+
+        if self.latency:
+            time.sleep(self.latency)
+        W, H = self.frame_size
+        xy = (self._start + self._velocity * packet.index) % [W - 100, H - 200]
+        packet.detections = detections.from_array(
+            np.hstack([xy, xy + self._size]), self._ids, self._cls, self._conf
+        )
@@ -0,0 +1,242 @@
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+from detection import detections
+from detection.tracking import load_tracker, update_tracker
+
+# タイルの端に接しているとみなす距離（画素）
+EDGE = 2
+
+
+def zone_regions(zones, frame_size, margin=32):
+    """
+    Computes the rectangles around the zones that need to be detected.
+
+    Args:
+        zones (list[numpy.ndarray]): The polygon zones (the whole frame if empty).
+        frame_size (tuple): The frame size (W, H).
+        margin (int): The pixels added around each zone, so people standing on
+            its border are not cut.
+
+    Returns:
+        numpy.ndarray: The regions as xyxy, shape (R, 4).
+    """
+
+    W, H = frame_size
+    if not zones:
+        return np.array([[0, 0, W, H]])
+    regions = np.array(
+        [[*zone.min(axis=0) - margin, *zone.max(axis=0) + margin] for zone in zones]
+    )
+    return np.clip(regions, 0, [W, H, W, H])
+
+
+def plan_tiles(regions, tile=640, overlap=0.2):
+    """
+    Splits the regions into square tiles that overlap their neighbours.
+
+    A region smaller than a tile is used as it is.
+
+    Args:
+        regions (numpy.ndarray): The regions as xyxy, shape (R, 4).
+        tile (int): The side of a tile in frame pixels.
+        overlap (float): The fraction of a tile shared with its neighbour.
+
+    Returns:
+        numpy.ndarray: The tiles as xyxy, shape (T, 4).
+    """
+
+    step = max(1, int(tile * (1 - overlap)))
+    tiles = []
+    for x1, y1, x2, y2 in regions.tolist():
+        # 最後のタイルは領域の端に揃える
+        xs = list(range(x1, max(x1, x2 - tile) + 1, step))
+        ys = list(range(y1, max(y1, y2 - tile) + 1, step))
+        if xs[-1] + tile < x2:
+            xs.append(x2 - tile)
+        if ys[-1] + tile < y2:
+            ys.append(y2 - tile)
+        for y in ys:
+            for x in xs:
+                tiles.append([x, y, min(x + tile, x2), min(y + tile, y2)])
+    return np.array(tiles, dtype=np.int32)
+
+
+def cut_at_edges(boxes, bounds, tile_of, frame_size, edge=EDGE):
+    """
+    Tells which boxes touch an edge of their tile inside the frame, so may be cut.
+
+    Args:
+        boxes (numpy.ndarray): The boxes in frame coordinates, shape (N, >=4).
+        bounds (numpy.ndarray): The tiles as xyxy, shape (T, 4).
+        tile_of (numpy.ndarray): The tile of every box, shape (N,).
+        frame_size (tuple): The frame size (W, H).
+        edge (int): The distance in pixels at which a box touches an edge.
+
+    Returns:
+        numpy.ndarray: True for the boxes that may be cut, shape (N,).
+    """
+
+    W, H = frame_size
+    t = bounds[tile_of]
+    # 画面の端はタイルの切れ目ではない
+    inner = np.stack([t[:, 0] > 0, t[:, 1] > 0, t[:, 2] < W, t[:, 3] < H], axis=1)
+    touch = np.stack(
+        [
+            boxes[:, 0] <= t[:, 0] + edge,
+            boxes[:, 1] <= t[:, 1] + edge,
+            boxes[:, 2] >= t[:, 2] - edge,
+            boxes[:, 3] >= t[:, 3] - edge,
+        ],
+        axis=1,
+    )
+    return (inner & touch).any(axis=1)
+
+
+def merge_tiles(boxes, tile_of, cut, iou_thr=0.5, ios_thr=0.6):
+    """
+    Merges the boxes of the same objects detected in several overlapping tiles.
+
+    Two boxes of the same class from different tiles are duplicates when their IoU
+    exceeds `iou_thr`, or, when one of them is cut at a tile edge, when their
+    intersection over the smaller box exceeds `ios_thr`: the part of a person cut
+    by one tile and the whole person in the next tile overlap with a low IoU.
+    The most confident box is kept and grows to cover the cut boxes it absorbs,
+    so the feet of a person cut at the bottom of a tile are not lost.
+
+    Args:
+        boxes (numpy.ndarray): The boxes (x1, y1, x2, y2, conf, cls), shape (N, 6).
+        tile_of (numpy.ndarray): The tile of every box, shape (N,).
+        cut (numpy.ndarray): True for the boxes touching an inner tile edge, shape (N,).
+        iou_thr (float): The IoU over which two boxes are duplicates.
+        ios_thr (float): The intersection over the smaller box over which a cut box
+            is a duplicate.
+
+    Returns:
+        numpy.ndarray: The merged boxes, most confident first, shape (M, 6).
+    """
+
+    order = np.argsort(-boxes[:, 4], kind="stable")
+    boxes, tile_of, cut = boxes[order].copy(), tile_of[order], cut[order]
+    xyxy = boxes[:, :4]
+    # 同じタイル内の重複はYOLOのNMSで除去済み
+    candidate = (boxes[:, 5][:, None] == boxes[:, 5][None, :]) & (
+        tile_of[:, None] != tile_of[None, :]
+    )
+    partial = (cut[:, None] | cut[None, :]) & (detections.ios(xyxy, xyxy) > ios_thr)
+    duplicate = candidate & ((detections.iou(xyxy, xyxy) > iou_thr) | partial)
+
+    keep = np.ones(len(boxes), dtype=bool)
+    for i in range(len(boxes)):
+        if not keep[i]:
+            continue
+        absorbed = np.flatnonzero(duplicate[i, i + 1 :] & keep[i + 1 :]) + i + 1
+        keep[absorbed] = False
+        grown = absorbed[partial[i, absorbed]]
+        if len(grown):
+            boxes[i, :2] = np.minimum(boxes[i, :2], boxes[grown, :2].min(axis=0))
+            boxes[i, 2:4] = np.maximum(boxes[i, 2:4], boxes[grown, 2:4].max(axis=0))
+    return boxes[keep]
+
+
+class TiledDetector:
+    """
+    Detects the objects of the tiles of a frame in one batch and tracks the merged boxes.
+
+    The tiles are cropped from the frame without copying and inferred at `imgsz`,
+    so small, distant people are seen at a higher resolution than in a downscaled
+    full frame. The boxes are shifted back into frame coordinates and the
+    duplicates of neighbouring tiles are merged by `merge_tiles()` before they
+    reach the tracker. With `full_frame` the whole frame is added to the batch, so
+    people larger than a tile are still detected.
+
+    Attributes:
+        model (ultralytics.YOLO): The YOLOv8 model.
+        tiles (numpy.ndarray): The tiles as xyxy, shape (T, 4).
+        imgsz (int): The input size of the tiles.
+        full_frame (bool): Whether the whole frame is detected with the tiles.
+        iou_thr (float): The IoU over which overlapping boxes of two tiles are merged.
+        ios_thr (float): The intersection over the smaller box over which a box cut
+            at a tile edge is merged with the box of the neighbouring tile.
+        tracker (Tracker): The tracker of the stream.
+    """
+
+    def __init__(
+        self,
+        model,
+        tiles,
+        imgsz=640,
+        full_frame=False,
+        iou_thr=0.5,
+        tracker="botsort.yaml",
+        frame_rate=30,
+        ios_thr=0.6,
+    ):
+        self.model = model
+        self.tiles = tiles
+        self.imgsz = imgsz
+        self.full_frame = full_frame
+        self.iou_thr = iou_thr
+        self.ios_thr = ios_thr
+        self.tracker = load_tracker(tracker, frame_rate)
+
+    @property
+    def names(self):
+        """
+        dict: The class names of the model indexed by class ID.
+        """
+
+        return self.model.names
+
+    def detect(self, frame):
+        """
+        Detects the objects of all tiles of a frame.
+
+        Args:
+            frame (numpy.ndarray): The BGR frame.
+
+        Returns:
+            numpy.ndarray: The merged boxes (x1, y1, x2, y2, conf, cls), shape (N, 6).
+        """
+
+        H, W = frame.shape[:2]
+        crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in self.tiles.tolist()]
+        bounds = self.tiles
+        if self.full_frame:
+            crops.append(frame)
+            bounds = np.concatenate([bounds, [[0, 0, W, H]]])
+
+        # 全タイルを1回のバッチで推論
+        results = self.model.predict(crops, imgsz=self.imgsz, verbose=False)
+        boxes, tile_of = [], []
+        for t, (result, (x, y)) in enumerate(zip(results, bounds[:, :2].tolist())):
+            data = result.boxes.data.cpu().numpy()
+            data[:, [0, 2]] += x
+            data[:, [1, 3]] += y
+            boxes.append(data)
+            tile_of.append(np.full(len(data), t))
+        if not boxes:
+            return np.zeros((0, 6), np.float32)
+        boxes, tile_of = np.concatenate(boxes), np.concatenate(tile_of)
+
+        # タイルの重なりで重複した検出を統合（切れた箱は小さい方との重なりで判定）
+        cut = cut_at_edges(boxes, bounds, tile_of, (W, H))
+        return merge_tiles(boxes, tile_of, cut, self.iou_thr, self.ios_thr)
+
+    def __call__(self, packet):
+        """
+        Stores the tracked objects of the frame on the packet.
+
+        Args:
+            packet (FramePacket): The captured frame.
+
+        Returns:
+            None
+        """
+
+        boxes = self.detect(packet.frame)
+        result = Results(
+            packet.frame, path="", names=self.names, boxes=torch.as_tensor(boxes)
+        )
+        packet.set_result(update_tracker(self.tracker, result, packet.frame))
@@ -0,0 +1,424 @@
+import os
+import threading
+
+import numpy as np
+import torch
+from scipy.optimize import linear_sum_assignment
+from ultralytics.engine.results import Boxes
+from ultralytics.trackers.basetrack import BaseTrack
+from ultralytics.trackers.bot_sort import BOTSORT
+from ultralytics.trackers.byte_tracker import BYTETracker
+from ultralytics.utils import IterableSimpleNamespace, yaml_load
+from ultralytics.utils.checks import check_yaml
+
+from detection import detections
+
+TRACKER_MAP = {"bytetrack": BYTETracker, "botsort": BOTSORT}
+# このパッケージに同梱のトラッカー設定
+TRACKER_DIR = os.path.join(os.path.dirname(__file__), "trackers")
+
+# Ultralyticsのトラック IDカウンタはクラス変数で全トラッカー共通
+_ID_LOCK = threading.Lock()
+
+
+class Tracker:
+    """
+    The interface of the trackers: associates the detections of a frame with the tracks.
+
+    A tracker instance holds the tracks of one stream; create one per stream.
+    """
+
+    #: bool: True when `predict()` can fill the frames the detector skipped.
+    predicts = False
+
+    def update(self, boxes, frame=None):
+        """
+        Associates the detections of a frame with the tracks.
+
+        Args:
+            boxes (numpy.ndarray): The detections (x1, y1, x2, y2, conf, cls), shape (N, 6).
+            frame (numpy.ndarray or None): The frame, used for camera motion compensation.
+
+        Returns:
+            numpy.ndarray: The tracks (x1, y1, x2, y2, id, conf, cls, idx) with the
+                index of their detection, shape (M, 8).
+        """
+
+        raise NotImplementedError
+
+    def predict(self):
+        """
+        Advances the tracks by one frame without detections.
+
+        Returns:
+            numpy.ndarray: The predicted tracks (x1, y1, x2, y2, id, conf, cls, -1), shape (M, 8).
+        """
+
+        raise NotImplementedError
+
+    def reset(self):
+        """
+        Forgets every track and restarts the IDs.
+
+        Returns:
+            None
+        """
+
+        raise NotImplementedError
+
+
+class UltralyticsTracker(Tracker):
+    """
+    Runs the ByteTrack or BoT-SORT tracker of Ultralytics outside `model.track()`.
+
+    Ultralytics counts the track IDs in a class variable and resets it whenever a
+    tracker is created, so the counter of each instance is swapped in around its
+    updates and the IDs of one stream never depend on the others.
+
+    Attributes:
+        cfg (IterableSimpleNamespace): The tracker config.
+        frame_rate (int): The FPS of the stream.
+        tracker (BYTETracker or BOTSORT): The Ultralytics tracker.
+    """
+
+    def __init__(self, cfg, frame_rate=30):
+        self.cfg = cfg
+        self.frame_rate = frame_rate
+        self.reset()
+
+    def update(self, boxes, frame=None):
+        shape = frame.shape[:2] if frame is not None else (0, 0)
+        with _ID_LOCK:
+            BaseTrack._count = self._count
+            tracks = self.tracker.update(Boxes(boxes, shape), frame)
+            self._count = BaseTrack._count
+        return np.asarray(tracks, dtype=np.float32).reshape(-1, 8)
+
+    def reset(self):
+        with _ID_LOCK:
+            count = BaseTrack._count
+            self.tracker = TRACKER_MAP[self.cfg.tracker_type](
+                args=self.cfg, frame_rate=self.frame_rate
+            )
+            BaseTrack._count = count
+        self._count = 0
+
+
+class IoUTracker(Tracker):
+    """
+    A lightweight IoU tracker with a constant-velocity Kalman filter, vectorized with NumPy.
+
+    The state of every track lives in fixed-size arrays, so the memory stays bounded
+    however long the stream runs; a detection that finds no free slot starts no track
+    and is counted in `overflow`. Each frame the filter predicts all tracks at once,
+    the detections are associated by IoU in two rounds like ByteTrack (confident
+    boxes first, then the weak ones on the remaining tracks) with one Hungarian
+    assignment per round, and the matched tracks are corrected at once.
+
+    The state is (cx, cy, w, h) and its velocity; the noise scales with the box size.
+
+    Attributes:
+        iou_thr (float): The minimum IoU of a detection and the predicted box of a track.
+        high_thr (float): The confidence of the detections of the first round.
+        low_thr (float): The confidence of the detections of the second round.
+        new_track_thr (float): The confidence an unmatched detection needs to start a track.
+        max_age (int): The frames a track survives without a match.
+        min_hits (int): The matches before a new track is reported.
+        max_tracks (int): The number of track slots.
+        overflow (int): The tracks not started because every slot was used.
+    """
+
+    predicts = True
+
+    # 位置と速度のノイズ（箱の大きさに対する比）
+    STD_POSITION = 1 / 20
+    STD_VELOCITY = 1 / 160
+
+    def __init__(
+        self,
+        iou_thr=0.3,
+        high_thr=0.5,
+        low_thr=0.1,
+        new_track_thr=0.6,
+        max_age=30,
+        min_hits=2,
+        max_tracks=256,
+    ):
+        self.iou_thr = iou_thr
+        self.high_thr = high_thr
+        self.low_thr = low_thr
+        self.new_track_thr = new_track_thr
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.max_tracks = max_tracks
+        self.F = np.eye(8)
+        self.F[:4, 4:] = np.eye(4)
+        self.reset()
+
+    @classmethod
+    def from_config(cls, cfg, frame_rate=30):
+        """
+        Creates the tracker from an `iou` tracker config.
+
+        Args:
+            cfg (IterableSimpleNamespace): The tracker config.
+            frame_rate (int): The FPS of the stream, scaling `track_buffer` as Ultralytics does.
+
+        Returns:
+            IoUTracker: The tracker.
+        """
+
+        return cls(
+            iou_thr=cfg.iou_thresh,
+            high_thr=cfg.track_high_thresh,
+            low_thr=cfg.track_low_thresh,
+            new_track_thr=cfg.new_track_thresh,
+            max_age=int(frame_rate / 30.0 * cfg.track_buffer),
+            min_hits=cfg.min_hits,
+            max_tracks=cfg.max_tracks,
+        )
+
+    def reset(self):
+        K = self.max_tracks
+        self.mean = np.zeros((K, 8))
+        self.cov = np.zeros((K, 8, 8))
+        self.ids = np.zeros(K, dtype=np.int64)
+        self.cls = np.zeros(K, dtype=np.float32)
+        self.conf = np.zeros(K, dtype=np.float32)
+        self.hits = np.zeros(K, dtype=np.int32)
+        self.misses = np.zeros(K, dtype=np.int32)
+        self.active = np.zeros(K, dtype=bool)
+        # 直前のフレームで出力したトラック
+        self.visible = np.zeros(K, dtype=bool)
+        self.frame = 0
+        self.next_id = 1
+        self.overflow = 0
+
+    def __len__(self):
+        return int(self.active.sum())
+
+    def update(self, boxes, frame=None):
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 6)
+        rows = self._advance()
+        conf = boxes[:, 4]
+
+        # 1回目：信頼度の高い検出、2回目：残りのトラックに低い検出
+        high = np.flatnonzero(conf >= self.high_thr)
+        low = np.flatnonzero((conf >= self.low_thr) & (conf < self.high_thr))
+        t1, d1 = self._associate(rows, boxes[high])
+        t2, d2 = self._associate(np.setdiff1d(rows, t1), boxes[low])
+        tracked = np.concatenate([t1, t2])
+        matched = np.concatenate([high[d1], low[d2]])
+        self._correct(tracked, boxes[matched, :4])
+        self.hits[tracked] += 1
+        self.misses[tracked] = 0
+        self.conf[tracked] = boxes[matched, 4]
+
+        # 対応しなかった確信度の高い検出から新しいトラック
+        unmatched = np.setdiff1d(high, high[d1])
+        unmatched = unmatched[conf[unmatched] >= self.new_track_thr]
+        unmatched = unmatched[np.argsort(-conf[unmatched], kind="stable")]
+        created = self._start(boxes[unmatched])
+        unmatched = unmatched[: len(created)]
+
+        rows = np.concatenate([tracked, created])
+        idx = np.concatenate([matched, unmatched])
+        confirmed = (self.hits[rows] >= self.min_hits) | (self.frame <= self.min_hits)
+        self.visible[:] = False
+        self.visible[rows[confirmed]] = True
+        return self._tracks(rows[confirmed], idx[confirmed])
+
+    def predict(self):
+        self._advance()
+        rows = np.flatnonzero(self.visible & self.active)
+        return self._tracks(rows, np.full(len(rows), -1))
+
+    def _advance(self):
+        # 全トラックを1フレーム進め、長く見失ったトラックを消す
+        self.frame += 1
+        rows = np.flatnonzero(self.active)
+        mean = self.mean[rows] @ self.F.T
+        scale = mean[:, [2, 3, 2, 3]]
+        noise = np.concatenate(
+            [(self.STD_POSITION * scale) ** 2, (self.STD_VELOCITY * scale) ** 2], axis=1
+        )
+        self.mean[rows] = mean
+        self.cov[rows] = self.F @ self.cov[rows] @ self.F.T + self._diag(noise)
+        self.misses[rows] += 1
+        self.active[rows] = self.misses[rows] <= self.max_age
+        return rows[self.active[rows]]
+
+    def _associate(self, rows, boxes):
+        if not len(rows) or not len(boxes):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        overlap = detections.iou(self._xyxy(self.mean[rows]), boxes[:, :4])
+        # 異なるクラスは対応させない
+        overlap[self.cls[rows][:, None] != boxes[None, :, 5]] = 0
+        r, c = linear_sum_assignment(overlap, maximize=True)
+        keep = overlap[r, c] >= self.iou_thr
+        return rows[r[keep]], c[keep]
+
+    def _correct(self, rows, xyxy):
+        if not len(rows):
+            return
+        z = self._cxcywh(xyxy)
+        mean, cov = self.mean[rows], self.cov[rows]
+        scale = mean[:, [2, 3, 2, 3]]
+        S = cov[:, :4, :4] + self._diag((self.STD_POSITION * scale) ** 2)
+        # Sと共分散は対称なので K = P H^T S^-1 = (S^-1 H P)^T
+        gain = np.linalg.solve(S, cov[:, :4, :]).transpose(0, 2, 1)
+        innovation = z - mean[:, :4]
+        self.mean[rows] = mean + (gain @ innovation[..., None])[..., 0]
+        self.cov[rows] = cov - gain @ cov[:, :4, :]
+
+    def _start(self, boxes):
+        free = np.flatnonzero(~self.active)
+        n = min(len(boxes), len(free))
+        self.overflow += len(boxes) - n
+        rows, boxes = free[:n], boxes[:n]
+        z = self._cxcywh(boxes[:, :4])
+        scale = z[:, [2, 3, 2, 3]]
+        self.mean[rows] = np.concatenate([z, np.zeros_like(z)], axis=1)
+        std = np.concatenate(
+            [2 * self.STD_POSITION * scale, 10 * self.STD_VELOCITY * scale], axis=1
+        )
+        self.cov[rows] = self._diag(std**2)
+        self.ids[rows] = np.arange(self.next_id, self.next_id + n)
+        self.next_id += n
+        self.cls[rows] = boxes[:, 5]
+        self.conf[rows] = boxes[:, 4]
+        self.hits[rows] = 1
+        self.misses[rows] = 0
+        self.active[rows] = True
+        return rows
+
+    def _tracks(self, rows, idx):
+        return np.column_stack(
+            [
+                self._xyxy(self.mean[rows]),
+                self.ids[rows],
+                self.conf[rows],
+                self.cls[rows],
+                idx,
+            ]
+        ).astype(np.float32)
+
+    @staticmethod
+    def _diag(values):
+        n, d = values.shape
+        out = np.zeros((n, d, d))
+        out[:, np.arange(d), np.arange(d)] = values
+        return out
+
+    @staticmethod
+    def _cxcywh(xyxy):
+        xyxy = xyxy.astype(np.float64)
+        wh = np.maximum(xyxy[:, 2:] - xyxy[:, :2], 1.0)
+        return np.concatenate([xyxy[:, :2] + wh / 2, wh], axis=1)
+
+    @staticmethod
+    def _xyxy(mean):
+        half = np.maximum(mean[:, 2:4], 1.0) / 2
+        return np.concatenate([mean[:, :2] - half, mean[:, :2] + half], axis=1)
+
+
+def tracker_path(tracker):
+    """
+    Resolves a tracker config: a path, a config of this package or one shipped with ultralytics.
+
+    Args:
+        tracker (str): The path or name of the tracker YAML.
+
+    Returns:
+        str: The path of the config.
+    """
+
+    if os.path.exists(tracker):
+        return tracker
+    bundled = os.path.join(TRACKER_DIR, tracker)
+    if os.path.exists(bundled):
+        return bundled
+    return check_yaml(tracker)
+
+
+def load_tracker(tracker="botsort.yaml", frame_rate=30):
+    """
+    Creates the tracker of one stream from a tracker config.
+
+    Args:
+        tracker (str): The tracker config (botsort.yaml, bytetrack.yaml or iou.yaml).
+        frame_rate (float): The FPS of the stream.
+
+    Returns:
+        Tracker: The tracker.
+
+    Raises:
+        ValueError: If the config is neither ByteTrack, BoT-SORT nor the IoU tracker.
+    """
+
+    cfg = IterableSimpleNamespace(**yaml_load(tracker_path(tracker)))
+    frame_rate = round(frame_rate or 30)
+    if cfg.tracker_type == "iou":
+        return IoUTracker.from_config(cfg, frame_rate)
+    if cfg.tracker_type not in TRACKER_MAP:
+        raise ValueError(
+            f"Only 'bytetrack', 'botsort' and 'iou' are supported, got '{cfg.tracker_type}'"
+        )
+    return UltralyticsTracker(cfg, frame_rate)
+
+
+def update_tracker(tracker, result, frame):
+    """
+    Associates the detections of one frame with the tracks of a tracker.
+
+    Args:
+        tracker (Tracker): The tracker of the stream.
+        result (ultralytics.engine.results.Results): The detections of the frame.
+        frame (numpy.ndarray): The frame, used by BoT-SORT for camera motion compensation.
+
+    Returns:
+        ultralytics.engine.results.Results: The result restricted to the tracked boxes, with IDs;
+            without a confirmed track it holds no box at all.
+    """
+
+    tracks = tracker.update(result.boxes.data.cpu().numpy(), frame)
+    # 確定したトラックがなければ、未追跡の検出を残さず空の結果にする
+    idx = tracks[:, -1].astype(int)
+    result = result[idx]
+    result.update(boxes=torch.as_tensor(tracks[:, :-1]))
+    return result
+
+
+class TrackerPredictor:
+    """
+    Fills the frames the detector skipped with the boxes predicted by the tracker.
+
+    Used instead of `BoxPredictor` with a tracker that can predict, so the motion
+    model of the tracks keeps advancing on every frame.
+
+    Attributes:
+        tracker (Tracker): The tracker of the stream.
+    """
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+
+    def update(self, packet):
+        # 検出したフレームはトラッカーが更新済み
+        pass
+
+    def predict(self, packet):
+        """
+        Fills a skipped frame with the predicted tracks.
+
+        Args:
+            packet (FramePacket): The frame the detector skipped.
+
+        Returns:
+            None
+        """
+
+        tracks = self.tracker.predict()
+        packet.detections = detections.from_array(
+            np.rint(tracks[:, :4]), tracks[:, 4], tracks[:, 6], tracks[:, 5]
+        )
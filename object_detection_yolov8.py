@@ -1,15 +1,45 @@
 import argparse
-import asyncio
-import json
+import functools
 import logging
 import os
+import signal
+import sys
+import tempfile
+import time
 from datetime import datetime
 from enum import Enum
 
 import cv2
-import requests
 from ultralytics import YOLO
 
+from detection.alert import AlertDispatcher
+from detection.annotate import Annotator
+from detection.backend import BACKENDS, load_model, model_path
+from detection.cache import CachedDetector, DetectionCache
+from detection.capture import LatestFrameReader
+from detection.chunked import track_parallel
+from detection.clip import ClipRecorder
+from detection.config import load_cameras
+from detection.detlog import DetectionLogReader, DetectionLogWriter
+from detection.dwell import DwellEngine, parse_zone
+from detection.logger import setup_logging
+from detection.metrics import FrameProfiler, MetricsRegistry, MetricsServer
+from detection.motion import MotionGate
+from detection.multistream import BatchGatherer, MultiStreamTracker, StreamCapture
+from detection.pipeline import FramePacket, Pipeline
+from detection.preview import PreviewServer
+from detection.recorder import SegmentRecorder
+from detection.scheduler import BudgetScheduler
+from detection.snapshot import SnapshotEncoder
+from detection.stages import CaptureSource, TrackStage, VideoSink, YoloDetector
+from detection.stride import AdaptiveStride
+from detection.supervisor import Supervisor
+from detection.tiling import TiledDetector, plan_tiles, zone_regions
+
+
+# nginxが配信するアラート画像の保存先
+NGINX_IMAGE_DIR = "server/docker/nginx/images"
+
 
 class AlertStatus(Enum):
     CAMERA = "CAMERA"
@@ -39,35 +69,37 @@ def print_arguments(func):
             The result of the original function.
         """
 
-        setting_logger()
         result = func(*args, **kwargs)
+        setting_logger(result)
         print("arguments------")
         for key, value in vars(result).items():
             print(f"{key}: {value}")
         print("------arguments")
         return result
 
-    def setting_logger():
+    def setting_logger(args):
         """
         Sets up the logger for the application.
 
-        This function creates a directory named "logs" if it doesn't already exist and configures.
-        Logging module to write logs to a file named "logger.log" inside the "logs" directory.
-        Log level is set to INFO, and the log message format includes the timestamp, log level, and the log message itself.
+        This function creates a directory named "logs" if it doesn't already exist and
+        sends the logs through a queue to a background thread writing "logger.log"
+        (or "logger.jsonl" with --log_json) inside the "logs" directory.
+        Log level is set to INFO, and every call site is rate limited with --log_rate.
 
         Parameters:
-            None
+            args (argparse.Namespace): The parsed command line arguments.
 
         Returns:
             None
         """
         LOG_DIR = "./logs"
         os.makedirs(LOG_DIR, exist_ok=True)
-        logging.basicConfig(
-            filename=f"{LOG_DIR}/logger.log",
+        setup_logging(
+            f"{LOG_DIR}/logger.jsonl" if args.log_json else f"{LOG_DIR}/logger.log",
             level=logging.INFO,
-            format="{asctime} [{levelname:.4}] {message}",
-            style="{",
+            json_lines=args.log_json,
+            rate=args.log_rate,
+            sample=args.log_sample,
         )
         logging.info("start detection")
 
@@ -99,6 +131,43 @@ def parse_arguments():
             type=str,
             help="Input file path",
         )
+        parser.add_argument(
+            "-s",
+            "--sources",
+            nargs="+",
+            default=[],
+            type=str,
+            help="Cameras (index or URL) or video files tracked together with one model",
+        )
+        parser.add_argument(
+            "--config",
+            default="",
+            type=str,
+            help="YAML or TOML file listing the cameras with their zones, thresholds and sinks",
+        )
+        parser.add_argument(
+            "--budget",
+            default=0,
+            type=float,
+            help="Frames per second inferred for all streams, shared by priority and activity (0: unlimited)",
+        )
+        parser.add_argument(
+            "--supervisor",
+            action="store_true",
+            help="Run --sources in capture processes and one inference process sharing frames in shared memory",
+        )
+        parser.add_argument(
+            "--supervisor_slots",
+            default=4,
+            type=int,
+            help="Shared-memory frame slots per source in --supervisor mode",
+        )
+        parser.add_argument(
+            "--tracker",
+            default="botsort.yaml",
+            type=str,
+            help="Tracker config (botsort.yaml, bytetrack.yaml or iou.yaml)",
+        )
         parser.add_argument(
             "-o",
             "--output",
@@ -120,7 +189,243 @@ def parse_arguments():
             help="File path of object detection model",
         )
         parser.add_argument(
-            "-t", "--thr", default=100, type=int, help="Person continuous threshold"
+            "--backend",
+            default="torch",
+            choices=BACKENDS,
+            type=str,
+            help="Inference backend; exported models are cached, onnx_int8 needs calibration",
+        )
+        parser.add_argument(
+            "--imgsz", default=640, type=int, help="Input size of the model"
+        )
+        parser.add_argument(
+            "--intra_threads",
+            default=0,
+            type=int,
+            help="ONNX Runtime threads inside an operator (0: default)",
+        )
+        parser.add_argument(
+            "--inter_threads",
+            default=0,
+            type=int,
+            help="ONNX Runtime operators run in parallel (0: sequential)",
+        )
+        parser.add_argument(
+            "--warmup",
+            default=3,
+            type=int,
+            help="Warm-up inferences before the capture opens",
+        )
+        parser.add_argument(
+            "-t", "--thr", default=100, type=int, help="Person dwell threshold (frames)"
+        )
+        parser.add_argument(
+            "-z",
+            "--zone",
+            action="append",
+            default=[],
+            type=str,
+            help='Polygon zone "x1,y1 x2,y2 x3,y3 ..." for the dwell (repeatable)',
+        )
+        parser.add_argument(
+            "--cooldown",
+            default=1800,
+            type=int,
+            help="Frames before the same person can raise another alert",
+        )
+        parser.add_argument(
+            "--dwell_ttl",
+            default=30,
+            type=int,
+            help="Processed frames after which a person who left is forgotten",
+        )
+        parser.add_argument(
+            "--tile_size",
+            default=0,
+            type=int,
+            help="Detect the zones in tiles of this many pixels, inferred at --imgsz in one batch (0: whole frame)",
+        )
+        parser.add_argument(
+            "--tile_overlap",
+            default=0.2,
+            type=float,
+            help="Fraction of a tile shared with its neighbour",
+        )
+        parser.add_argument(
+            "--tile_full_frame",
+            action="store_true",
+            help="Also detect the whole frame in the tile batch, for people larger than a tile",
+        )
+        parser.add_argument(
+            "--target_fps",
+            default=0,
+            type=float,
+            help="Run the detector on every k-th frame to keep up with this FPS (0: every frame)",
+        )
+        parser.add_argument(
+            "--max_stride",
+            default=8,
+            type=int,
+            help="Largest number of frames between two detections with --target_fps",
+        )
+        parser.add_argument(
+            "--motion_gate",
+            action="store_true",
+            help="Reuse the last result instead of running the detector while nothing moves",
+        )
+        parser.add_argument(
+            "--motion_sensitivity",
+            default=0.002,
+            type=float,
+            help="Fraction of changed pixels that counts as motion",
+        )
+        parser.add_argument(
+            "--motion_refresh",
+            default=30,
+            type=int,
+            help="Run the detector after this many gated frames even without motion",
+        )
+        parser.add_argument(
+            "--headless",
+            action="store_true",
+            help="Do not open a window; stop with SIGINT or SIGTERM",
+        )
+        parser.add_argument(
+            "--no_render",
+            action="store_true",
+            help="Skip drawing, display and the output video; alert images are still drawn",
+        )
+        parser.add_argument(
+            "--no_record",
+            action="store_true",
+            help="Do not write the full-length output video",
+        )
+        parser.add_argument(
+            "--segment_seconds",
+            default=0,
+            type=float,
+            help="Split the output video into segments of this length (0: one file)",
+        )
+        parser.add_argument(
+            "--record_codec",
+            default="mp4v",
+            type=str,
+            help="FourCC of the output video (e.g. mp4v, avc1, MJPG)",
+        )
+        parser.add_argument(
+            "--record_quality",
+            default=0,
+            type=int,
+            help="Quality 1-100 of the output video if the codec supports it (0: default)",
+        )
+        parser.add_argument(
+            "--record_scale",
+            default=1.0,
+            type=float,
+            help="Scale of the output video resolution",
+        )
+        parser.add_argument(
+            "--record_stride",
+            default=1,
+            type=int,
+            help="Record only every n-th frame",
+        )
+        parser.add_argument(
+            "--record_budget",
+            default=0,
+            type=float,
+            help="Disk budget of the segments in MB; the oldest are deleted (0: unlimited)",
+        )
+        parser.add_argument(
+            "--clip_pre",
+            default=0,
+            type=float,
+            help="Seconds of frames before an alert saved in its clip (0: no clips)",
+        )
+        parser.add_argument(
+            "--clip_post",
+            default=0,
+            type=float,
+            help="Seconds of frames after an alert saved in its clip",
+        )
+        parser.add_argument(
+            "--detection_log",
+            default="",
+            type=str,
+            help="Directory of the columnar log of every tracked object (empty: disabled)",
+        )
+        parser.add_argument(
+            "--detection_cache",
+            default="",
+            type=str,
+            help="Directory caching the tracks of --video files (empty: disabled)",
+        )
+        parser.add_argument(
+            "--cache_size",
+            default=2000,
+            type=float,
+            help="Size limit of the detection cache in MB; least recently used entries are deleted",
+        )
+        parser.add_argument(
+            "--chunk_workers",
+            default=0,
+            type=int,
+            help="Track the --video file in overlapping chunks on this many processes (0: sequential)",
+        )
+        parser.add_argument(
+            "--chunk_seconds",
+            default=60,
+            type=float,
+            help="Length of the chunks tracked in parallel",
+        )
+        parser.add_argument(
+            "--chunk_overlap",
+            default=2,
+            type=float,
+            help="Seconds tracked by both neighbouring chunks to stitch the track IDs",
+        )
+        parser.add_argument(
+            "--preview_port",
+            default=0,
+            type=int,
+            help="Serve an MJPEG preview on this local port (0: disabled)",
+        )
+        parser.add_argument(
+            "--preview_fps",
+            default=5,
+            type=float,
+            help="Maximum FPS of the MJPEG preview",
+        )
+        parser.add_argument(
+            "--metrics_port",
+            default=0,
+            type=int,
+            help="Serve Prometheus metrics on this local port at /metrics (0: disabled)",
+        )
+        parser.add_argument(
+            "--profile_frames",
+            default=0,
+            type=int,
+            help="Profile the pipeline threads with cProfile for this many frames (0: disabled)",
+        )
+        parser.add_argument(
+            "--profile_start",
+            default=300,
+            type=int,
+            help="Frame at which the profiled window starts",
+        )
+        parser.add_argument(
+            "--profile_output",
+            default=f"./outputs/{now}_profile.prof",
+            type=str,
+            help="pstats file of the profiled window",
+        )
+        parser.add_argument(
+            "--profile_stage",
+            default="",
+            type=str,
+            help="Profile only this stage (e.g. track, annotate, sink; empty: all); "
+            "required on Python 3.12+, which runs one cProfile at a time",
         )
         parser.add_argument(
             "-u", "--url", default="http://localhost:8000", type=str, help="POST URL"
@@ -128,87 +433,177 @@ def parse_arguments():
         parser.add_argument(
             "-n", "--nginx", default="http://localhost:8001", type=str, help="Nginx URL"
         )
+        parser.add_argument(
+            "-q",
+            "--queue_size",
+            default=4,
+            type=int,
+            help="Capacity of the queues between the pipeline stages",
+        )
+        parser.add_argument(
+            "--snapshot_format",
+            default="jpg",
+            choices=["jpg", "webp", "png"],
+            type=str,
+            help="Image format of the alert snapshots",
+        )
+        parser.add_argument(
+            "--snapshot_quality",
+            default=90,
+            type=int,
+            help="Quality of jpg and webp alert snapshots",
+        )
+        parser.add_argument(
+            "--snapshot_crop",
+            action="store_true",
+            help="Also save a crop around the person who raised the alert",
+        )
+        parser.add_argument(
+            "--snapshot_thumbnail",
+            default=0,
+            type=int,
+            help="Also save a thumbnail of the alerting person of this width (0: no thumbnail)",
+        )
+        parser.add_argument(
+            "--alert_retries",
+            default=3,
+            type=int,
+            help="Retries of each alert POST request",
+        )
+        parser.add_argument(
+            "--log_json",
+            action="store_true",
+            help="Write the log as JSON lines tagged with the camera and frame",
+        )
+        parser.add_argument(
+            "--log_rate",
+            default=5.0,
+            type=float,
+            help="Log records per second allowed from each call site (0: unlimited)",
+        )
+        parser.add_argument(
+            "--log_sample",
+            default=0.0,
+            type=float,
+            help="Fraction of the per-frame tracking records logged (0: none)",
+        )
     except Exception as e:
         logging.error(f"Failed to parse arguments: {e}")
         raise SystemExit
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    batched = batched_options(args)
+    if args.backend != "torch" and batched:
+        parser.error(
+            f"--backend {args.backend} takes one frame per inference; "
+            f"use --backend torch with {', '.join(batched)}"
+        )
+    one_profiler = sys.version_info >= (3, 12)
+    if args.profile_frames > 0 and not args.profile_stage and one_profiler:
+        parser.error("--profile_frames needs --profile_stage on Python 3.12+")
+    recording = recording_options(parser, args)
+    if args.sources and args.supervisor and recording:
+        parser.error(
+            f"{', '.join(recording)}: --supervisor mode records no output video"
+        )
+    single = single_stream_options(args)
+    if (args.sources or args.config) and single:
+        parser.error(
+            f"{', '.join(single)}: single --video or camera only, "
+            f"not supported with {'--sources' if args.sources else '--config'}"
+        )
+    return args
 
 
-def post_picture(url, alert_image_path):
+def batched_options(args):
     """
-    Sends a POST request to the specified URL with the provided alert image path.
+    Lists the options that infer several frames or tiles in one batch.
+
+    The exported ONNX and OpenVINO models have a batch size of 1, so these
+    options only work with the torch backend.
 
     Args:
-        url (str): The URL to send the POST request to.
-        alert_image_path (str): The path to the alert image.
+        args (argparse.Namespace): The command line arguments.
 
     Returns:
-        The ID of the picture received from the POST request.
-
-    Raises:
-        Exception: If the POST request fails.
+        list[str]: The batched options that are set.
     """
 
-    try:
-        res = requests.post(
-            f"{url}/picture",
-            json={"picture": alert_image_path},
-            timeout=10,
-        )
-        print("POST request send successfully.")
+    options = []
+    if args.sources:
+        options.append("--sources")
+    if args.config:
+        options.append("--config")
+    if args.tile_size > 0:
+        options.append("--tile_size")
+    return options
 
-        res_picture_id = json.loads(res.text)["picture_id"]
-        logging.info(f"Alert image link: {alert_image_path}")
 
-        return res_picture_id
-    except Exception as e:
-        print(f"Failed to send POST picture request: {e}")
-        logging.error(f"Failed to send POST picture request: {e}")
-
-
-async def post_alert(url, picture_id, status, alert_file):
+def recording_options(parser, args):
     """
-    Async sends a POST request to the specified URL with the given picture ID, status, and alert file.
+    Lists the options of the output video changed from their defaults.
 
     Args:
-        url (str): The URL to send the POST request to.
-        picture_id (int): The ID of the picture.
-        status (str): The status of the alert.
-        alert_file (str): The path to the alert file.
+        parser (argparse.ArgumentParser): The parser of the command line.
+        args (argparse.Namespace): The command line arguments.
 
     Returns:
-        None
-
-    Raises:
-        Exception: If the POST request fails to send.
+        list[str]: The changed recording options.
     """
 
-    try:
-        res = await asyncio.to_thread(
-            requests.post,
-            f"{url}/alert",
-            json={"picture_id": picture_id, "status": status},
-            timeout=10,
-        )
-        print("POST request send successfully.")
+    names = [
+        "output",
+        "segment_seconds",
+        "record_codec",
+        "record_quality",
+        "record_scale",
+        "record_stride",
+        "record_budget",
+    ]
+    return [
+        f"--{name}" for name in names if getattr(args, name) != parser.get_default(name)
+    ]
+
+
+def single_stream_options(args):
+    """
+    Lists the options only the single-stream pipeline supports.
 
-        res_picture = json.loads(res.text)["picture"]
+    The multi-stream runner of --sources and --config tracks every stream in one
+    batch, without frame skipping, motion gating, tiles, alert clips or the
+    detection cache of a video file.
 
-        with open(alert_file, "a") as f:
-            f.write(f"{res_picture}\n")
-    except Exception as e:
-        print(f"Failed to send POST alert request: {e}")
-        logging.error(f"Failed to send POST alert request: {e}")
+    Args:
+        args (argparse.Namespace): The command line arguments.
 
+    Returns:
+        list[str]: The single-stream options that are set.
+    """
 
-def release(video, cap):
+    options = []
+    if args.target_fps > 0:
+        options.append("--target_fps")
+    if args.motion_gate:
+        options.append("--motion_gate")
+    if args.tile_size > 0:
+        options.append("--tile_size")
+    if args.clip_pre > 0 or args.clip_post > 0:
+        options.append("--clip_pre/--clip_post")
+    if args.detection_cache:
+        options.append("--detection_cache")
+    if args.chunk_workers > 0:
+        options.append("--chunk_workers")
+    return options
+
+
+def release(video, cap, headless=False):
     """
     Release the video and camera resources.
 
     Args:
-        video (cv2.VideoWriter): The video writer object.
+        video (SegmentRecorder or None): The recorder of the output video.
         cap (cv2.VideoCapture): The video capture object.
+        headless (bool): True if no window was opened.
 
     Returns:
         None
@@ -216,9 +611,334 @@ def release(video, cap):
     # videoの書き込み/読み込み終了
     print("end detection")
     logging.info("end detection")
-    video.release()
+    if video is not None:
+        video.release()
     cap.release()
-    cv2.destroyAllWindows()
+    if not headless:
+        cv2.destroyAllWindows()
+
+
+def handle_stop_signals(pipeline):
+    """
+    Stops the pipeline on SIGINT or SIGTERM; the queued frames are still written.
+
+    Args:
+        pipeline (Pipeline): The running pipeline.
+
+    Returns:
+        None
+    """
+
+    def on_signal(signum, _):
+        print("STOP PLAY!!!")
+        logging.warning(f"STOP PLAY!!! ({signal.Signals(signum).name})")
+        pipeline.stop()
+
+    signal.signal(signal.SIGINT, on_signal)
+    signal.signal(signal.SIGTERM, on_signal)
+
+
+def start_preview(args):
+    """
+    Starts the MJPEG preview server if a preview port is given.
+
+    Args:
+        args (argparse.Namespace): The command line arguments with preview_port and preview_fps.
+
+    Returns:
+        PreviewServer or None: The running preview server.
+    """
+
+    if not args.preview_port or args.no_render:
+        return None
+    preview = PreviewServer(args.preview_port, args.preview_fps)
+    preview.start()
+    return preview
+
+
+def start_metrics(args):
+    """
+    Starts the Prometheus metrics endpoint if a metrics port is given.
+
+    Without a port no metric is created, so the pipeline pays nothing for them.
+
+    Args:
+        args (argparse.Namespace): The command line arguments with metrics_port.
+
+    Returns:
+        tuple: The registry and the running server, or (None, None).
+    """
+
+    if not args.metrics_port:
+        return None, None
+    metrics = MetricsRegistry()
+    server = MetricsServer(args.metrics_port, metrics)
+    server.start()
+    return metrics, server
+
+
+def frame_profiler(args):
+    """
+    Creates the profiler of the pipeline threads if a profiled window is given.
+
+    Args:
+        args (argparse.Namespace): The command line arguments with profile_frames,
+            profile_start, profile_output and profile_stage.
+
+    Returns:
+        FrameProfiler or None: The profiler.
+    """
+
+    if args.profile_frames <= 0:
+        return None
+    os.makedirs(os.path.dirname(args.profile_output) or ".", exist_ok=True)
+    return FrameProfiler(
+        args.profile_start,
+        args.profile_frames,
+        args.profile_output,
+        args.profile_stage or None,
+    )
+
+
+def open_capture(source, args):
+    """
+    Opens a video file or camera and requests the configured frame size.
+
+    Args:
+        source (str or int): The path of the video file, or the index of the camera.
+        args (argparse.Namespace): The command line arguments with camera_width and camera_height.
+
+    Returns:
+        cv2.VideoCapture: The opened capture.
+    """
+
+    cap = cv2.VideoCapture(source)
+
+    # camera_width*camera_height にリサイズ
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, args.camera_width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, args.camera_height)
+
+    # FPS確保のため圧縮
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc("M", "J", "P", "G"))
+    # cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc('Y', 'U', 'Y', 'V'));
+
+    return cap
+
+
+def open_video_writer(output_file_path, cap, args):
+    """
+    Creates the background recorder of the output video with the FPS and frame size of the capture.
+
+    Args:
+        output_file_path (str or None): The path of the output video file, or None for no output video.
+        cap (cv2.VideoCapture): The capture whose frames are written.
+        args (argparse.Namespace): The command line arguments with the record options.
+
+    Returns:
+        tuple: The recorder (or None), and the width and height of the frames.
+    """
+
+    CLIP_FPS = cap.get(cv2.CAP_PROP_FPS)
+    H = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    W = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+
+    if output_file_path is None:
+        return None, W, H
+    video = SegmentRecorder(
+        output_file_path,
+        CLIP_FPS,
+        (W, H),
+        segment_seconds=args.segment_seconds,
+        codec=args.record_codec,
+        quality=args.record_quality,
+        scale=args.record_scale,
+        stride=args.record_stride,
+        budget_mb=args.record_budget,
+    )
+    return video, W, H
+
+
+def load_overlay(W, H):
+    """
+    Loads the alert image resized to the frame size.
+
+    Args:
+        W (int): The width of the frame.
+        H (int): The height of the frame.
+
+    Returns:
+        numpy.ndarray: The resized alert image.
+    """
+
+    danger_file_path = "./images/danger.png"
+    overlay_image = cv2.imread(danger_file_path, cv2.COLOR_BGR2RGB)
+    return cv2.resize(overlay_image, (W, H))
+
+
+def parse_source(source):
+    """
+    Converts a source given on the command line to a cv2.VideoCapture argument.
+
+    Args:
+        source (str): A camera index, a stream URL or a video file path.
+
+    Returns:
+        tuple: The capture argument, and True if the source is a live camera or stream.
+    """
+
+    if source.isdigit():
+        return int(source), True
+    return source, source.startswith(("rtsp://", "rtmp://", "http://", "https://"))
+
+
+def dwell_engine(args, W, H):
+    """
+    Creates the per-track dwell engine of a stream.
+
+    Args:
+        args (argparse.Namespace): The command line arguments with thr, zone, cooldown and dwell_ttl.
+        W (int): The width of the frame.
+        H (int): The height of the frame.
+
+    Returns:
+        DwellEngine: The dwell engine.
+    """
+
+    # 閾値（ゾーン内の滞在フレーム数がこの値を超えたら警告）
+    zones = [parse_zone(zone) for zone in args.zone]
+    return DwellEngine(args.thr, zones, (W, H), args.cooldown, args.dwell_ttl)
+
+
+def open_detection_cache(args):
+    """
+    Looks up the cached tracks of the --video file.
+
+    The cache is only used in --video mode and without --target_fps, whose skipped
+    frames depend on the speed of the machine. The motion gate settings are part
+    of the key, because the gated frames reuse the previous tracks.
+
+    Args:
+        args (argparse.Namespace): The command line arguments.
+
+    Returns:
+        tuple: The cache, the key and the cached tracks (reader, metadata),
+            with None for whatever is not available.
+    """
+
+    if not args.video or not args.detection_cache:
+        return None, None, None
+    if args.target_fps > 0:
+        logging.warning("The detection cache is disabled with --target_fps")
+        return None, None, None
+
+    options = {"backend": args.backend, "imgsz": args.imgsz}
+    if args.tile_size > 0:
+        options["tiles"] = [args.tile_size, args.tile_overlap, args.tile_full_frame]
+    if args.motion_gate:
+        options["motion"] = [args.motion_sensitivity, args.motion_refresh]
+    if args.chunk_workers > 0 and not (args.motion_gate or args.tile_size > 0):
+        # チャンクをつなぎ合わせたIDは逐次処理のIDと異なる
+        options["chunks"] = [args.chunk_seconds, args.chunk_overlap]
+    cache = DetectionCache(args.detection_cache, args.cache_size)
+    cache_key = cache.key(args.video, args.weights, args.tracker, **options)
+    return cache, cache_key, cache.lookup(cache_key)
+
+
+def track_in_chunks(args, cache, cache_key):
+    """
+    Tracks the --video file in overlapping chunks on a process pool.
+
+    The stitched tracks are stored in the detection cache, or in a temporary
+    directory without a cache, and then replayed through the usual dwell and
+    alert stages so the alerts are those of a sequential run.
+
+    Args:
+        args (argparse.Namespace): The command line arguments.
+        cache (DetectionCache or None): The detection cache.
+        cache_key (str or None): The key of the video in the cache.
+
+    Returns:
+        tuple: The tracks (reader, metadata) or None, and the temporary directory
+            to clean up or None.
+    """
+
+    if args.motion_gate or args.target_fps > 0 or args.tile_size > 0:
+        logging.warning(
+            "--chunk_workers is disabled with --motion_gate, --target_fps and --tile_size"
+        )
+        return None, None
+
+    tmp_dir = None
+    if cache is not None:
+        writer = cache.writer(cache_key)
+    else:
+        tmp_dir = tempfile.TemporaryDirectory()
+        writer = DetectionLogWriter(tmp_dir.name)
+
+    # 各プロセスが同じ変換済みモデルを読み込む
+    weights, _ = model_path(args.weights, args.backend, args.imgsz)
+
+    start = datetime.now()
+    names = track_parallel(
+        args.video,
+        weights,
+        args.tracker,
+        writer,
+        args.chunk_workers,
+        args.chunk_seconds,
+        args.chunk_overlap,
+        args.imgsz,
+    )
+    message = f"tracked {writer.frames} frames in {datetime.now() - start}"
+    print(message)
+    logging.info(message)
+
+    if names is None:
+        # フレームを読めないか逐次の読み込みと合わない場合は通常の処理に任せる
+        if cache is not None:
+            cache.discard(writer)
+        return None, tmp_dir
+    if cache is None:
+        writer.close()
+        return (DetectionLogReader(tmp_dir.name), {"names": names}), tmp_dir
+    cache.commit(cache_key, writer, names=names, video=os.path.abspath(args.video))
+    return cache.lookup(cache_key), None
+
+
+def alert_callback(dispatcher, snapshots, alert_status, name="", clips=None):
+    """
+    Creates the callback that encodes the alert snapshots of a stream and queues the alert.
+
+    Args:
+        dispatcher (AlertDispatcher): The dispatcher that sends the alert.
+        snapshots (SnapshotEncoder): The encoder of the alert snapshots.
+        alert_status (str): The status of the alert (CAMERA or MP4).
+        name (str): The name of the stream added to the alert file name.
+        clips (ClipRecorder or None): The recorder of the event clips.
+
+    Returns:
+        callable: A function that takes the annotated frame, the alerting tracker IDs,
+        the frame number and the boxes of the alerting persons.
+    """
+
+    # ログのカメラ名（単一ストリームは"0"）
+    camera = name.lstrip("_") or "0"
+
+    def on_alert(frame, ids, index, boxes):
+        now = datetime.now().strftime("%Y%m%d_%Hh%Mm%Ss")
+        alert_name = f"{now}{name}_{ids[0]}_person_alert"
+        print(f"ALERT!! {ids}")
+        logging.info(f"ALERT!! {ids}", extra={"camera": camera, "frame": index})
+
+        clip_file = None
+        if clips is not None:
+            clip_file = f"{alert_name}.mp4"
+            clips.trigger(clip_file, index)
+        # スレッドプールで画像を書き出し、バックグラウンドでpost送信（キューに積むだけ）
+        snapshot = snapshots.submit(frame, alert_name, boxes[0])
+        dispatcher.submit(alert_name, snapshot, alert_status, clip_file)
+
+    return on_alert
 
 
 def main(args):
@@ -228,189 +948,756 @@ def main(args):
     Parameters:
     - args: A dictionary containing the command line arguments passed to the function.
         - video: The path to the video file to be processed.
+        - sources: The list of cameras or videos processed together (multi-stream mode).
+        - config: The YAML or TOML file listing the cameras (multi-stream mode).
+        - budget: The frames per second inferred for all streams (0: unlimited).
+        - supervisor: Whether to run the sources in supervised capture and inference processes.
+        - supervisor_slots: The shared-memory frame slots per source in supervisor mode.
+        - tracker: The tracker config.
         - weights: The path to the YOLOv8 weights file.
+        - backend: The inference backend (torch, onnx, openvino or onnx_int8).
+        - imgsz: The input size of the model.
+        - intra_threads: The ONNX Runtime threads inside an operator (0: default).
+        - inter_threads: The ONNX Runtime operators run in parallel (0: sequential).
+        - warmup: The number of warm-up inferences before the capture opens.
         - output: The name of the output video file.
         - camera_width: The width of the camera frame.
         - camera_height: The height of the camera frame.
-        - thr: The threshold for detecting people.
+        - thr: The dwell of a person that raises an alert, in frames of the video.
+        - zone: The polygon zones the dwell is measured in (whole frame if empty).
+        - cooldown: The frames before the same person can raise another alert.
+        - dwell_ttl: The processed frames after which a person who left is forgotten.
+        - tile_size: The side of the detection tiles over the zones (0: whole frame).
+        - tile_overlap: The fraction of a tile shared with its neighbour.
+        - tile_full_frame: Whether to also detect the whole frame with the tiles.
+        - target_fps: The FPS the detection keeps up with by skipping inference (0: disabled).
+        - max_stride: The largest number of frames between two detections.
+        - motion_gate: Whether to skip the detector while nothing moves.
+        - motion_sensitivity: The fraction of changed pixels that counts as motion.
+        - motion_refresh: The number of gated frames after which the detector runs anyway.
+        - queue_size: The capacity of the queues between the pipeline stages.
+        - headless: Whether to run without a window.
+        - no_render: Whether to skip drawing, display and the output video.
+        - no_record: Whether to skip the full-length output video.
+        - segment_seconds: The length of the output video segments (0: one file).
+        - record_codec: The FourCC of the output video.
+        - record_quality: The quality of the output video (0: codec default).
+        - record_scale: The scale of the output video resolution.
+        - record_stride: Record only every n-th frame.
+        - record_budget: The disk budget of the segments in MB (0: unlimited).
+        - clip_pre: The seconds of frames before an alert saved in its clip.
+        - clip_post: The seconds of frames after an alert saved in its clip.
+        - detection_log: The directory of the columnar detection log (empty: disabled).
+        - detection_cache: The directory caching the tracks of --video files (empty: disabled).
+        - cache_size: The size limit of the detection cache in MB.
+        - chunk_workers: The processes tracking the --video file in chunks (0: sequential).
+        - chunk_seconds: The length of the chunks tracked in parallel.
+        - chunk_overlap: The seconds tracked by both neighbouring chunks.
+        - preview_port: The local port of the MJPEG preview (0: disabled).
+        - preview_fps: The maximum FPS of the MJPEG preview.
+        - metrics_port: The local port of the Prometheus metrics (0: disabled).
+        - profile_frames: The frames profiled with cProfile (0: disabled).
+        - profile_start: The frame at which the profiled window starts.
+        - profile_output: The pstats file of the profiled window.
+        - profile_stage: The only stage profiled (empty: all stages).
+        - url: The URL of the FastAPI server.
+        - nginx: The URL of nginx serving the alert images.
+        - alert_retries: The retries of each alert POST request.
+        - snapshot_format: The image format of the alert snapshots.
+        - snapshot_quality: The quality of jpg and webp alert snapshots.
+        - snapshot_crop: Whether to also save a crop around the alerting person.
+        - snapshot_thumbnail: The width of the alert thumbnail (0: no thumbnail).
 
     Returns:
     - None
 
     This function performs the following steps:
     1. Sets up the necessary directories and files.
-    2. Reads the video file or initializes the camera stream.
-    3. Sets the frame size and FPS of the video.
-    4. Initializes the YOLOv8 model.
+    2. Loads and warms up the YOLOv8 model, or replays the cached tracks of the video.
+    3. Reads the video file or initializes the camera stream.
+    4. Sets the frame size and FPS of the video.
     5. Loads the overlay image for the alert.
-    6. Enters the detection loop, which continues until the video is finished or the user presses a key.
-    7. Reads a frame from the video.
+    6. Runs the capture, track, annotate and sink stages on their own threads,
+       connected by bounded queues, until the video is finished or the user presses a key.
+       A live camera is read by its own thread and only its newest frame is tracked.
+    7. Flushes the queued frames into the output video and reports the FPS of each stage.
     """
 
-    # 定数
-    PERSON = "person"
-    BLUE = (255, 0, 0)
-    GREEN = (0, 255, 0)
-    RED = (0, 0, 255)
-    SMALL = 1
-    MEDIUM = 2
-    LARGE = 4
+    # 設定ファイルの全体設定を引数に反映
+    streams = None
+    if args.config:
+        args, streams = load_cameras(args.config, args)
+        if args.backend != "torch":
+            # 設定ファイルでもバックエンドを変えられる
+            raise ValueError(
+                f"--backend {args.backend} takes one frame per inference; "
+                f"{args.config} needs the torch backend"
+            )
+        single = single_stream_options(args)
+        if single:
+            raise ValueError(
+                f"{', '.join(single)}: single --video or camera only, "
+                f"not supported in {args.config}"
+            )
+
+    # 描画しない場合は表示も動画出力もしない
+    if args.no_render:
+        args.headless = True
+
+    if args.sources and args.supervisor:
+        main_supervisor(args)
+        return
+    if streams is not None:
+        main_multi(args, streams)
+        return
+    if args.sources:
+        main_multi(args, source_streams(args))
+        return
 
     alert_dir = "./alerts"
     output_dir = "./outputs"
     output_file_path = f"{output_dir}/{args.output}"
+    if args.no_render or args.no_record:
+        output_file_path = None
 
     # 出力先がなければ作成
     os.makedirs(alert_dir, exist_ok=True)
     os.makedirs(output_dir, exist_ok=True)
 
+    # キャッシュがあれば推論せずに再生
+    cache, cache_key, cached = open_detection_cache(args)
+    tmp_dir = None
+    if cached is None and args.video and args.chunk_workers > 0:
+        cached, tmp_dir = track_in_chunks(args, cache, cache_key)
+    if cached is not None:
+        reader, meta = cached
+        on_stale = None
+        if cache is not None and tmp_dir is None:
+            on_stale = functools.partial(cache.remove, cache_key)
+        detector = CachedDetector(reader, meta["names"], on_stale)
+        print(f"replay the cached tracks: {reader.path}")
+        logging.info(f"replay the cached tracks: {reader.path}")
+    else:
+        # カメラを開く前にモデルを準備（変換済みモデルのキャッシュとウォームアップ）
+        model = load_model(
+            args.weights,
+            args.backend,
+            args.imgsz,
+            args.warmup,
+            intra_threads=args.intra_threads,
+            inter_threads=args.inter_threads,
+        )
+
     try:
         if args.video:
-            cap = cv2.VideoCapture(args.video)
+            cap = open_capture(args.video, args)
             alpha = 0.99
             alert_status = AlertStatus.MP4.value
         else:
             # カメラの読み込み
-            cap = cv2.VideoCapture(0)
+            cap = open_capture(0, args)
             alpha = 0.8
             alert_status = AlertStatus.CAMERA.value
     except Exception as e:
         logging.error(f"Failed to video capture: {e}")
 
-    # camera_width*camera_height にリサイズ
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, args.camera_width)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, args.camera_height)
+    video, W, H = open_video_writer(output_file_path, cap, args)
+    overlay = load_overlay(W, H)
+
+    # 遠くの小さな人物のためにゾーンをタイルに分けて推論
+    if args.tile_size > 0 and cached is None:
+        regions = zone_regions([parse_zone(zone) for zone in args.zone], (W, H))
+        tiles = plan_tiles(regions, args.tile_size, args.tile_overlap)
+        detector = TiledDetector(
+            model,
+            tiles,
+            args.imgsz,
+            args.tile_full_frame,
+            tracker=args.tracker,
+            frame_rate=cap.get(cv2.CAP_PROP_FPS),
+        )
+        logging.info(f"detect {len(tiles)} tiles of {args.tile_size}px per frame")
+    elif cached is None:
+        detector = YoloDetector(model, args.tracker, cap.get(cv2.CAP_PROP_FPS))
+
+    # 無効なら計測用のオブジェクトは作らない
+    metrics, metrics_server = start_metrics(args)
+
+    # アラート送信用のワーカー
+    snapshots = SnapshotEncoder(
+        NGINX_IMAGE_DIR,
+        args.snapshot_format,
+        args.snapshot_quality,
+        args.snapshot_crop,
+        args.snapshot_thumbnail,
+    )
+    dispatcher = AlertDispatcher(
+        args.url, args.nginx, f"{alert_dir}/alert.txt", retries=args.alert_retries
+    )
+    if metrics is not None:
+        dispatcher.register(metrics)
+    dispatcher.start()
+
+    # アラート前後のクリップ
+    clips = None
+    if args.clip_pre > 0 or args.clip_post > 0:
+        clips = ClipRecorder(
+            NGINX_IMAGE_DIR,
+            cap.get(cv2.CAP_PROP_FPS),
+            (W, H),
+            args.clip_pre,
+            args.clip_post,
+        )
 
-    # FPS確保のため圧縮
-    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc("M", "J", "P", "G"))
-    # cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc('Y', 'U', 'Y', 'V'));
+    annotate = Annotator(
+        detector.names,
+        overlay,
+        alpha,
+        dwell_engine(args, W, H),
+        alert_callback(dispatcher, snapshots, alert_status, clips=clips),
+        render=not args.no_render,
+    )
+
+    # 目標FPSに追いつくよう推論を間引く（--thrは動画のフレーム数のまま）
+    stride = None
+    if args.target_fps > 0:
+        stride = AdaptiveStride(args.target_fps, args.max_stride)
+
+    # 静止シーンでは推論を省く
+    gate = None
+    if args.motion_gate:
+        gate = MotionGate(args.motion_sensitivity, args.motion_refresh)
+
+    if cached is not None:
+        track = TrackStage(detector)
+    else:
+        track = TrackStage(detector, gate, stride)
+
+    # 初回はトラッキング結果をキャッシュに書き込む
+    cache_writer = None
+    if cache is not None and cached is None:
+        cache_writer = cache.writer(cache_key)
+
+    # 検出結果の列指向ログ
+    detlog = None
+    if args.detection_log:
+        detlog = DetectionLogWriter(args.detection_log)
 
-    CLIP_FPS = cap.get(cv2.CAP_PROP_FPS)
-    H = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    W = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    print("start detection")
+    logging.info("start detection")
+
+    # capture → track → annotate → sink をバウンデッドキューで接続
+    pipeline = Pipeline(
+        maxsize=args.queue_size, metrics=metrics, profiler=frame_profiler(args)
+    )
+    capture = CaptureSource(cap)
+    reader = None
+    if args.video:
+        pipeline.add_source("capture", capture)
+        pipeline.add_stage("track", track)
+    else:
+        # ライブカメラは読み込みスレッドが保持する最新フレームだけを推論
+        reader = LatestFrameReader(cap)
+        reader.start()
+        pipeline.add_report(reader.summary)
+        if metrics is not None:
+            metrics.counter(
+                "detection_frames_dropped_total",
+                "Frames dropped before inference",
+                lambda: reader.dropped,
+                {"stream": "0"},
+            )
+
+        def track_latest():
+            packet = reader()
+            return None if packet is None else track(packet)
+
+        pipeline.add_source("track", track_latest)
+    pipeline.add_report(annotate.latency.summary)
+    if cache_writer is not None:
+        pipeline.add_stage("cache", cache_writer)
+    if detlog is not None:
+        pipeline.add_stage("detlog", detlog)
+    pipeline.add_stage("annotate", annotate)
+    if clips is not None:
+        pipeline.add_stage("clip", clips)
+    handle_stop_signals(pipeline)
+    preview = start_preview(args)
+    sink = VideoSink(video, pipeline.stop_event, preview, args.headless)
+    try:
+        pipeline.run("sink", sink)
+    finally:
+        if reader is not None:
+            reader.stop()
+        if preview is not None:
+            preview.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        snapshots.close()
+        dispatcher.close()
+        lines = pipeline.summary() + [dispatcher.summary()] + track.summary()
+        if clips is not None:
+            clips.close()
+            lines.append(clips.summary())
+        if detlog is not None:
+            detlog.close()
+            lines.append(detlog.summary())
+        if tmp_dir is not None:
+            tmp_dir.cleanup()
+        if cache_writer is not None:
+            # 最後まで処理できた場合のみキャッシュを確定
+            if capture.finished and pipeline.error is None:
+                cache.commit(
+                    cache_key,
+                    cache_writer,
+                    names=detector.names,
+                    video=os.path.abspath(args.video),
+                )
+                lines.append(f"cached the tracks: {cache_key}")
+            else:
+                cache.discard(cache_writer)
+        for line in lines:
+            print(line)
+        # 集計は1件の記録にまとめる（呼び出し箇所ごとのレート制限を受けない）
+        logging.info("\n".join(lines))
+        release(video, cap, args.headless)
 
-    codec = cv2.VideoWriter_fourcc("m", "p", "4", "v")
-    video = cv2.VideoWriter(output_file_path, codec, CLIP_FPS, (W, H))
-    model = YOLO(args.weights)
 
-    danger_file_path = "./images/danger.png"
-    overlay_image = cv2.imread(danger_file_path, cv2.COLOR_BGR2RGB)
-    overlay = cv2.resize(overlay_image, (W, H))
+def source_streams(args):
+    """
+    Builds the arguments of every stream of --sources.
+
+    Args:
+        args (argparse.Namespace): The command line arguments.
+
+    Returns:
+        list[argparse.Namespace]: The arguments of every stream, with `name`,
+            `source`, `priority` and its own `output` added.
+    """
+
+    stem, ext = os.path.splitext(args.output)
+    return [
+        argparse.Namespace(
+            **{
+                **vars(args),
+                "name": f"stream{i}",
+                "source": source,
+                "priority": 1.0,
+                "output": f"{stem}_{i}{ext}",
+            }
+        )
+        for i, source in enumerate(args.sources)
+    ]
 
-    # 滞留カウンタ
-    counter = 0
-    is_person = False
-    # 閾値（人検知の連続フレーム数がこの値を超えたら警告）
-    person_thr = args.thr
 
-    # アラート（一度きり）
-    is_before_alert = True
+def main_multi(args, streams):
+    """
+    Tracks several cameras or videos with one YOLOv8 model and batched inference.
+
+    Each source has its own capture thread, tracker, dwell counter, output video and window.
+    The frames of all sources are gathered into one batch per forward pass; with a
+    `budget` the scheduler shares the inferred frames per second between the streams.
+
+    Parameters:
+    - args: The command line arguments, merged with the global options of --config.
+    - streams: The arguments of every stream (see `source_streams()` and `load_cameras()`).
+
+    Returns:
+    - None
+    """
+
+    alert_dir = "./alerts"
+    output_dir = "./outputs"
+
+    # 出力先がなければ作成
+    os.makedirs(alert_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+
+    model = load_model(
+        args.weights,
+        args.backend,
+        args.imgsz,
+        args.warmup,
+        intra_threads=args.intra_threads,
+        inter_threads=args.inter_threads,
+    )
+    snapshots = SnapshotEncoder(
+        NGINX_IMAGE_DIR,
+        args.snapshot_format,
+        args.snapshot_quality,
+        args.snapshot_crop,
+        args.snapshot_thumbnail,
+    )
+    metrics, metrics_server = start_metrics(args)
+    # 送信先ごとに1つのディスパッチャ
+    dispatchers = {}
+
+    def dispatcher_of(stream):
+        key = (stream.url, stream.nginx, stream.alert_retries)
+        if key not in dispatchers:
+            suffix = f"_{len(dispatchers)}" if dispatchers else ""
+            dispatchers[key] = AlertDispatcher(
+                stream.url,
+                stream.nginx,
+                f"{alert_dir}/alert{suffix}.txt",
+                retries=stream.alert_retries,
+            )
+            if metrics is not None:
+                dispatchers[key].register(metrics, {"url": stream.url})
+            dispatchers[key].start()
+        return dispatchers[key]
+
+    pipeline = Pipeline(
+        maxsize=args.queue_size, metrics=metrics, profiler=frame_profiler(args)
+    )
+    caps, captures, videos, annotators = [], [], [], []
+    for i, stream in enumerate(streams):
+        source, live = parse_source(stream.source)
+        cap = open_capture(source, stream)
+        video, W, H = open_video_writer(
+            None
+            if args.no_render or stream.no_record
+            else f"{output_dir}/{stream.output}",
+            cap,
+            stream,
+        )
+        if live:
+            alpha = 0.8
+            alert_status = AlertStatus.CAMERA.value
+        else:
+            alpha = 0.99
+            alert_status = AlertStatus.MP4.value
+        caps.append(cap)
+        videos.append(video)
+        captures.append(StreamCapture(i, cap, live, pipeline.stop_event))
+        if metrics is not None:
+            metrics.counter(
+                "detection_frames_dropped_total",
+                "Frames dropped before inference",
+                lambda capture=captures[-1]: capture.dropped,
+                {"stream": stream.name},
+            )
+        annotators.append(
+            Annotator(
+                model.names,
+                load_overlay(W, H),
+                alpha,
+                dwell_engine(stream, W, H),
+                alert_callback(
+                    dispatcher_of(stream), snapshots, alert_status, f"_{stream.name}"
+                ),
+                render=not args.no_render,
+                camera=stream.name,
+            )
+        )
+
+    frame_rates = [cap.get(cv2.CAP_PROP_FPS) for cap in caps]
+    tracker = MultiStreamTracker(model, frame_rates, args.tracker)
+
+    # 推論予算を優先度と直近の検出状況でストリームに配分
+    scheduler = None
+    if args.budget > 0:
+        scheduler = BudgetScheduler(
+            captures,
+            args.budget,
+            [stream.name for stream in streams],
+            [stream.priority for stream in streams],
+            frame_rates,
+        )
+
+    # ストリームごとの検出結果ログ
+    detlogs = [
+        DetectionLogWriter(f"{stream.detection_log}/{stream.name}")
+        if stream.detection_log
+        else None
+        for stream in streams
+    ]
+
+    def log_detections(batch):
+        """
+        Appends the tracked objects of every frame of the batch to the log of its stream.
+
+        Args:
+            batch (list[FramePacket]): The tracked frames.
+
+        Returns:
+            list[FramePacket]: The same frames.
+        """
+
+        for packet in batch:
+            if detlogs[packet.stream] is not None:
+                detlogs[packet.stream](packet)
+        return batch
+
+    def annotate(batch):
+        """
+        Annotates every frame of the batch with the annotator of its stream.
+
+        Args:
+            batch (list[FramePacket]): The tracked frames.
+
+        Returns:
+            list[FramePacket]: The annotated frames.
+        """
+
+        for packet in batch:
+            annotators[packet.stream](packet)
+            if scheduler is not None:
+                scheduler.observe(packet)
+        return batch
+
+    def sink(batch):
+        """
+        Writes every frame of the batch into its output video and displays it in its window.
+
+        Args:
+            batch (list[FramePacket]): The annotated frames.
+
+        Returns:
+            bool: False when the user pressed a key to stop, True otherwise.
+        """
+
+        for packet in batch:
+            if videos[packet.stream] is not None:
+                videos[packet.stream].write(packet.frame)
+            if preview is not None:
+                preview.publish(packet.frame, packet.stream)
+        if args.headless or pipeline.stop_event.is_set():
+            return True
+
+        for packet in batch:
+            cv2.imshow(streams[packet.stream].name, packet.frame)
+        key = cv2.waitKey(1)
+        if key != -1:
+            print("STOP PLAY!!!")
+            logging.warning("STOP PLAY!!!")
+            return False
+        return True
 
     print("start detection")
-    logging.info("start detection")
+    logging.info(f"start detection: {len(caps)} streams")
+
+    for capture in captures:
+        capture.start()
+    if scheduler is not None:
+        pipeline.add_source("schedule", scheduler)
+        for i in range(len(streams)):
+            pipeline.add_report(functools.partial(scheduler.summary, i))
+    else:
+        pipeline.add_source("gather", BatchGatherer(captures))
+    for stream, annotator in zip(streams, annotators):
+        annotator.latency.name = f"{stream.name} capture-to-decision"
+        pipeline.add_report(annotator.latency.summary)
+    pipeline.add_stage("track", tracker)
+    if any(detlog is not None for detlog in detlogs):
+        pipeline.add_stage("detlog", log_detections)
+    pipeline.add_stage("annotate", annotate)
+    handle_stop_signals(pipeline)
+    preview = start_preview(args)
+    try:
+        pipeline.run("sink", sink)
+    finally:
+        if preview is not None:
+            preview.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        snapshots.close()
+        for dispatcher in dispatchers.values():
+            dispatcher.close()
+        for capture in captures:
+            capture.join(1)
+        lines = pipeline.summary()
+        lines += [dispatcher.summary() for dispatcher in dispatchers.values()]
+        if scheduler is None:
+            lines += [
+                f"{streams[c.stream].name}: {c.dropped} frames dropped"
+                for c in captures
+            ]
+        for detlog in detlogs:
+            if detlog is not None:
+                detlog.close()
+                lines.append(detlog.summary())
+        for line in lines:
+            print(line)
+        # 集計は1件の記録にまとめる（呼び出し箇所ごとのレート制限を受けない）
+        logging.info("\n".join(lines))
+        print("end detection")
+        logging.info("end detection")
+        for video in videos:
+            if video is not None:
+                video.release()
+        for cap in caps:
+            cap.release()
+        if not args.headless:
+            cv2.destroyAllWindows()
+
+
+def main_supervisor(args):
+    """
+    Tracks several cameras or videos with supervised capture and inference processes.
 
-    # キーが押されるまで
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-        # YOLOv8でトラッキング
-        results = model.track(frame, persist=True)
-        result = results[0]
-
-        # 推論結果からbboxの座標取得
-        boxes = result.boxes.xyxy.cpu().numpy().astype(int)
-        try:
-            # 推論結果からbboxのクラスID取得
-            ids = result.boxes.id.cpu().numpy().astype(int)
-            # 推論結果からbboxのクラス名取得
-            cls_list = result.boxes.cls.cpu().numpy().astype(int)
-            for box, id, cls in zip(boxes, ids, cls_list):
-                cls_name = model.names[cls]
-                cv2.rectangle(
-                    frame,
-                    (box[0], box[1]),
-                    (box[2], box[3]),
-                    color=GREEN,
-                    thickness=MEDIUM,
-                )
-                if cls_name == PERSON:
-                    cv2.putText(
-                        frame,
-                        f"#{id} {cls_name} ({counter})",
-                        (box[0], box[1] - 5),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        fontScale=MEDIUM,
-                        color=RED,
-                        thickness=LARGE,
-                    )
-                    is_person = True
-
-                    if counter >= person_thr:
-                        # Alert!
-                        frame = cv2.addWeighted(
-                            src1=frame, alpha=alpha, src2=overlay, beta=0.3, gamma=0
-                        )
-                        # 並列処理でpost送信
-                        if is_before_alert:
-                            is_before_alert = False
-                            now = datetime.now().strftime("%Y%m%d_%Hh%Mm%Ss")
-                            alert_file = f"{now}_person_alert.png"
-                            alert_image_path_nginx = f"{args.nginx}/{alert_file}"
-                            alert_image_path_local = (
-                                f"server/docker/nginx/images/{alert_file}"
-                            )
-                            print("ALERT!!")
-                            logging.info("ALERT!!")
-
-                            # picture post
-                            picture_id = post_picture(args.url, alert_image_path_nginx)
-                            loop = asyncio.get_event_loop()
-                            # alert post
-                            loop.run_until_complete(
-                                post_alert(
-                                    args.url,
-                                    picture_id,
-                                    alert_status,
-                                    f"{alert_dir}/alert.txt",
-                                )
-                            )
-                            # nginxに画像保存
-                            cv2.imwrite(
-                                alert_image_path_local,
-                                frame,
-                            )
-
-                else:
-                    cv2.putText(
-                        frame,
-                        f"#{id} {cls_name}",
-                        (box[0], box[1] - 5),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        fontScale=SMALL,
-                        color=BLUE,
-                        thickness=SMALL,
-                    )
-        except Exception as e:
-            print(e)
-            print("There are no objects")
-            continue
-        finally:
-            if is_person:
-                counter += 1
-                is_person = False
-            else:
-                counter = 0
+    Each source is decoded by its own process into shared-memory frame slots, one
+    inference process tracks the slots in place and sends back the detections, and
+    this process counts the dwell, raises the alerts and shows the frames.
+    Crashed processes are restarted without stopping the other sources.
+    No output video is recorded in this mode.
 
-            cv2.imshow("frame", frame)
-            video.write(frame)
-            key = cv2.waitKey(1)
-            if key != -1:
+    Parameters:
+    - args: The command line arguments; `sources` lists the cameras or videos.
+
+    Returns:
+    - None
+    """
+
+    alert_dir = "./alerts"
+    os.makedirs(alert_dir, exist_ok=True)
+
+    W, H = args.camera_width, args.camera_height
+    sources = [parse_source(source) for source in args.sources]
+    frame_rates = []
+    for source, live in sources:
+        fps = 30
+        if not live:
+            cap = cv2.VideoCapture(source)
+            fps = cap.get(cv2.CAP_PROP_FPS) or 30
+            cap.release()
+        frame_rates.append(fps)
+
+    model_args = {
+        "weights": args.weights,
+        "backend": args.backend,
+        "imgsz": args.imgsz,
+        "warmup": args.warmup,
+        "intra_threads": args.intra_threads,
+        "inter_threads": args.inter_threads,
+    }
+    supervisor = Supervisor(
+        sources,
+        (H, W, 3),
+        model_args,
+        args.tracker,
+        frame_rates,
+        args.supervisor_slots,
+    )
+    # クラス名だけを読み込む（推論は別プロセス）
+    names = YOLO(args.weights, task="detect").names
+
+    snapshots = SnapshotEncoder(
+        NGINX_IMAGE_DIR,
+        args.snapshot_format,
+        args.snapshot_quality,
+        args.snapshot_crop,
+        args.snapshot_thumbnail,
+    )
+    metrics, metrics_server = start_metrics(args)
+    dispatcher = AlertDispatcher(
+        args.url, args.nginx, f"{alert_dir}/alert.txt", retries=args.alert_retries
+    )
+    if metrics is not None:
+        dispatcher.register(metrics)
+    dispatcher.start()
+    annotators = []
+    for i, (_, live) in enumerate(sources):
+        annotators.append(
+            Annotator(
+                names,
+                load_overlay(W, H),
+                0.8 if live else 0.99,
+                dwell_engine(args, W, H),
+                alert_callback(
+                    dispatcher,
+                    snapshots,
+                    (AlertStatus.CAMERA if live else AlertStatus.MP4).value,
+                    f"_{i}",
+                ),
+                render=not args.no_render,
+            )
+        )
+
+    print("start detection")
+    logging.info(f"start detection: {len(sources)} supervised streams")
+
+    handle_stop_signals(supervisor)
+    preview = start_preview(args)
+    finished = set()
+    frames = [0] * len(sources)
+    end_to_end = [None] * len(sources)
+    if metrics is not None:
+        for i in range(len(sources)):
+            labels = {"stream": str(i)}
+            end_to_end[i] = metrics.histogram(
+                "detection_end_to_end_seconds",
+                "Time from capture to the end of the sink",
+                labels,
+            )
+            metrics.counter(
+                "detection_frames_dropped_total",
+                "Frames dropped before inference",
+                lambda i=i: supervisor.capture_dropped[i] + supervisor.infer_dropped[i],
+                labels,
+            )
+            metrics.counter(
+                "detection_restarts_total",
+                "Restarts of the capture process of a stream",
+                lambda i=i: supervisor.restarts[i],
+                labels,
+            )
+    supervisor.start()
+    try:
+        while len(finished) < len(sources) and not supervisor.stop_event.is_set():
+            if supervisor.poll():
+                # 新しい推論プロセスのトラッカーはIDを1から振り直す
+                for annotator in annotators:
+                    annotator.dwell.reset()
+            item = supervisor.get()
+            if item is None:
+                continue
+            stream, slot, index, captured_at, det = item
+            if slot is None:
+                finished.add(stream)
+                logging.info(f"Stream {stream} finished")
+                continue
+
+            # 共有メモリのフレームにそのまま描画
+            frame = supervisor.frame(stream, slot)
+            packet = FramePacket(index, frame, captured_at, stream)
+            packet.detections = det
+            annotators[stream](packet)
+            frames[stream] += 1
+            if preview is not None:
+                preview.publish(packet.frame, stream)
+            if not args.headless:
+                cv2.imshow(f"frame{stream}", packet.frame)
+            frame = packet = None
+            supervisor.release(stream, slot)
+            if end_to_end[stream] is not None:
+                end_to_end[stream].observe(time.perf_counter() - captured_at)
+
+            if not args.headless and cv2.waitKey(1) != -1:
                 print("STOP PLAY!!!")
                 logging.warning("STOP PLAY!!!")
                 break
-
-    release(video, cap)
+    finally:
+        supervisor.close()
+        if preview is not None:
+            preview.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        snapshots.close()
+        dispatcher.close()
+        lines = [f"stream{i}: {n} frames processed" for i, n in enumerate(frames)]
+        for i, annotator in enumerate(annotators):
+            annotator.latency.name = f"stream{i} capture-to-decision"
+            lines.append(annotator.latency.summary())
+        lines += [dispatcher.summary()] + supervisor.summary()
+        for line in lines:
+            print(line)
+        # 集計は1件の記録にまとめる（呼び出し箇所ごとのレート制限を受けない）
+        logging.info("\n".join(lines))
+        print("end detection")
+        logging.info("end detection")
+        if not args.headless:
+            cv2.destroyAllWindows()
 
 
 if __name__ == "__main__":
@@ -23,6 +23,9 @@ class Picture(Base):
 
     picture_id = Column(Integer, primary_key=True)
     picture = Column(String, nullable=False)
+    crop = Column(String, nullable=True)
+    thumbnail = Column(String, nullable=True)
+    clip = Column(String, nullable=True)
     created_at = Column(String, default=current_timestamp())
     updated_at = Column(
         DateTime, default=current_timestamp(), onupdate=current_timestamp()
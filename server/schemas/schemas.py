@@ -1,4 +1,5 @@
 from enum import Enum
+from typing import Optional
 
 from pydantic import BaseModel, ConfigDict, Field
 
@@ -22,8 +23,18 @@ class AlertResponse(BaseModel):
 
 class PictureCreate(BaseModel):
     picture: str = Field(example="http://example.com/picture.jpg")
+    crop: Optional[str] = Field(default=None, example="http://example.com/crop.jpg")
+    thumbnail: Optional[str] = Field(
+        default=None, example="http://example.com/thumbnail.jpg"
+    )
+    clip: Optional[str] = Field(default=None, example="http://example.com/clip.mp4")
 
 
 class PictureResponse(BaseModel):
     picture_id: int = Field(gt=0, example=1)
     picture: str = Field(example="http://example.com/picture.jpg")
+    crop: Optional[str] = Field(default=None, example="http://example.com/crop.jpg")
+    thumbnail: Optional[str] = Field(
+        default=None, example="http://example.com/thumbnail.jpg"
+    )
+    clip: Optional[str] = Field(default=None, example="http://example.com/clip.mp4")
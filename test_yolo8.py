@@ -1,108 +1,195 @@
+import argparse
 import os
 import time
 
 import cv2
 from ultralytics import YOLO
 
-output_dir = "./outputs"
-file_path = "./videos/test.mp4"
-output_file_path = f"{output_dir}/tracking.mp4"
+BG_COLOR = (79, 62, 70)
 
-# 出力先なければ作成
-os.makedirs("./outputs", exist_ok=True)
 
-# テスト動画の読み込み
-cap = cv2.VideoCapture(file_path)
+def parse_arguments():
+    """
+    Parse command line arguments.
 
-CLIP_FPS = cap.get(cv2.CAP_PROP_FPS)
-BG_COLOR = (79, 62, 70)
-H = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-W = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-
-codec = cv2.VideoWriter_fourcc("m", "p", "4", "v")
-video = cv2.VideoWriter(output_file_path, codec, CLIP_FPS, (W, H))
-model = YOLO("./weights/yolov8s.pt")
-fps = int(cap.get(cv2.CAP_PROP_FPS))
-
-overlay_image = cv2.imread("./images/danger.png", cv2.COLOR_BGR2RGB)
-overlay = cv2.resize(overlay_image, (W, H))
-
-# 滞留カウンタ
-counter = 0
-is_person = False
-# 閾値（人検知の連続フレーム数がこの値を超えたら警告）
-person_thr = 100
-
-print("start detection")
-
-# テスト動画に対してperson classのみで推論
-results = model.track(
-    source=file_path,
-    tracker="bytetrack.yaml",
-    # 人に限定して検知（すべて検知したい場合はclassesをコメントアウト）
-    classes=[0],
-    persist=True,
-)
-
-for result in results:
-    ret, frame = cap.read()
-    if not ret:
-        break
-    # YOLOv8でトラッキング
-    results = model.track(frame, persist=True)
-    result = results[0]
-
-    boxes = result.boxes.xyxy.cpu().numpy().astype(int)
-    try:
-        ids = result.boxes.id.cpu().numpy().astype(int)
-        cls_list = result.boxes.cls.cpu().numpy().astype(int)
-        for box, id, cls in zip(boxes, ids, cls_list):
-            cls_name = model.names[cls]
-            cv2.rectangle(frame, (box[0], box[1]), (box[2], box[3]), (0, 255, 0), 2)
-            if cls_name == "person":
-                cv2.putText(
-                    frame,
-                    f"#{id} {cls_name} ({counter})",
-                    (box[0], box[1] - 5),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.5,
-                    (255, 255, 255),
-                    thickness=2,
-                )
-                is_person = True
-
-                if counter >= person_thr:
-                    frame = cv2.addWeighted(
-                        src1=frame, alpha=0.99, src2=overlay, beta=0.3, gamma=0
-                    )
-            else:
-                cv2.putText(
-                    frame,
-                    f"#{id} {cls_name}",
-                    (box[0], box[1] - 5),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    1,
-                    (0, 255, 0),
-                    1,
-                )
-    except Exception as e:
-        print(e)
-        print("There are no objects")
-        continue
-    finally:
-        if is_person:
-            counter += 1
-            is_person = False
+    Returns:
+        argparse.Namespace: Parsed command line arguments.
+    """
+
+    parser = argparse.ArgumentParser(description="Replay YOLOv8 tracking on a video")
+    parser.add_argument(
+        "-v", "--video", default="./videos/test.mp4", type=str, help="Video file path"
+    )
+    parser.add_argument(
+        "-w",
+        "--weights",
+        default="./weights/yolov8s.pt",
+        type=str,
+        help="File path of object detection model",
+    )
+    parser.add_argument(
+        "--tracker", default="bytetrack.yaml", type=str, help="Tracker config"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="tracking.mp4",
+        type=str,
+        help="Output video file name (empty: no output video)",
+    )
+    parser.add_argument(
+        "-t",
+        "--thr",
+        default=100,
+        type=int,
+        help="Consecutive frames with a person before the warning",
+    )
+    parser.add_argument(
+        "--all_classes",
+        action="store_true",
+        help="Track every class instead of only persons",
+    )
+    parser.add_argument(
+        "--realtime",
+        action="store_true",
+        help="Pace the replay at the FPS of the video",
+    )
+    parser.add_argument("--headless", action="store_true", help="Do not open a window")
+    return parser.parse_args()
+
+
+def draw(frame, result, names, counter, thr, overlay):
+    """
+    Draws the tracked objects of a frame.
+
+    Args:
+        frame (numpy.ndarray): The frame to draw on.
+        result (ultralytics.engine.results.Results): The tracking result of the frame.
+        names (dict): The class names of the model.
+        counter (int): The consecutive frames with a person so far.
+        thr (int): The consecutive frames with a person before the warning.
+        overlay (numpy.ndarray): The warning image.
+
+    Returns:
+        tuple: The drawn frame and True if a person is in the frame.
+    """
+
+    boxes = result.boxes
+    if boxes is None or boxes.id is None:
+        return frame, False
+
+    # 1回の転送でまとめて取得
+    data = boxes.data.cpu().numpy()
+    is_person = False
+    for x1, y1, x2, y2, id, _, cls in data.astype(int):
+        cls_name = names[cls]
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        if cls_name == "person":
+            cv2.putText(
+                frame,
+                f"#{id} {cls_name} ({counter})",
+                (x1, y1 - 5),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.5,
+                (255, 255, 255),
+                thickness=2,
+            )
+            is_person = True
         else:
-            counter = 0
-        # 時間を元動画と合わせる
-        time.sleep(1 / fps)
-        cv2.imshow("frame", frame)
-        video.write(frame)
-        if cv2.waitKey(1) == 13:
-            break
-# videoの書き込み/読み込み終了
-print("end detection")
-video.release()
-cap.release()
-cv2.destroyAllWindows()
+            cv2.putText(
+                frame,
+                f"#{id} {cls_name}",
+                (x1, y1 - 5),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                1,
+                (0, 255, 0),
+                1,
+            )
+
+    if is_person and counter >= thr:
+        frame = cv2.addWeighted(src1=frame, alpha=0.99, src2=overlay, beta=0.3, gamma=0)
+    return frame, is_person
+
+
+def main(args):
+    """
+    Tracks the video in a single streaming pass and replays the results.
+
+    The results are consumed one frame at a time from the `stream=True` generator,
+    so the memory stays constant whatever the length of the video.
+
+    Args:
+        args (argparse.Namespace): Parsed command line arguments.
+
+    Returns:
+        None
+    """
+
+    output_dir = "./outputs"
+    # 出力先なければ作成
+    os.makedirs(output_dir, exist_ok=True)
+
+    # フレームサイズとFPSだけを取得
+    cap = cv2.VideoCapture(args.video)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    H = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    W = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    cap.release()
+
+    video = None
+    if args.output:
+        codec = cv2.VideoWriter_fourcc("m", "p", "4", "v")
+        video = cv2.VideoWriter(f"{output_dir}/{args.output}", codec, fps, (W, H))
+    model = YOLO(args.weights)
+
+    overlay_image = cv2.imread("./images/danger.png", cv2.COLOR_BGR2RGB)
+    overlay = cv2.resize(overlay_image, (W, H))
+
+    # 滞留カウンタ
+    counter = 0
+
+    print("start detection")
+
+    # 人に限定して検知（--all_classesですべて検知）
+    results = model.track(
+        source=args.video,
+        tracker=args.tracker,
+        classes=None if args.all_classes else [0],
+        persist=True,
+        stream=True,
+        verbose=False,
+    )
+
+    start = time.perf_counter()
+    frames = 0
+    for frames, result in enumerate(results, 1):
+        frame, is_person = draw(
+            result.orig_img, result, model.names, counter, args.thr, overlay
+        )
+        counter = counter + 1 if is_person else 0
+
+        if video is not None:
+            video.write(frame)
+        if args.realtime:
+            # 時間を元動画と合わせる（処理時間の分だけ待ち時間を減らす）
+            delay = frames / fps - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+        if not args.headless:
+            cv2.imshow("frame", frame)
+            if cv2.waitKey(1) == 13:
+                break
+
+    elapsed = time.perf_counter() - start
+    print(f"end detection: {frames} frames, {frames / max(elapsed, 1e-6):.1f} FPS")
+    # videoの書き込み終了
+    if video is not None:
+        video.release()
+    if not args.headless:
+        cv2.destroyAllWindows()
+
+
+if __name__ == "__main__":
+
+    args = parse_arguments()
+    main(args)
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from detection import detections
+from detection.cache import CachedDetector
+from detection.detlog import DetectionLogReader, DetectionLogWriter
+from detection.pipeline import FramePacket
+
+
+def cached_detector(tmp_path, frames, on_stale=None):
+    writer = DetectionLogWriter(str(tmp_path))
+    for index in range(1, frames + 1):
+        writer.append(index, index / 30, detections.empty())
+    writer.close()
+    return CachedDetector(DetectionLogReader(str(tmp_path)), {"0": "person"}, on_stale)
+
+
+def packet(index):
+    return FramePacket(index, np.zeros((4, 4, 3), dtype=np.uint8), 0.0)
+
+
+def test_replays_the_cached_frames(tmp_path):
+    detector = cached_detector(tmp_path, 2)
+    for index in (1, 2):
+        p = packet(index)
+        detector(p)
+        assert len(p.detections) == 0
+
+
+def test_exhausted_cache_is_deleted_with_a_clear_error(tmp_path):
+    stale = []
+    detector = cached_detector(tmp_path, 2, lambda: stale.append(True))
+    detector(packet(1))
+    detector(packet(2))
+    with pytest.raises(RuntimeError, match="Stale detection cache"):
+        detector(packet(3))
+    assert stale == [True]
+
+
+def test_mismatched_frame_is_stale(tmp_path):
+    detector = cached_detector(tmp_path, 2)
+    with pytest.raises(RuntimeError, match="frame 1 for the video frame 5"):
+        detector(packet(5))
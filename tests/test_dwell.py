@@ -0,0 +1,54 @@
+import numpy as np
+
+from detection.dwell import DwellEngine
+
+BOX = np.array([[100, 100, 200, 300]])
+
+
+def test_index_gaps_keep_the_track_and_count_toward_thr():
+    dwell = DwellEngine(thr=300, ttl=30, cooldown=1800)
+    ids = np.array([7])
+    # 低予算のカメラではフレーム番号がttlより大きく飛ぶ
+    for i, index in enumerate(range(0, 1200, 10)):
+        counts, is_over, is_alert = dwell.update(index, BOX, ids)
+        # 滞在は映像のフレーム数で増える
+        assert counts[0] == 1 + 10 * i
+        assert is_alert[0] == (index == 300)
+    assert dwell.active == 1
+
+
+def test_gap_over_ttl_adds_at_most_ttl_frames():
+    dwell = DwellEngine(thr=10**6, ttl=30)
+    ids = np.array([7])
+    counts = [dwell.update(index, BOX, ids)[0][0] for index in range(0, 1200, 120)]
+    assert counts == [1 + 30 * i for i in range(10)]
+    assert dwell.active == 1
+
+
+def test_unseen_track_is_evicted_after_ttl_processed_frames():
+    dwell = DwellEngine(thr=100, ttl=3)
+    dwell.update(0, BOX, np.array([1]))
+    for index in range(1, 4):
+        dwell.update(index * 100, BOX[:0], np.array([], dtype=np.int64))
+    assert dwell.active == 1
+    dwell.update(400, BOX[:0], np.array([], dtype=np.int64))
+    assert dwell.active == 0
+
+    counts, _, _ = dwell.update(500, BOX, np.array([1]))
+    assert counts[0] == 1
+
+
+def test_cooldown_counts_frames_of_the_video():
+    dwell = DwellEngine(thr=1, ttl=30, cooldown=100)
+    ids = np.array([2])
+    alerts = [dwell.update(i * 50, BOX, ids)[2][0] for i in range(7)]
+    assert alerts == [True, False, True, False, True, False, True]
+
+
+def test_reset_forgets_the_dwell_of_reused_ids():
+    dwell = DwellEngine(thr=100)
+    for index in range(10):
+        dwell.update(index, BOX, np.array([1]))
+    dwell.reset()
+    counts, _, _ = dwell.update(10, BOX, np.array([1]))
+    assert counts[0] == 1
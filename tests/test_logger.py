@@ -0,0 +1,38 @@
+import logging
+
+from detection.logger import RateLimitFilter
+
+
+def record(level=logging.INFO, lineno=10, created=0.0, **extra):
+    record = logging.LogRecord(
+        "test", level, "detection/x.py", lineno, "msg", None, None
+    )
+    record.created = created
+    record.__dict__.update(extra)
+    return record
+
+
+def test_info_records_of_one_site_are_limited():
+    limiter = RateLimitFilter(rate=5.0, burst=20)
+    kept = [limiter.filter(record()) for _ in range(40)]
+    assert sum(kept) == 20
+    assert limiter.suppressed == 20
+
+    # 時間が経てば抑制数を付けて書き出す
+    later = record(created=1.0)
+    assert limiter.filter(later)
+    assert later.suppressed == 20
+
+
+def test_warnings_and_errors_are_never_limited():
+    limiter = RateLimitFilter(rate=5.0, burst=20)
+    assert all(limiter.filter(record(logging.ERROR)) for _ in range(40))
+    assert all(limiter.filter(record(logging.WARNING)) for _ in range(40))
+    assert limiter.suppressed == 0
+
+
+def test_per_frame_records_are_sampled():
+    limiter = RateLimitFilter(rate=0, sample=0.25)
+    kept = [limiter.filter(record(sample=True)) for _ in range(8)]
+    assert kept == [True, False, False, False, True, False, False, False]
+    assert not RateLimitFilter(sample=0.0).filter(record(sample=True))
@@ -0,0 +1,60 @@
+import pstats
+import threading
+import time
+
+from detection.metrics import FrameProfiler
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_dump_waits_for_the_profiled_calls(tmp_path):
+    path = str(tmp_path / "window.prof")
+    profiler = FrameProfiler(0, 1, path, stage="stage")
+    profiler.tick(0)
+    started = threading.Event()
+
+    def stage():
+        started.set()
+        busy(0.2)
+
+    thread = threading.Thread(target=profiler.run, args=(stage,), name="stage")
+    thread.start()
+    started.wait()
+    profiler.tick(1)
+    # 窓が閉じた時点で実行中だった呼び出しも含まれる
+    assert not thread.is_alive()
+    stats = pstats.Stats(path)
+    assert any(func[2] == "stage" for func in stats.stats)
+
+
+def test_no_profile_after_the_window(tmp_path):
+    path = tmp_path / "window.prof"
+    profiler = FrameProfiler(0, 1, str(path), stage="stage")
+    profiler.tick(0)
+    profiler.dump()
+    assert profiler.run(lambda: 42, stage="stage") == 42
+    # 窓の中で何も呼ばれていないので書き出さない
+    assert not path.exists()
+
+
+def test_only_the_chosen_stage_is_profiled(tmp_path):
+    path = str(tmp_path / "window.prof")
+    profiler = FrameProfiler(0, 1, path, stage="track")
+
+    def track():
+        busy(0.01)
+
+    def annotate():
+        busy(0.01)
+
+    profiler.tick(0)
+    profiler.run(track, stage="track")
+    profiler.run(annotate, stage="annotate")
+    profiler.tick(1)
+    names = {func[2] for func in pstats.Stats(path).stats}
+    assert "track" in names
+    assert "annotate" not in names
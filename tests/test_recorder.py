@@ -0,0 +1,62 @@
+import glob
+import os
+
+import numpy as np
+
+from detection.recorder import SegmentRecorder, last_segment, segment_pattern
+
+
+def touch(path, size, mtime):
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    os.utime(path, (mtime, mtime))
+
+
+def test_pattern_matches_the_segments_of_every_run(tmp_path):
+    for name in (
+        "20240101_10h00m00s_tracking_00001.mp4",
+        "20240102_08h30m15s_tracking_00007.mp4",
+        "20240102_08h30m15s_tracking_0_00001.mp4",
+        "other_00001.mp4",
+    ):
+        touch(tmp_path / name, 1, 0)
+    pattern = segment_pattern(str(tmp_path / "20240103_00h00m00s_tracking.mp4"))
+    matched = sorted(os.path.basename(p) for p in glob.glob(pattern))
+    assert matched == [
+        "20240101_10h00m00s_tracking_00001.mp4",
+        "20240102_08h30m15s_tracking_00007.mp4",
+    ]
+
+
+def test_numbering_continues_after_the_existing_segments(tmp_path):
+    touch(tmp_path / "camera0_00003.mp4", 1, 0)
+    assert last_segment(str(tmp_path / "camera0.mp4")) == 3
+    assert last_segment(str(tmp_path / "camera1.mp4")) == 0
+
+
+def test_budget_deletes_the_segments_of_earlier_runs(tmp_path):
+    old = tmp_path / "20240101_10h00m00s_tracking_00001.mp4"
+    touch(old, 2 * 1024 * 1024, 1)
+    recorder = SegmentRecorder(
+        str(tmp_path / "20240102_10h00m00s_tracking.mp4"),
+        30,
+        (64, 48),
+        segment_seconds=1,
+        budget_mb=1,
+    )
+    for _ in range(45):
+        recorder.write(np.zeros((48, 64, 3), dtype=np.uint8))
+    recorder.release()
+    assert not old.exists()
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_unopened_writer_drops_the_frames_without_raising(tmp_path):
+    recorder = SegmentRecorder(
+        str(tmp_path / "missing" / "tracking.mp4"), 30, (64, 48), segment_seconds=1
+    )
+    for _ in range(45):
+        recorder.write(np.zeros((48, 64, 3), dtype=np.uint8))
+    recorder.release()
+    assert recorder.failed
+    assert recorder.dropped == 45
@@ -0,0 +1,29 @@
+import cv2
+import numpy as np
+
+from detection.snapshot import SnapshotEncoder
+
+
+def frame():
+    # 左半分が黒、右半分が白の画面
+    image = np.zeros((720, 1280, 3), dtype=np.uint8)
+    image[:, 640:] = 255
+    return image
+
+
+def test_thumbnail_is_made_from_the_person_crop(tmp_path):
+    encoder = SnapshotEncoder(str(tmp_path), "png", thumbnail=64)
+    files = encoder.encode(frame(), "alert", np.array([800, 100, 900, 400]))
+    thumb = cv2.imread(str(tmp_path / files["thumbnail"]))
+    # 人物の縦長の切り出し（余白込み 120x360）の縮小
+    assert thumb.shape[:2] == (192, 64)
+    assert thumb.min() == 255
+    assert "crop" not in files
+
+
+def test_thumbnail_falls_back_to_the_frame_without_a_box(tmp_path):
+    encoder = SnapshotEncoder(str(tmp_path), "png", crop=True, thumbnail=64)
+    files = encoder.encode(frame(), "alert")
+    thumb = cv2.imread(str(tmp_path / files["thumbnail"]))
+    assert thumb.shape[:2] == (36, 64)
+    assert "crop" not in files
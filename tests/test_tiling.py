@@ -0,0 +1,55 @@
+import numpy as np
+
+from detection.tiling import cut_at_edges, merge_tiles
+
+FRAME_SIZE = (1280, 720)
+# 横に並んだ2タイル（x=560〜640で重なる）
+BOUNDS = np.array([[0, 0, 640, 720], [560, 0, 1280, 720]])
+
+
+def boxes(*rows):
+    return np.array(rows, dtype=np.float32).reshape(-1, 6)
+
+
+def test_only_inner_tile_edges_cut_boxes():
+    b = boxes([500, 100, 640, 300, 0.9, 0], [0, 100, 60, 300, 0.9, 0])
+    cut = cut_at_edges(b, BOUNDS, np.array([0, 0]), FRAME_SIZE)
+    # 画面の左端に接する箱は切れていない
+    assert cut.tolist() == [True, False]
+
+
+def test_box_cut_at_a_tile_edge_merges_with_the_full_box():
+    # 左タイルの右端で切れた人物と右タイルで全身が写った同じ人物（IoUは0.5未満）
+    b = boxes([600, 100, 640, 300, 0.8, 0], [600, 100, 700, 300, 0.9, 0])
+    tile_of = np.array([0, 1])
+    cut = cut_at_edges(b, BOUNDS, tile_of, FRAME_SIZE)
+    merged = merge_tiles(b, tile_of, cut)
+    np.testing.assert_allclose(merged, boxes([600, 100, 700, 300, 0.9, 0]))
+
+
+def test_kept_cut_box_grows_to_the_full_extent():
+    b = boxes([600, 100, 640, 300, 0.9, 0], [600, 100, 700, 300, 0.7, 0])
+    tile_of = np.array([0, 1])
+    cut = cut_at_edges(b, BOUNDS, tile_of, FRAME_SIZE)
+    merged = merge_tiles(b, tile_of, cut)
+    np.testing.assert_allclose(merged, boxes([600, 100, 700, 300, 0.9, 0]))
+
+
+def test_separate_people_are_not_merged():
+    # 同じタイル内の近接した2人と、別タイルの少しだけ重なる人物
+    b = boxes(
+        [100, 100, 160, 300, 0.9, 0],
+        [140, 100, 200, 300, 0.8, 0],
+        [620, 100, 680, 300, 0.9, 0],
+        [580, 100, 640, 300, 0.9, 0],
+    )
+    tile_of = np.array([0, 0, 1, 0])
+    cut = cut_at_edges(b, BOUNDS, tile_of, FRAME_SIZE)
+    assert len(merge_tiles(b, tile_of, cut)) == 4
+
+
+def test_other_classes_are_not_merged():
+    b = boxes([600, 100, 640, 300, 0.8, 0], [600, 100, 700, 300, 0.9, 2])
+    tile_of = np.array([0, 1])
+    cut = cut_at_edges(b, BOUNDS, tile_of, FRAME_SIZE)
+    assert len(merge_tiles(b, tile_of, cut)) == 2
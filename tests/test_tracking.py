@@ -0,0 +1,107 @@
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+from detection import detections
+from detection.tracking import IoUTracker, load_tracker, update_tracker
+
+FRAME = np.zeros((720, 1280, 3), dtype=np.uint8)
+
+
+def boxes(*rows):
+    return np.array(rows, dtype=np.float32).reshape(-1, 6)
+
+
+def moving(frames, start=(100, 100), velocity=(8, 2), size=(60, 120), conf=0.9):
+    # 等速で動く1物体の検出
+    for t in range(frames):
+        x, y = start[0] + velocity[0] * t, start[1] + velocity[1] * t
+        yield boxes([x, y, x + size[0], y + size[1], conf, 0])
+
+
+def test_new_track_is_reported_after_min_hits():
+    tracker = IoUTracker(min_hits=3)
+    tracker.frame = 10
+    counts = [len(tracker.update(b, FRAME)) for b in moving(4)]
+    assert counts == [0, 0, 1, 1]
+
+
+def test_moving_object_keeps_its_id():
+    tracker = IoUTracker()
+    ids = {int(t[0, 4]) for t in map(tracker.update, moving(50)) if len(t)}
+    assert ids == {1}
+
+
+def test_track_survives_missed_frames_and_expires_after_max_age():
+    tracker = IoUTracker(max_age=5)
+    frames = list(moving(20))
+    for b in frames[:10]:
+        tracker.update(b)
+    for _ in range(3):
+        assert len(tracker.update(boxes())) == 0
+    tracks = tracker.update(frames[13])
+    assert tracks[:, 4].tolist() == [1]
+
+    for _ in range(6):
+        tracker.update(boxes())
+    assert len(tracker) == 0
+
+
+def test_predict_advances_the_visible_tracks():
+    tracker = IoUTracker()
+    for b in moving(10):
+        last = tracker.update(b)
+    predicted = tracker.predict()
+    assert predicted[:, 4].tolist() == last[:, 4].tolist()
+    assert predicted[0, -1] == -1
+    # 速度に沿って右へ進む
+    assert predicted[0, 0] > last[0, 0]
+
+
+def test_detection_index_points_at_the_input_row():
+    tracker = IoUTracker(min_hits=1)
+    b = boxes([500, 500, 560, 620, 0.9, 0], [10, 10, 70, 130, 0.8, 2])
+    tracks = tracker.update(b)
+    for track in tracks:
+        assert track[6] == b[int(track[7]), 5]
+
+
+def test_overflow_is_counted_when_slots_run_out():
+    tracker = IoUTracker(max_tracks=2)
+    tracker.update(
+        boxes(
+            [0, 0, 10, 10, 0.9, 0],
+            [100, 100, 110, 110, 0.9, 0],
+            [200, 200, 210, 210, 0.9, 0],
+        )
+    )
+    assert len(tracker) == 2
+    assert tracker.overflow == 1
+
+
+def test_reset_restarts_the_ids():
+    tracker = IoUTracker(min_hits=1)
+    tracker.update(boxes([0, 0, 10, 10, 0.9, 0]))
+    tracker.reset()
+    tracks = tracker.update(boxes([500, 500, 510, 510, 0.9, 0]))
+    assert tracks[:, 4].tolist() == [1]
+
+
+def test_ultralytics_trackers_number_their_ids_per_stream():
+    a = load_tracker("bytetrack.yaml")
+    b = load_tracker("bytetrack.yaml")
+    for det in moving(5):
+        ids_a = a.update(det, FRAME)[:, 4].tolist()
+        ids_b = b.update(det, FRAME)[:, 4].tolist()
+    assert ids_a == ids_b == [1]
+
+
+def test_untracked_detections_give_an_empty_result():
+    det = torch.tensor([[10, 10, 50, 80, 0.9, 0]])
+    result = Results(FRAME, path="", names={0: "person"}, boxes=det)
+    tracker = IoUTracker(min_hits=3)
+    tracker.frame = 10
+    tracked = update_tracker(tracker, result, FRAME)
+    assert len(tracked.boxes) == 0
+    assert tracked.boxes.is_track
+    assert len(detections.from_result(tracked)) == 0